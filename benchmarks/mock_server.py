@@ -0,0 +1,190 @@
+"""
+A small stand-in OSRM server, used by the test suite and the benchmarks so they can run
+without a real one.
+"""
+from contextlib import contextmanager
+from typing import Iterator
+import asyncio
+import socket
+import threading
+import numpy as np
+from aiohttp import web
+from pyrouting.osrm import osrm_polyline
+
+# Extra seconds each request waits, and bytes of padding added to each response body
+LATENCY = web.AppKey('latency', float)
+PADDING = web.AppKey('padding', int)
+
+
+def _parse(request: web.Request) -> np.ndarray:
+    """
+    Parse the coordinates of an OSRM request path into a (N, 2) array of (lat, lon).
+    """
+    lonlats = [c.split(',') for c in request.match_info['coords'].split(';')]
+    return np.array(lonlats, dtype=float)[:, ::-1]
+
+
+def _distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    A cheap planar stand-in for network distance in meters.
+    """
+    return np.abs(a - b).sum(axis=-1) * 100000
+
+
+def _geometry(coords: np.ndarray, geometries: str):
+    if geometries == 'geojson':
+        return {'type': 'LineString', 'coordinates': coords[:, ::-1].tolist()}
+    return osrm_polyline.encode(coords, 6 if geometries == 'polyline6' else 5)
+
+
+def _with_geometry(request: web.Request, route: dict, coords: np.ndarray) -> dict:
+    # osrm-routed leaves the geometry out when overview=false
+    if request.query.get('overview') != 'false':
+        route['geometry'] = _geometry(coords, request.query.get('geometries', 'polyline'))
+    return route
+
+
+async def _respond(request: web.Request, body: dict) -> web.Response:
+    """
+    Send a JSON body after the configured latency, padded to the configured size and
+    compressed if the client accepts it, as osrm-routed does.
+    """
+    if request.app[LATENCY] > 0:
+        await asyncio.sleep(request.app[LATENCY])
+    if request.app[PADDING] > 0:
+        body['padding'] = 'x' * request.app[PADDING]
+    response = web.json_response(body)
+    response.enable_compression()
+    return response
+
+
+async def _table(request: web.Request) -> web.Response:
+    coords = _parse(request)
+    query = request.query
+    src = [int(i) for i in query['sources'].split(';')] if 'sources' in query \
+        else list(range(len(coords)))
+    dst = [int(i) for i in query['destinations'].split(';')] if 'destinations' in query \
+        else list(range(len(coords)))
+    distances = _distance(coords[src][:, None, :], coords[dst][None, :, :])
+    body = {'code': 'Ok'}
+    for annotation in query.get('annotations', 'duration').split(','):
+        table = distances if annotation == 'distance' else distances / 10
+        body[f'{annotation}s'] = table.round(1).tolist()
+    return await _respond(request, body)
+
+
+async def _route(request: web.Request) -> web.Response:
+    coords = _parse(request)
+    distance = float(_distance(coords[1:], coords[:-1]).sum())
+    return await _respond(request, {
+        'code': 'Ok',
+        'routes': [_with_geometry(request, {
+            'distance': distance,
+            'duration': distance / 10,
+            'weight': distance / 10,
+            'legs': []
+        }, coords)],
+        'waypoints': [{'location': c[::-1].tolist(), 'name': ''} for c in coords]
+    })
+
+
+async def _match(request: web.Request) -> web.Response:
+    coords = _parse(request)
+    leg_distances = _distance(coords[1:], coords[:-1]).tolist()
+    distance = float(sum(leg_distances))
+    return await _respond(request, {
+        'code': 'Ok',
+        'matchings': [_with_geometry(request, {
+            'confidence': 0.9,
+            'distance': distance,
+            'duration': distance / 10,
+            'weight': distance / 10,
+            'weight_name': 'routability',
+            'legs': [
+                {'distance': d, 'duration': d / 10, 'weight': d / 10, 'summary': '', 'steps': []}
+                for d in leg_distances
+            ]
+        }, coords)],
+        'tracepoints': [
+            {
+                'location': c[::-1].tolist(),
+                'matchings_index': 0,
+                'waypoint_index': i,
+                'alternatives_count': 0,
+                'name': ''
+            }
+            for i, c in enumerate(coords)
+        ]
+    })
+
+
+_FLAKY: dict[str, int] = {}
+
+
+async def _flaky(request: web.Request) -> web.Response:
+    # Fails with 503 the first `fails` times each key is requested
+    key = request.match_info['key']
+    _FLAKY[key] = _FLAKY.get(key, 0) + 1
+    if _FLAKY[key] <= int(request.query.get('fails', 0)):
+        return web.Response(status=503, text='busy')
+    return web.json_response({'code': 'Ok', 'key': key})
+
+
+async def _headers(request: web.Request) -> web.Response:
+    return web.json_response({'code': 'Ok', 'headers': dict(request.headers)})
+
+
+async def _root(request: web.Request) -> web.Response:
+    return web.Response(text='')
+
+
+def make_app(latency: float = 0.0, padding: int = 0) -> web.Application:
+    """
+    Build the stand-in OSRM application.
+
+    Args:
+        latency (float, optional): Seconds added to each route, table, and match request.
+        padding (int, optional): Bytes of padding added to each route, table, and match
+            response.
+    """
+    app = web.Application()
+    app[LATENCY] = latency
+    app[PADDING] = padding
+    app.router.add_get('/table/v1/{mode}/{coords}', _table)
+    app.router.add_get('/route/v1/{mode}/{coords}', _route)
+    app.router.add_get('/match/v1/{mode}/{coords}', _match)
+    app.router.add_get('/flaky/{key}', _flaky)
+    app.router.add_get('/headers', _headers)
+    app.router.add_route('*', '/', _root)
+    return app
+
+
+@contextmanager
+def serve(app: web.Application) -> Iterator[tuple[str, int]]:
+    """
+    Run an application on a background thread and yield its (host, port).
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    started = threading.Event()
+
+    def _serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=_serve, daemon=True)
+    thread.start()
+    started.wait()
+
+    try:
+        yield 'http://127.0.0.1', port
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,316 @@
+"""
+Benchmarks for pyrouting against the stand-in OSRM server in benchmarks.mock_server.
+
+Run from the repository root:
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --latency 0.005 --padding 2000 --out slow.json
+    python -m benchmarks.run --compare results.json
+
+Each case reports its throughput, p50/p99 latency per operation, and peak traced memory.
+The match_df cases report the latency of each request instead, as recorded by Metrics.
+The results are written as JSON along with the package version and settings, so runs
+from different versions can be compared with --compare.
+"""
+from importlib.metadata import PackageNotFoundError, version
+from typing import Callable
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import OSRMQueries
+from pyrouting.osrm import osrm_matching
+from pyrouting.osrm import osrm_polyline
+from pyrouting.osrm import osrm_unpack
+from pyrouting.utils import ConcurrentRequests, Metrics
+from benchmarks.mock_server import make_app, serve
+
+# Keys compared between runs, and whether a larger value is worse
+METRICS = {'throughput': False, 'p50_ms': True, 'p99_ms': True, 'peak_mb': True}
+
+
+def _trace(n_points: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    This is a helper function to make a random walk of (lat, lon) points.
+    """
+    steps = rng.normal(0, 0.0002, (n_points, 2))
+    return np.array([47.65, -122.33]) + np.cumsum(steps, axis=0)
+
+
+def _traces(n_groups: int, n_points: int, seed: int = 0) -> pd.DataFrame:
+    """
+    This is a helper function to make a DataFrame of GPS traces for match_df.
+    """
+    rng = np.random.default_rng(seed)
+    coords = np.concatenate([_trace(n_points, rng) for _ in range(n_groups)])
+    return pd.DataFrame({
+        'trip_id': np.repeat(np.arange(n_groups), n_points),
+        'lat': coords[:, 0],
+        'lon': coords[:, 1],
+        'timestamp': np.tile(1700000000 + 5 * np.arange(n_points), n_groups)
+    })
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    repeat: int,
+    items: int = 1,
+    latencies: list[float] | None = None,
+    **params
+) -> dict:
+    """
+    Time a function and record its peak memory.
+
+    Memory is traced in a separate call, since tracing slows everything down.
+
+    Args:
+        name (str): The name of the case.
+        func (Callable): The operation to time, called with no arguments.
+        repeat (int): The number of timed calls, after one warm-up call.
+        items (int, optional): The number of items each call handles, e.g. requests or
+            points, for the throughput. Default is 1.
+        latencies (list, optional): A list that func appends per-request latencies in
+            seconds to. If given, p50 and p99 are taken from it rather than from the calls.
+        **params: Parameters of the case recorded with the results.
+
+    Returns:
+        dict: The results of the case.
+    """
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if latencies is not None:
+        latencies.clear()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    timings = np.array(timings)
+    samples = timings if latencies is None else np.array(latencies)
+    return {
+        'name': name,
+        'params': params,
+        'repeat': repeat,
+        'items': items,
+        'throughput': items * repeat / timings.sum(),
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p99_ms': float(np.percentile(samples, 99) * 1000),
+        'peak_mb': peak / 2**20
+    }
+
+
+def bench_queries(router: OSRMQueries, repeat: int) -> list[dict]:
+    """
+    Benchmark single route, table, and match requests.
+    """
+    rng = np.random.default_rng(1)
+    trace = _trace(50, rng)
+    points = trace[::5]
+
+    return [
+        measure('route', lambda: router.route(points[:2]), repeat),
+        measure('table', lambda: router.table(points), repeat, n_coords=len(points)),
+        measure('match', lambda: router.match(trace), repeat, n_points=len(trace))
+    ]
+
+
+def bench_match_df(router: OSRMQueries, groups: list[int], lengths: list[int]) -> list[dict]:
+    """
+    Benchmark match_df across group counts and trace lengths.
+
+    The p50 and p99 are of the individual requests, not of whole batches.
+    """
+    latencies: list[float] = []
+
+    def _record(event):
+        if event['latency'] is not None:
+            latencies.append(event['latency'])
+
+    metrics = Metrics(callbacks=[_record])
+
+    results = []
+    for n_groups in groups:
+        for n_points in lengths:
+            df = _traces(n_groups, n_points)
+
+            def _run():
+                concurrency = ConcurrentRequests(progress=False, metrics=metrics)
+                router.match_df(df, group_col='trip_id', concurrency=concurrency)
+
+            results.append(measure(
+                'match_df', _run, repeat=3, items=len(df), latencies=latencies,
+                n_groups=n_groups, n_points=n_points
+            ))
+    return results
+
+
+def bench_urls(host: str, port: int, n_groups: int, n_points: int) -> dict:
+    """
+    Benchmark building the windowed match URLs of a DataFrame.
+    """
+    df = _traces(n_groups, n_points)
+
+    def _run():
+        windows: list[tuple] = []
+        for _ in osrm_matching.build_window_urls(df, 'trip_id', windows, host=host, port=port):
+            pass
+
+    return measure('build_urls', _run, repeat=5, items=len(df), n_groups=n_groups,
+                   n_points=n_points)
+
+
+def bench_unpack(n_responses: int, n_points: int) -> list[dict]:
+    """
+    Benchmark unpacking match responses into columns and decoding their geometries.
+    """
+    rng = np.random.default_rng(2)
+    responses = []
+    for _ in range(n_responses):
+        geometry = osrm_polyline.encode(_trace(n_points, rng))
+        responses.append({
+            'code': 'Ok',
+            'matchings': [{'confidence': 0.9, 'distance': 1.0, 'duration': 1.0, 'weight': 1.0,
+                           'geometry': geometry}]
+        })
+    unpack = ['confidence', 'distance', 'duration', 'geometry']
+    geometries = [r['matchings'][0]['geometry'] for r in responses]
+
+    return [
+        measure('unpack_matches', lambda: osrm_unpack.unpack_matches(responses, unpack),
+                repeat=5, items=n_responses, n_responses=n_responses),
+        measure('decode_many', lambda: osrm_polyline.decode_many(geometries),
+                repeat=5, items=n_responses * n_points, n_responses=n_responses,
+                n_points=n_points)
+    ]
+
+
+def run(
+    latency: float = 0.0,
+    padding: int = 0,
+    repeat: int = 50,
+    groups: list[int] | None = None,
+    lengths: list[int] | None = None
+) -> dict:
+    """
+    Run all benchmarks against a fresh stand-in server.
+
+    Args:
+        latency (float, optional): Seconds the server waits before each response.
+        padding (int, optional): Bytes of padding the server adds to each response.
+        repeat (int, optional): The number of calls timed for each single request case.
+        groups (list, optional): The group counts for match_df. Default is [10, 100].
+        lengths (list, optional): The trace lengths for match_df. Default is [50, 500].
+
+    Returns:
+        dict: The run settings and the results of each case.
+    """
+    groups = groups or [10, 100]
+    lengths = lengths or [50, 500]
+
+    with serve(make_app(latency, padding)) as (host, port):
+        router = OSRMQueries(host=host, port=port)
+        results = bench_queries(router, repeat)
+        results += bench_match_df(router, groups, lengths)
+        results.append(bench_urls(host, port, max(groups), max(lengths)))
+    results += bench_unpack(max(groups) * 10, max(lengths))
+
+    try:
+        pyrouting_version = version('pyrouting')
+    except PackageNotFoundError:
+        pyrouting_version = None
+
+    return {
+        'meta': {
+            'pyrouting': pyrouting_version,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'latency': latency,
+            'padding': padding,
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+
+def _key(result: dict) -> str:
+    params = ','.join(f'{k}={v}' for k, v in sorted(result['params'].items()))
+    return f"{result['name']}[{params}]"
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2) -> list[str]:
+    """
+    Compare two runs and list the metrics that got worse by more than the threshold.
+
+    Args:
+        baseline (dict): The results of the earlier run.
+        current (dict): The results of the new run.
+        threshold (float, optional): The allowed relative change. Default is 0.2.
+
+    Returns:
+        list: A description of each regression.
+    """
+    before = {_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        for metric, larger_is_worse in METRICS.items():
+            if old[metric] == 0:
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if (change if larger_is_worse else -change) > threshold:
+                regressions.append(
+                    f'{_key(result)} {metric}: {old[metric]:.3g} -> {result[metric]:.3g}'
+                )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the server waits before each response')
+    parser.add_argument('--padding', type=int, default=0,
+                        help='bytes of padding the server adds to each response')
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='timed calls for each single request case')
+    parser.add_argument('--groups', type=int, nargs='+', help='group counts for match_df')
+    parser.add_argument('--lengths', type=int, nargs='+', help='trace lengths for match_df')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='a JSON file of earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change reported as a regression')
+    args = parser.parse_args(argv)
+
+    current = run(args.latency, args.padding, args.repeat, args.groups, args.lengths)
+
+    for r in current['results']:
+        print(f"{_key(r):45s} {r['throughput']:12.1f}/s  p50 {r['p50_ms']:8.2f} ms  "
+              f"p99 {r['p99_ms']:8.2f} ms  peak {r['peak_mb']:7.2f} MB")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            json.dump(current, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(json.load(file), current, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,9 @@
 Header for the OSRM module.
 """
 from .osrm_queries import OSRMQueries
+from .osrm_async import AsyncOSRMQueries
 
 __all__ = [
-    'OSRMQueries'
+    'OSRMQueries',
+    'AsyncOSRMQueries'
     ]
@@ -0,0 +1,252 @@
+"""
+This module provides an asyncio interface to the Open Source Routing Machine (OSRM) API.
+"""
+from functools import wraps
+import asyncio
+import time
+import aiohttp
+import pandas as pd
+from pyrouting.osrm import osrm_urls
+from pyrouting.osrm import osrm_matching
+from pyrouting.osrm import osrm_unpack
+from pyrouting.osrm.osrm_queries import OSRMQueries
+from pyrouting.utils import BackendPool, ConcurrentRequests, Metrics, ResponseCache
+from pyrouting.utils.concurrency import COMPRESSED
+from pyrouting.utils.fastjson import loads
+
+
+class AsyncOSRMQueries:
+    """
+    This class provides awaitable methods for the OSRM API services.
+
+    All requests share one long-lived aiohttp session with keep-alive connections, so it
+    suits online routing from async web handlers. Use it as an async context manager, or
+    call close() when done.
+
+    It only has awaitable methods. The blocking bulk methods of OSRMQueries, such as
+    table_matrix, cannot run inside an event loop, so use an OSRMQueries object for those.
+    """
+    session: aiohttp.ClientSession | None
+
+    def __init__(
+        self,
+        host: str = 'localhost',
+        port: int = 5000,
+        cache: ResponseCache | None = None,
+        backends: list[str | tuple[str, int]] | BackendPool | None = None,
+        timeout: float = 5,
+        limit_per_host: int = 100,
+        keepalive_timeout: float = 60,
+        metrics: Metrics | None = None,
+        schedule: str | None = None
+    ):
+        """
+        Initialize the AsyncOSRMQueries object.
+
+        Args:
+            host (str, optional): The host URL. Defaults to 'localhost:5000'.
+            cache (ResponseCache, optional): A response cache shared by all requests.
+            backends (list | BackendPool, optional): Several osrm-routed replicas to balance
+                requests across. If given, host and port are ignored.
+            timeout (float, optional): The per-request timeout in seconds. Defaults to 5.
+            limit_per_host (int, optional): The limit of pooled connections per host.
+                Defaults to 100.
+            keepalive_timeout (float, optional): Seconds to keep idle connections open.
+                Defaults to 60.
+            metrics (Metrics, optional): A registry that records every request, including
+                the time spent waiting for a pooled connection.
+            schedule (str, optional): 'lpt' sends the largest requests of match_df first,
+                see ConcurrentRequests. Defaults to None.
+        """
+        # Share the host and replica handling of OSRMQueries, but none of its methods
+        queries = OSRMQueries(host, port, cache, backends, metrics, schedule)
+        self.host = queries.host
+        self.port = queries.port
+        self.cache = queries.cache
+        self.backends = queries.backends
+        self.metrics = queries.metrics
+        self.schedule = queries.schedule
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+
+    async def open(self) -> aiohttp.ClientSession:
+        """
+        Open the shared session if it is not open yet. This must run inside the event loop
+        the object will be used from.
+
+        Returns:
+            aiohttp.ClientSession: The shared session.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=COMPRESSED,
+                trace_configs=[self.metrics.trace_config()] if self.metrics is not None else None
+            )
+        return self.session
+
+    async def close(self) -> None:
+        """
+        Close the shared session and its connections.
+        """
+        if self.session is not None:
+            await self.session.close()
+
+    async def __aenter__(self) -> 'AsyncOSRMQueries':
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def _concurrency(self) -> ConcurrentRequests:
+        """
+        Create a ConcurrentRequests object that sends through the shared session.
+        """
+        return ConcurrentRequests(
+            cache=self.cache, backends=self.backends, session=self.session, progress=False,
+            metrics=self.metrics, schedule=self.schedule
+        )
+
+    async def _aget(self, url: str) -> dict:
+        """
+        Make a single GET request through the shared session, going through the cache
+        and failing over between replicas if there are any.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            dict: A JSON dictionary containing the full request response.
+        """
+        if self.cache is not None:
+            hit = self.cache.get(url)
+            if hit is not None:
+                if self.metrics is not None:
+                    self.metrics.record_request(url, 'cache')
+                return hit
+
+        session = await self.open()
+
+        start = time.perf_counter()
+        try:
+            if self.backends is None:
+                async with session.get(url, ssl=False) as response:
+                    status = response.status
+                    raw = await response.read()
+            else:
+                await asyncio.to_thread(self.backends.maybe_check_health)
+                status, raw = await self._aget_balanced(session, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            if self.metrics is not None:
+                self.metrics.record_request(url, type(err).__name__, failed=True)
+            raise
+
+        latency = time.perf_counter() - start
+        obj = loads(raw)
+        parse_time = time.perf_counter() - start - latency
+
+        if self.metrics is not None:
+            self.metrics.record_request(url, status, latency, len(raw), parse_time)
+
+        if self.cache is not None and obj.get('code') == 'Ok':
+            self.cache.set(url, raw)
+
+        return obj
+
+    async def _aget_balanced(
+        self,
+        session: aiohttp.ClientSession,
+        url: str
+    ) -> tuple[int, bytes]:
+        """
+        This is a helper function to send a request to the replicas until one answers.
+        """
+        error: Exception | None = None
+        for _ in self.backends.endpoints:
+            base = self.backends.acquire()
+            start = time.perf_counter()
+            try:
+                async with session.get(self.backends.rewrite(url, base), ssl=False) as response:
+                    status = response.status
+                    raw = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                self.backends.release(base, ok=False)
+                error = err
+                continue
+            self.backends.release(base, time.perf_counter() - start)
+            return status, raw
+
+        raise error
+
+    @wraps(osrm_urls.route_url)
+    async def route(self, *args, **kwargs) -> dict:
+        """
+        This function wraps the osrm_urls.route_url function and awaits the HTTP request.
+
+        Returns:
+            dict: A JSON dictionary containing the full request response.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        return await self._aget(osrm_urls.route_url(*args, **kwargs))
+
+    @wraps(osrm_urls.match_url)
+    async def match(self, *args, **kwargs) -> dict:
+        """
+        This function wraps the osrm_urls.match_url function and awaits the HTTP request.
+
+        Returns:
+            dict: A JSON dictionary containing the full request response.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        return await self._aget(osrm_urls.match_url(*args, **kwargs))
+
+    @wraps(osrm_urls.table_url)
+    async def table(self, *args, **kwargs) -> dict:
+        """
+        This function wraps the osrm_urls.table_url function and awaits the HTTP request.
+
+        Returns:
+            dict: A JSON dictionary containing the full request response.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        return await self._aget(osrm_urls.table_url(*args, **kwargs))
+
+    @wraps(osrm_matching.match_df)
+    async def match_df(self, *args, **kwargs) -> dict | pd.DataFrame:
+        """
+        This function wraps the osrm_matching.async_match_df function, sending the requests
+        concurrently through the shared session.
+
+        Returns:
+            dict | pd.DataFrame: The match responses keyed by group, or the input DataFrame
+                with the unpacked columns if unpack is given.
+        """
+        unpack = kwargs.pop('unpack', None)
+        decode_geometry = kwargs.pop('decode_geometry', False)
+
+        # Only ask the server for what is unpacked
+        if isinstance(unpack, list) and len(unpack) > 0:
+            for key, value in osrm_unpack.request_options(unpack).items():
+                kwargs.setdefault(key, value)
+
+        await self.open()
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs.setdefault('concurrency', self._concurrency())
+        response = await osrm_matching.async_match_df(*args, **kwargs)
+
+        if isinstance(unpack, list) and len(unpack) > 0:
+            df = args[0] if isinstance(args[0], pd.DataFrame) else kwargs.get('df')
+            return osrm_unpack.unpack_match_df(
+                df, response, unpack, kwargs.get('geometries', 'polyline'), decode_geometry
+            )
+
+        return response
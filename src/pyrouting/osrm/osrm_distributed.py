@@ -0,0 +1,328 @@
+"""
+This module contains functions that split match_df and table_matrix jobs into partitions
+and run them on a pool of worker processes, or on a Dask cluster.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+import os
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import osrm_matching
+from pyrouting.osrm import osrm_table
+from pyrouting.osrm import osrm_unpack
+from pyrouting.utils import BackendPool, Checkpoint, ConcurrentRequests, ResponseCache
+from pyrouting.utils.scheduling import lpt_order
+
+
+class _DaskExecutor(Executor):
+    """
+    This is a helper class for an executor on a Dask client, which closes the client when
+    it is shut down.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self._executor = client.get_executor()
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait)
+        self.client.close()
+
+
+def make_executor(
+    backend: str = 'process',
+    workers: int | None = None,
+    address: str | None = None
+) -> Executor:
+    """
+    Create an executor to run the partitions on.
+
+    Shut the executor down when done, or use it as a context manager. For Dask this also
+    closes the client, and the local cluster if one was started.
+
+    Args:
+        backend (str, optional): 'process' for a local process pool, or 'dask' for a Dask
+            cluster, which needs dask.distributed installed. Default is 'process'.
+        workers (int, optional): The number of local worker processes. Defaults to one per
+            core. Ignored for Dask.
+        address (str, optional): The Dask scheduler address. Defaults to a new local cluster.
+
+    Returns:
+        Executor: An executor with the concurrent.futures interface.
+    """
+    assert backend in ['process', 'dask'], 'backend must be "process" or "dask"'
+
+    if backend == 'process':
+        return ProcessPoolExecutor(workers)
+
+    from dask.distributed import Client
+
+    return _DaskExecutor(Client(address))
+
+
+def _concurrency(options: dict | None) -> ConcurrentRequests:
+    """
+    This is a helper function to create a worker's own ConcurrentRequests, with its own
+    connection pool, from picklable options.
+    """
+    options = {'progress': False, **(options or {})}
+    if isinstance(options.get('backends'), list):
+        options['backends'] = BackendPool(options['backends'])
+    if isinstance(options.get('cache'), dict):
+        options['cache'] = ResponseCache(**options['cache'])
+    return ConcurrentRequests(**options)
+
+
+def _workers(executor: Executor | None, n_workers: int | None) -> int:
+    """
+    This is a helper function to get the number of workers to size the partitions by.
+    """
+    if n_workers:
+        return n_workers
+    if isinstance(executor, _DaskExecutor):
+        return len(executor.client.nthreads()) or 1
+    return os.cpu_count() or 1
+
+
+def _match_partition(
+    df: pd.DataFrame,
+    renames: dict[str, str] | None,
+    group_col: str,
+    unpack: list[str] | None,
+    options: dict | None,
+    checkpoint: str | None,
+    kwargs: dict
+) -> tuple[list, dict]:
+    """
+    This is a helper function run on a worker to match one partition of groups, with its
+    own connection to the checkpoint at the given path.
+
+    Returns:
+        tuple: The group keys, and either the responses or the unpacked columns.
+    """
+    kwargs = {**kwargs, 'concurrency': _concurrency(options)}
+    if checkpoint is not None:
+        kwargs['checkpoint'] = Checkpoint(checkpoint)
+    try:
+        matches = osrm_matching.match_df(df, renames, group_col, **kwargs)
+    finally:
+        if checkpoint is not None:
+            kwargs['checkpoint'].close()
+    keys = list(matches.keys())
+
+    if unpack is not None:
+        return keys, osrm_unpack.unpack_matches(matches.values(), unpack, len(matches))
+
+    return keys, matches
+
+
+def partition_groups(df: pd.DataFrame, group_col: str, partitions: int) -> list[pd.DataFrame]:
+    """
+    Split a dataframe into partitions of whole groups with roughly equal numbers of rows.
+
+    Args:
+        df (pd.DataFrame): A dataframe of trip data.
+        group_col (str): The column name to group the dataframe by.
+        partitions (int): The number of partitions.
+
+    Returns:
+        list: The non-empty partitions, in group order.
+    """
+    if len(df) == 0:
+        return []
+
+    df = df.sort_values(group_col, kind='stable')
+    keys = df[group_col].to_numpy()
+    _, starts = np.unique(keys, return_index=True)
+
+    # Cut at the group starts closest to equal shares of the rows
+    targets = np.linspace(0, len(df), partitions + 1)[1:-1]
+    cuts = np.unique(starts[np.clip(np.searchsorted(starts, targets), 0, len(starts) - 1)])
+    bounds = [0, *[c for c in cuts.tolist() if c > 0], len(df)]
+
+    return [df.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def match_df_distributed(
+    df: pd.DataFrame,
+    renames: dict[str, str] | None = None,
+    group_col: str | None = None,
+    executor: Executor | None = None,
+    n_workers: int | None = None,
+    partitions: int | None = None,
+    unpack: list[str] | None = None,
+    concurrency_options: dict | None = None,
+    **kwargs
+) -> dict | pd.DataFrame:
+    """
+    Map match trip locations with the groups spread across worker processes or nodes.
+
+    The trips are split by group_col into partitions, and each partition is matched by
+    match_df on a worker with its own connection pool. Several workers can keep a fleet of
+    OSRM replicas busy where one event loop cannot.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        df (pd.DataFrame): A dataframe of trip data. Must contain columns:
+            lat, lon, with optional timestamp, waypoint, and radius.
+        renames (dict, optional): A dictionary of column renames for lat, lon, and timestamp.
+        group_col (str): The column name to group the dataframe by.
+        executor (Executor, optional): The executor to run the partitions on, e.g. from
+            make_executor. Defaults to a local process pool.
+        n_workers (int, optional): The number of workers, used for the default pool and
+            partition count. Defaults to the Dask cluster's workers, or one per core.
+        partitions (int, optional): The number of partitions. Defaults to four per worker.
+        unpack (list, optional): Unpack these matching attributes on the workers and only
+            send the columns back.
+        concurrency_options (dict, optional): Keyword arguments for each worker's
+            ConcurrentRequests. Give backends as a list of 'host:port' strings and cache
+            as a dictionary of ResponseCache arguments, with a path the workers can reach.
+        **kwargs: Other keyword arguments for match_df. A checkpoint is reopened from its
+            path on each worker, so it must be a file the workers can reach.
+
+    Returns:
+        dict | pd.DataFrame: The match responses keyed by group, or a dataframe of the
+            unpacked attributes indexed by group if unpack is given.
+    """
+    assert group_col is not None, 'group_col is required to partition the groups'
+    assert 'host' in kwargs, 'Missing host in kwargs specified in match_df_distributed'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in match_df_distributed'
+
+    # Partition on the input name of the group column, renaming happens on the workers
+    input_group_col = {v: k for k, v in (renames or {}).items()}.get(group_col, group_col)
+
+    if unpack is not None:
+        for key, value in osrm_unpack.request_options(unpack).items():
+            kwargs.setdefault(key, value)
+
+    # A SQLite connection cannot be pickled, so the workers get the path instead
+    checkpoint = kwargs.pop('checkpoint', None)
+    if checkpoint is not None:
+        assert checkpoint.path != ':memory:', 'checkpoint must be a file the workers can reach'
+        checkpoint = checkpoint.path
+
+    n_workers = _workers(executor, n_workers)
+    pool = executor or ProcessPoolExecutor(n_workers)
+    try:
+        parts = partition_groups(df, input_group_col, partitions or 4 * n_workers)
+
+        # Start the largest partitions first so the last ones finish together
+        futures = {
+            i: pool.submit(
+                _match_partition, parts[i], renames, group_col, unpack, concurrency_options,
+                checkpoint, kwargs
+            )
+            for i in lpt_order([len(part) for part in parts]).tolist()
+        }
+        results = [futures[i].result() for i in range(len(parts))]
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+
+    if unpack is None:
+        return {key: value for _, matches in results for key, value in matches.items()}
+
+    # Partitions are in group order, so the columns can simply be concatenated
+    columns = {
+        name: np.concatenate([cols[name] for _, cols in results]) if results else []
+        for name in unpack
+    }
+    return pd.DataFrame(columns, index=[key for keys, _ in results for key in keys])
+
+
+def _table_partition(
+    sources: np.ndarray,
+    destinations: np.ndarray,
+    tile: int | tuple[int, int],
+    options: dict | None,
+    kwargs: dict
+) -> dict[str, np.ndarray]:
+    """
+    This is a helper function run on a worker to fill a block of table rows.
+    """
+    kwargs = {**kwargs, 'concurrency': _concurrency(options)}
+    return osrm_table.table_matrix(sources, destinations, tile, **kwargs)
+
+
+def table_matrix_distributed(
+    sources: list[tuple] | np.ndarray,
+    destinations: list[tuple] | np.ndarray | None = None,
+    tile: int | tuple[int, int] = 100,
+    executor: Executor | None = None,
+    n_workers: int | None = None,
+    partitions: int | None = None,
+    memmap_dir: str | None = None,
+    concurrency_options: dict | None = None,
+    **kwargs
+) -> dict[str, np.ndarray]:
+    """
+    Assemble a large origin-destination matrix with blocks of rows spread across worker
+    processes or nodes.
+
+    The source rows are split into blocks of whole tiles, and each block is filled by
+    table_matrix on a worker with its own connection pool. The blocks are written into
+    the output as they come back.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        sources (list): A list of source coordinates in the same form as table_url coordinates.
+        destinations (list, optional): A list of destination coordinates. Defaults to sources.
+        tile (int | tuple, optional): The tile size as a single int or
+            (source rows, destination cols). Default is 100.
+        executor (Executor, optional): The executor to run the blocks on, e.g. from
+            make_executor. Defaults to a local process pool.
+        n_workers (int, optional): The number of workers, used for the default pool and
+            block count. Defaults to the Dask cluster's workers, or one per core.
+        partitions (int, optional): The number of row blocks. Defaults to four per worker.
+        memmap_dir (str, optional): If given, the output arrays are memory-mapped .npy files
+            named after the annotation in this directory.
+        concurrency_options (dict, optional): Keyword arguments for each worker's
+            ConcurrentRequests. Give backends as a list of 'host:port' strings and cache
+            as a dictionary of ResponseCache arguments, with a path the workers can reach.
+        **kwargs: Other keyword arguments for table_matrix, except pair_cache, which only
+            takes one writer.
+
+    Returns:
+        dict: A dictionary of (N, M) float32 arrays keyed by 'durations' and/or 'distances'.
+    """
+    assert 'host' in kwargs, 'Missing host in kwargs specified in table_matrix_distributed'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in table_matrix_distributed'
+    assert kwargs.get('pair_cache') is None, \
+        'pair_cache takes one writer, so it cannot be shared by table_matrix_distributed workers'
+    kwargs.setdefault('annotations', 'duration')
+
+    sources = np.asarray(sources, dtype=float)
+    destinations = sources if destinations is None else np.asarray(destinations, dtype=float)
+
+    shape = (len(sources), len(destinations))
+    keys = [f'{a}s' for a in kwargs['annotations'].split(',')]
+    out = {key: osrm_table._allocate(shape, key, memmap_dir) for key in keys}
+
+    n_workers = _workers(executor, n_workers)
+    pool = executor or ProcessPoolExecutor(n_workers)
+    try:
+        # Blocks hold whole tiles, so no tile is split between workers
+        rows = tile if isinstance(tile, int) else tile[0]
+        n_tiles = -(-len(sources) // rows)
+        per_block = max(1, -(-n_tiles // (partitions or 4 * n_workers)))
+        blocks = osrm_table._tile_slices(len(sources), per_block * rows)
+
+        futures = {
+            pool.submit(
+                _table_partition, sources[block], destinations, tile, concurrency_options,
+                kwargs
+            ): block
+            for block in blocks
+        }
+        for future in as_completed(futures):
+            for key, arr in future.result().items():
+                out[key][futures[future]] = arr
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+
+    return out
@@ -0,0 +1,124 @@
+"""
+This module contains functions for building GeoDataFrames of matched routes and
+tracepoints from flat coordinate arrays.
+"""
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pyrouting.osrm import osrm_unpack
+
+
+def linestrings(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Build LineStrings for all rows at once from flat coordinates and offsets.
+
+    Rows with fewer than two points cannot be LineStrings and are left as None.
+
+    Args:
+        coords (np.ndarray): A (N, 2) array of (lat, lon) coordinates.
+        offsets (np.ndarray): The offsets of each row's coordinates, with one more entry
+            than rows, as from osrm_polyline.decode_many.
+
+    Returns:
+        np.ndarray: An object array of shapely LineStrings or None, one per row.
+    """
+    lengths = np.diff(offsets)
+    valid = lengths >= 2
+    out = np.full(len(lengths), None, dtype=object)
+
+    # Keep the coordinates of the valid rows and number them by row
+    keep = np.repeat(valid, lengths)
+    rows = np.repeat(np.arange(len(lengths)), lengths)[keep]
+    if len(rows) > 0:
+        _, indices = np.unique(rows, return_inverse=True)
+        out[valid] = shapely.linestrings(coords[keep][:, ::-1], indices=indices)
+
+    return out
+
+
+def routes_gdf(
+    responses: dict,
+    unpack: list[str] | None = None,
+    geometries: str = 'polyline',
+    crs: str = 'EPSG:4326'
+) -> gpd.GeoDataFrame:
+    """
+    Build a GeoDataFrame of the matched routes, one row per group.
+
+    Args:
+        responses (dict): The match responses keyed by group, as returned by match_df.
+        unpack (list, optional): The matching attributes to add as columns. Defaults to
+            confidence, distance, and duration.
+        geometries (str, optional): The geometry format the server was asked for.
+            Default is polyline.
+        crs (str, optional): The coordinate reference system. Default is 'EPSG:4326'.
+
+    Returns:
+        gpd.GeoDataFrame: The routes indexed by group, with LineString geometry.
+    """
+    if unpack is None:
+        unpack = ['confidence', 'distance', 'duration']
+
+    columns = osrm_unpack.unpack_matches(
+        responses.values(), [*unpack, 'geometry'], len(responses)
+    )
+    coords, offsets = osrm_unpack.unpack_geometry(columns.pop('geometry'), geometries)
+    geometry = gpd.GeoSeries(linestrings(coords, offsets), crs=crs)
+
+    return gpd.GeoDataFrame(
+        {key: columns[key] for key in unpack if key != 'geometry'},
+        geometry=geometry.values,
+        index=pd.Index(list(responses.keys())),
+        crs=crs
+    )
+
+
+def tracepoints_gdf(responses: dict, crs: str = 'EPSG:4326') -> gpd.GeoDataFrame:
+    """
+    Build a GeoDataFrame of the snapped tracepoints, one row per input point.
+
+    Points that could not be matched have no geometry and -1 indices.
+
+    Args:
+        responses (dict): The match responses keyed by group, as returned by match_df.
+        crs (str, optional): The coordinate reference system. Default is 'EPSG:4326'.
+
+    Returns:
+        gpd.GeoDataFrame: The tracepoints with group, point, matchings_index,
+            waypoint_index, and distance columns and Point geometry.
+    """
+    tracepoints = [response.get('tracepoints') or [] for response in responses.values()]
+    lengths = np.fromiter((len(t) for t in tracepoints), dtype=np.int64, count=len(tracepoints))
+    fields = osrm_unpack.tracepoint_fields([tp for points in tracepoints for tp in points])
+
+    values = {
+        name: fields[name].to_numpy(dtype=float, na_value=np.nan)
+        for name in ['matched_lon', 'matched_lat', 'matchings_index', 'waypoint_index',
+                     'snap_distance']
+    }
+
+    n = int(lengths.sum())
+    lonlat = np.column_stack([values['matched_lon'], values['matched_lat']])
+    matching = np.nan_to_num(values['matchings_index'], nan=-1).astype(np.int64)
+    waypoint = np.nan_to_num(values['waypoint_index'], nan=-1).astype(np.int64)
+    distance = values['snap_distance']
+
+    matched = matching >= 0
+    points = np.full(n, None, dtype=object)
+    points[matched] = shapely.points(lonlat[matched])
+
+    keys = np.empty(len(tracepoints), dtype=object)
+    keys[:] = list(responses.keys())
+
+    return gpd.GeoDataFrame(
+        {
+            'group': np.repeat(keys, lengths),
+            'point': np.arange(n) - np.repeat(np.cumsum(lengths) - lengths, lengths),
+            'matchings_index': matching,
+            'waypoint_index': waypoint,
+            'distance': distance
+        },
+        geometry=gpd.GeoSeries(points, crs=crs).values,
+        crs=crs
+    )
@@ -1,12 +1,40 @@
 """
 This module contains the bulk dataframe-based map matching function for the OSRM API.
 """
-from typing import Iterator
+from typing import AsyncIterator, Iterator
+import hashlib
+import itertools
+import json
+import warnings
 import numpy as np
 import pandas as pd
-import requests
 from pyrouting.osrm import osrm_urls
-from pyrouting.utils import ConcurrentRequests
+from pyrouting.osrm import osrm_simplify
+from pyrouting.osrm import osrm_stitch
+from pyrouting.utils import Checkpoint, ConcurrentRequests, quantize, timestamps_to_int
+
+
+# The default match_df options
+MATCH_DEFAULTS = {
+    # 'host': 'localhost',
+    # 'port': 5000,
+    'max_points': 100,
+    'max_url_length': 8000,
+    'overlap': 10,
+    'precision': None,
+    'min_distance': None,
+    'min_interval': None,
+    'tolerance': None,
+    'mode': 'driving',
+    'geometries': 'polyline',
+    'annotations': 'true',
+    'radiuses': None,
+    'waypoints': None,
+    'gaps': 'ignore',
+    'tidy': None,
+    'steps': None,
+    'dt_format': '%Y-%m-%d %H:%M:%S%z'
+}
 
 
 # Construct a list of urls
@@ -44,37 +72,43 @@ def _url_generator(iterable, std_kwargs: dict) -> Iterator:
         yield osrm_urls.match_url(**url_kwargs)
 
 
-def build_urls(
-    df: pd.DataFrame,
-    group_col: str | None, **kwargs
-) -> tuple[None | np.ndarray, list | Iterator]:
+def sort_groups(df: pd.DataFrame, group_col: str) -> pd.DataFrame:
     """
-    This function constructs a list of URLs for the OSRM API based on the input dataframe.
+    Sort a dataframe by group and timestamp, in the order match_df sends the points to the
+    server. The sort is stable, so points with equal timestamps keep their order.
 
     Args:
-        df (pd.DataFrame): A dataframe of trip data. Must contain columns:
-            lat, lon, with optional timestamp, waypoint, and radius.
-        group_col (str | None): The column name to group the dataframe by.
+        df (pd.DataFrame): A dataframe of trip data with integer timestamps, if any.
+        group_col (str): The column name to group the dataframe by.
 
     Returns:
-        list: A list of URLs for the OSRM API.
+        pd.DataFrame: The sorted dataframe.
     """
+    sort_by = [group_col, 'timestamp'] if 'timestamp' in df.columns else [group_col]
+    return df.sort_values(by=sort_by, kind='stable')
 
-    # If no group_col, build a single URL for the entire dataframe
-    if group_col is None:
-        # Build a single URL for the entire dataframe
-        args = [
-            df[['lat', 'lon']].values,
-            df.timestamp.to_numpy(),
-            df.radius.to_numpy(),
-            df.waypoint.to_numpy()
-            ]
-        urls = _build_url(args, kwargs)
 
-        return None, [urls]
+def _split_groups(df: pd.DataFrame, group_col: str | None) -> tuple[np.ndarray, list]:
+    """
+    This is a helper function to sort the dataframe and split it into per-group arrays.
+
+    Args:
+        df (pd.DataFrame): A dataframe of trip data.
+        group_col (str | None): The column name to group the dataframe by. If None, the
+            whole dataframe is a single group with key None.
+
+    Returns:
+        tuple: The unique group keys and a list of [latlons, timestamps, radiuses, waypoints]
+            lists with one array (or None) per group.
+    """
+
+    # Treat the whole dataframe as a single group with key None
+    if group_col is None:
+        _, data = _split_groups(df.assign(__group__=0), '__group__')
+        return np.array([None]), data
 
     # Sort by group_col and timestamp
-    df = df.sort_values(by=[group_col, 'timestamp']).set_index(group_col)
+    df = sort_groups(df, group_col).set_index(group_col)
 
     # Map match each group
     indexmap = np.unique(df.index, return_index=True)
@@ -93,11 +127,408 @@ def build_urls(
         else:
             data.append(dummy)
 
+    return indexmap[0], data
+
+
+def build_urls(
+    df: pd.DataFrame,
+    group_col: str | None, **kwargs
+) -> tuple[None | np.ndarray, list | Iterator]:
+    """
+    This function constructs a list of URLs for the OSRM API based on the input dataframe.
+
+    Args:
+        df (pd.DataFrame): A dataframe of trip data. Must contain columns:
+            lat, lon, with optional timestamp, waypoint, and radius.
+        group_col (str | None): The column name to group the dataframe by.
+
+    Returns:
+        list: A list of URLs for the OSRM API.
+    """
+
+    # If no group_col, build a single URL for the entire dataframe
+    if group_col is None:
+        _, data = _split_groups(df, None)
+        urls = _build_url(*[col[0] for col in data], **kwargs)
+
+        return None, [urls]
+
+    keys, data = _split_groups(df, group_col)
+
     # Construct the URLs
     url_genny = _url_generator(zip(*data), kwargs)
 
     # Return the indexmap and urls
-    return indexmap[0], url_genny
+    return keys, url_genny
+
+
+def build_window_urls(
+    df: pd.DataFrame,
+    group_col: str | None,
+    windows: list[tuple],
+    max_points: int = 100,
+    max_url_length: int = 8000,
+    overlap: int = 10,
+    **kwargs
+) -> Iterator:
+    """
+    This function constructs URLs like build_urls, but splits groups that are too long
+    for one request into overlapping windows.
+
+    A group is windowed if it has more than max_points points or its URL is longer than
+    max_url_length. The window size is then scaled down until every window fits both limits,
+    but never below overlap + 2 points. As each URL is generated, its (group key, start,
+    stop) is appended to windows so responses can be traced back to their group.
+
+    Args:
+        df (pd.DataFrame): A dataframe of trip data. Must contain columns:
+            lat, lon, with optional timestamp, waypoint, and radius.
+        group_col (str | None): The column name to group the dataframe by.
+        windows (list): A list that (group key, start, stop) tuples are appended to.
+        max_points (int, optional): The server's --max-matching-size. Default is 100.
+        max_url_length (int, optional): The longest URL the server accepts. Default is 8000.
+        overlap (int, optional): The number of points shared by consecutive windows, at
+            least 1 so the windows can be stitched. Default is 10.
+
+    Yields:
+        str: A URL for each window.
+    """
+    keys, data = _split_groups(df, group_col)
+
+    for key, item in zip(keys, zip(*data)):
+        n = len(item[0])
+        url = _build_url(*item, **kwargs)
+
+        if n <= max_points and len(url) <= max_url_length:
+            windows.append((key, 0, n))
+            yield url
+            continue
+
+        # Scale the window down by the URL length, keeping room for new points past the
+        # overlap, then shrink it further until every window's URL fits
+        smallest = overlap + 2
+        size = max(smallest, min(max_points, int(n * max_url_length / len(url))))
+        while True:
+            bounds = osrm_stitch.window_bounds(n, size, overlap)
+            urls = [
+                _build_url(*[a if a is None else a[start:stop] for a in item], **kwargs)
+                for start, stop in bounds
+            ]
+            longest = max(len(u) for u in urls)
+            if longest <= max_url_length:
+                break
+            assert size > smallest, \
+                f'a window of {smallest} points is longer than max_url_length, lower overlap'
+            size = max(smallest, min(size - 1, int(size * max_url_length / longest)))
+
+        for (start, stop), window_url in zip(bounds, urls):
+            windows.append((key, start, stop))
+            yield window_url
+
+
+def _group_hashes(df: pd.DataFrame, group_col: str | None, options: dict) -> dict:
+    """
+    This is a helper function to hash the input rows and request options of each group.
+
+    Args:
+        df (pd.DataFrame): A dataframe of trip data.
+        group_col (str | None): The column name to group the dataframe by.
+        options (dict): The request options, which are part of every hash.
+
+    Returns:
+        dict: The hex digest of each group in group order, keyed by group.
+    """
+    if group_col is None:
+        return {None: _group_hashes(df.assign(__group__=0), '__group__', options)[0]}
+
+    df = sort_groups(df, group_col)
+
+    cols = [c for c in ['lat', 'lon', 'timestamp', 'radius', 'waypoint'] if c in df.columns]
+    rows = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+    keys, starts = np.unique(df[group_col].to_numpy(), return_index=True)
+
+    salt = json.dumps(sorted((k, str(v)) for k, v in options.items())).encode()
+    return {
+        key: hashlib.sha1(salt + chunk.tobytes()).hexdigest()
+        for key, chunk in zip(keys, np.split(rows, starts[1:]))
+    }
+
+
+def _simplify(
+    df: pd.DataFrame,
+    group_col: str | None,
+    **options
+) -> tuple[pd.DataFrame, dict]:
+    """
+    This is a helper function to thin and simplify the traces before the URLs are built.
+
+    Returns:
+        tuple: The sorted dataframe of the kept rows, and for each group the positions of
+            its kept rows among all of its rows in sorted order.
+    """
+    if group_col is None:
+        df, kept = _simplify(df.assign(__group__=0), '__group__', **options)
+        return df.drop(columns='__group__'), {None: kept[0]}
+
+    df = sort_groups(df, group_col)
+    keys, starts = np.unique(df[group_col].to_numpy(), return_index=True)
+    timestamps = df['timestamp'].to_numpy() if 'timestamp' in df.columns else None
+
+    keep = osrm_simplify.simplify_mask(
+        df['lat'].to_numpy(), df['lon'].to_numpy(), timestamps, starts, **options
+    )
+
+    # Number the rows within their group, so results can be put back on the dropped rows
+    lengths = np.diff(np.append(starts, len(df)))
+    positions = (np.arange(len(df)) - np.repeat(starts, lengths))[keep]
+    cuts = np.searchsorted(np.flatnonzero(keep), starts[1:])
+
+    return df[keep], dict(zip(keys, np.split(positions, cuts)))
+
+
+def _prepare_match(
+    df: pd.DataFrame,
+    renames: dict[str, str] | None,
+    group_col: str | None,
+    kwargs: dict,
+    checkpoint: Checkpoint | None = None
+) -> tuple[ConcurrentRequests, list[tuple], Iterator, int, dict | None, dict | None]:
+    """
+    This is a helper function to validate the match_df inputs and set up the URLs.
+
+    If a checkpoint is given, groups it already holds with the same hash are left out.
+
+    Returns:
+        tuple: The ConcurrentRequests object, the list windows are recorded in,
+            the URL generator, the window overlap, the hash of every group if there
+            is a checkpoint, and the kept row positions of every group if the traces
+            are simplified.
+    """
+
+    # Assert host and port exist
+    assert 'host' in kwargs, 'Missing host in kwargs specified in match_df'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in match_df'
+
+    for key, value in MATCH_DEFAULTS.items():
+        kwargs.setdefault(key, value)
+
+    concurrency = kwargs.pop('concurrency', None) or ConcurrentRequests()
+    windowing = {key: kwargs.pop(key) for key in ['max_points', 'max_url_length', 'overlap']}
+    assert windowing['overlap'] >= 1, 'overlap must be at least 1 to stitch windows'
+    precision = kwargs.pop('precision')
+    simplify = {key: kwargs.pop(key) for key in ['min_distance', 'min_interval', 'tolerance']}
+
+    assert isinstance(df, pd.DataFrame), 'locations_df must be a pandas DataFrame'
+
+    # Assert mode is either drive, bicycle, or foot
+    assert kwargs['mode'] in ['driving', 'bicycle', 'foot'], \
+        'mode must be "driving", "bicycle", or "foot".'
+
+    # Rename the columns
+    if renames is not None:
+        df = df.rename(columns=renames)
+
+    # Assert required columns are present
+    for col in ['lat', 'lon']:
+        assert col in df.columns, f'{col} not present in locations_df'
+
+    # Round the coordinates, which also keeps the URLs short
+    if precision is not None:
+        df = df.assign(lat=quantize(df['lat'], precision), lon=quantize(df['lon'], precision))
+
+    # Convert the whole timestamp column to integer seconds since UNIX epoch at once
+    if 'timestamp' in df.columns:
+        df = df.assign(timestamp=timestamps_to_int(df['timestamp'], kwargs['dt_format']))
+
+    # Skip the groups that are already finished with the same input and options
+    hashes = None
+    if checkpoint is not None:
+        options = {
+            k: v for k, v in {**windowing, **simplify, **kwargs}.items()
+            if k not in ('host', 'port')
+        }
+        hashes = _group_hashes(df, group_col, options)
+        done = checkpoint.done(hashes)
+        if group_col is None:
+            df = df.iloc[:0] if None in done else df
+        elif len(done) > 0:
+            df = df[~df[group_col].isin(list(done))]
+
+    # Drop points that add little before the URLs are built
+    kept = None
+    if any(value is not None for value in simplify.values()):
+        df, kept = _simplify(df, group_col, **simplify)
+
+    windows: list[tuple] = []
+    urls = build_window_urls(df, group_col, windows, **windowing, **kwargs)
+
+    return concurrency, windows, urls, windowing['overlap'], hashes, kept
+
+
+def _complete_groups(stream: Iterator, windows: list[tuple]) -> Iterator:
+    """
+    This is a helper function to gather the window responses of each group, yielding a group
+    as soon as all of its windows have arrived.
+
+    Windows of a group are generated together, so the number of windows of a group is
+    known once the next group's first window has been generated.
+
+    Args:
+        stream (Iterator): The (index, response) pairs from ConcurrentRequests.stream.
+        windows (list): The (group key, start, stop) list filled by build_window_urls.
+
+    Yields:
+        tuple: The group key and a list of (start, stop, response) windows.
+    """
+    received: dict = {}
+    expected: dict = {}
+    held = None
+    scanned = 0
+
+    for i, response in stream:
+        for key, _, _ in windows[scanned:]:
+            expected[key] = expected.get(key, 0) + 1
+        scanned = len(windows)
+        last = windows[-1][0]
+
+        key, start, stop = windows[i]
+        received.setdefault(key, []).append((start, stop, response))
+
+        # A complete group is held back while more of its windows may still be generated
+        candidates = [key] if held in (None, key) else [key, held]
+        held = None
+        for candidate in candidates:
+            if len(received.get(candidate, ())) != expected[candidate]:
+                continue
+            if candidate == last:
+                held = candidate
+            else:
+                yield candidate, received.pop(candidate)
+
+    for key in list(received):
+        yield key, received.pop(key)
+
+
+async def _async_complete_groups(stream: AsyncIterator, windows: list[tuple]) -> AsyncIterator:
+    """
+    This is a helper function to gather the window responses of each group from
+    ConcurrentRequests.async_stream, like _complete_groups. The URLs must all have been
+    generated, so windows is complete.
+    """
+    expected: dict = {}
+    for key, _, _ in windows:
+        expected[key] = expected.get(key, 0) + 1
+
+    received: dict = {}
+    async for i, response in stream:
+        key, start, stop = windows[i]
+        received.setdefault(key, []).append((start, stop, response))
+        if len(received[key]) == expected[key]:
+            yield key, received.pop(key)
+
+
+def _stitch(parts: list[tuple[int, int, dict]], overlap: int, geometries: str) -> dict:
+    """
+    This is a helper function to stitch the (start, stop, response) windows of a group into
+    one response.
+    """
+    if len(parts) == 1:
+        return parts[0][2]
+
+    parts = sorted(parts, key=lambda part: part[0])
+    bounds = [(start, stop) for start, stop, _ in parts]
+    responses = [response for _, _, response in parts]
+    return osrm_stitch.stitch_windows(responses, bounds, overlap, geometries)
+
+
+def _with_rows(response: dict, key, kept: dict | None) -> dict:
+    """
+    This is a helper function to record which rows of a simplified group its tracepoints
+    belong to, as 'tracepoint_rows' positions among the group's rows in sorted order.
+    """
+    if kept is not None:
+        response['tracepoint_rows'] = kept[key].tolist()
+    return response
+
+
+def _save_group(
+    checkpoint: Checkpoint,
+    hashes: dict,
+    failed: dict,
+    key,
+    parts: list[tuple[int, int, dict]],
+    overlap: int,
+    geometries: str,
+    kept: dict | None
+) -> None:
+    """
+    This is a helper function to store a finished group, or to keep it in failed if any of
+    its requests failed so it is tried again on the next run.
+    """
+    response = _with_rows(_stitch(parts, overlap, geometries), key, kept)
+    if any(part[2].get('code') == 'RequestError' for part in parts):
+        failed[key] = response
+    else:
+        checkpoint.save(key, hashes[key], response)
+
+
+def _checkpointed_matches(
+    checkpoint: Checkpoint,
+    hashes: dict,
+    failed: dict,
+    group_col: str | None
+) -> dict:
+    """
+    This is a helper function to load the stored groups, with the failed ones in between.
+
+    Returns:
+        dict: A dictionary of match responses keyed by group, or a single response if
+            group_col is None.
+    """
+    if len(failed) > 0:
+        warnings.warn(f'{len(failed)} groups had failed requests and were not checkpointed')
+
+    stored = checkpoint.load(k for k in hashes if k not in failed)
+    matches = {key: failed[key] if key in failed else stored[key] for key in hashes}
+
+    if group_col is None:
+        return matches[None]
+
+    return matches
+
+
+def _collect_matches(
+    windows: list[tuple],
+    results: list[dict],
+    overlap: int,
+    group_col: str | None,
+    concurrency: ConcurrentRequests,
+    geometries: str,
+    kept: dict | None = None
+) -> dict:
+    """
+    This is a helper function to stitch the window responses back into one per group.
+
+    Returns:
+        dict: A dictionary of match responses keyed by group, or a single response if
+            group_col is None.
+    """
+
+    # Failed requests come back as RequestError responses rather than raising
+    if len(concurrency.failures) > 0:
+        warnings.warn(f'{len(concurrency.failures)} match requests failed after retries')
+
+    # Stitch windowed groups back into one response per group
+    matches = {}
+    grouped = itertools.groupby(zip(windows, results), key=lambda item: item[0][0])
+    for key, group in grouped:
+        parts = [(start, stop, response) for (_, start, stop), response in group]
+        matches[key] = _with_rows(_stitch(parts, overlap, geometries), key, kept)
+
+    if group_col is None:
+        return matches[None]
+
+    return matches
 
 
 def match_df(
@@ -135,64 +566,84 @@ def match_df(
         waypoints (list, optional): Selected input coordinates as waypoints.
         dt_format (str, optional): The format of the timestamps if not integer seconds.
             Default is '%Y-%m-%d %H:%M:%S%z'.
+        max_points (int, optional): The server's --max-matching-size. Longer groups are
+            matched in overlapping windows and stitched back together. Default is 100.
+        max_url_length (int, optional): The longest URL the server accepts. Groups with longer
+            URLs are windowed too. Default is 8000.
+        overlap (int, optional): The number of points shared by consecutive windows, at
+            least 1 so the windows can be stitched. Default is 10.
+        precision (int, optional): Round the coordinates to this many decimal places.
+            Default is None, which sends them as they are.
+        min_distance (float, optional): Drop points closer than this many metres along the
+            trace to the last kept point.
+        min_interval (float, optional): Drop points less than this many seconds after the
+            last kept point.
+        tolerance (float, optional): Simplify the traces with Douglas-Peucker, dropping
+            points within this many metres of the simplified line. If any of these three
+            is set, each response gets 'tracepoint_rows', the positions of the rows its
+            tracepoints belong to among the group's rows sorted by timestamp.
+        concurrency (ConcurrentRequests, optional): The ConcurrentRequests object used to
+            send the requests. Defaults to a new one with default settings.
+        checkpoint (Checkpoint, optional): Store each group's response as soon as it is
+            done. Groups already stored with the same input rows and options are not
+            matched again, so a failed run can be restarted where it stopped.
 
     Returns:
-        json list: A JSON list of dictionaries containing the matched coordinates and metadata.
-    """
-
-    # Set default kwargs
-    defaults = {
-        # 'host': 'localhost',
-        # 'port': 5000,
-        'mode': 'driving',
-        'geometries': 'polyline',
-        'annotations': 'true',
-        'radiuses': None,
-        'waypoints': None,
-        'gaps': 'ignore',
-        'tidy': None,
-        'steps': None,
-        'dt_format': '%Y-%m-%d %H:%M:%S%z'
-    }
-
-    # Assert host and port exist
-    assert 'host' in kwargs, 'Missing host in kwargs specified in match_df'
-    assert 'port' in kwargs, 'Missing port in kwargs specified in match_df'
+        dict: A dictionary of match responses keyed by group, or a single response if
+            group_col is None.
+    """
 
-    for key, value in defaults.items():
-        kwargs.setdefault(key, value)
+    checkpoint = kwargs.pop('checkpoint', None)
+    concurrency, windows, urls, overlap, hashes, kept = _prepare_match(
+        df, renames, group_col, kwargs, checkpoint
+    )
+    geometries = kwargs.get('geometries', 'polyline')
 
-    assert isinstance(df, pd.DataFrame), 'locations_df must be a pandas DataFrame'
+    if checkpoint is None:
+        # Use concurrent requests
+        results = concurrency.get(urls)
+        return _collect_matches(
+            windows, results, overlap, group_col, concurrency, geometries, kept
+        )
 
-    # Assert mode is either drive, bicycle, or foot
-    assert kwargs['mode'] in ['driving', 'bicycle', 'foot'], \
-        'mode must be "driving", "bicycle", or "foot".'
+    # Store each group as soon as all of its windows are in
+    failed: dict = {}
+    for key, parts in _complete_groups(concurrency.stream(urls), windows):
+        _save_group(checkpoint, hashes, failed, key, parts, overlap, geometries, kept)
 
-    # Rename the columns
-    df = df.rename(columns=renames)
+    return _checkpointed_matches(checkpoint, hashes, failed, group_col)
 
-    # Assert required columns are present
-    for col in ['lat', 'lon']:
-        assert col in df.columns, f'{col} not present in locations_df'
 
-    # If timestamp is a string, convert to integer seconds since UNIX epoch
-    if 'timestamp' in df.columns and df['timestamp'].dtype != 'int64':
-        df['timestamp'] = pd.to_datetime(
-            df['timestamp'],
-            format=kwargs['dt_format']
-        ).astype('int64')
-        df['timestamp'] //= 10**9
-
-    idx, urls = build_urls(df, group_col, **kwargs)
-
-    # If only one URL, make a single request
-    if not group_col and df[group_col].nunique() == 1:
-        assert isinstance(urls, list), 'urls must be a list of strings'
-        return requests.get(urls[0], timeout=5).json()
-
-    # If multiple URLs, use concurrent requests
-    concurrency = ConcurrentRequests()
-    results = concurrency.get(urls)
+async def async_match_df(
+    df: pd.DataFrame,
+    renames: dict[str, str] | None = None,
+    group_col: str | None = None,
+    **kwargs
+) -> dict:
+    """
+    The awaitable version of match_df, for use inside a running event loop.
+    It takes the same arguments as match_df.
 
-    assert idx is not None, 'idx must be an iterable'
-    return dict(zip(idx, results))
+    Returns:
+        dict: A dictionary of match responses keyed by group, or a single response if
+            group_col is None.
+    """
+    checkpoint = kwargs.pop('checkpoint', None)
+    concurrency, windows, urls, overlap, hashes, kept = _prepare_match(
+        df, renames, group_col, kwargs, checkpoint
+    )
+    geometries = kwargs.get('geometries', 'polyline')
+
+    if checkpoint is None:
+        results = await concurrency.async_gather(urls)
+        return _collect_matches(
+            windows, results, overlap, group_col, concurrency, geometries, kept
+        )
+
+    # Store each group as soon as all of its windows are in
+    urls = list(urls)
+    failed: dict = {}
+    async for key, parts in _async_complete_groups(concurrency.async_stream(urls), windows):
+        _save_group(checkpoint, hashes, failed, key, parts, overlap, geometries, kept)
+
+    return _checkpointed_matches(checkpoint, hashes, failed, group_col)
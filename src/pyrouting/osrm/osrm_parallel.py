@@ -0,0 +1,183 @@
+"""
+This module contains the process-pool map matching function, which hands the raw
+responses to worker processes for parsing, stitching, unpacking, and geometry decoding.
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import osrm_matching
+from pyrouting.osrm import osrm_unpack
+from pyrouting.utils.fastjson import loads
+
+
+def _unpack_batch(
+    batch: list[list[tuple[int, int, bytes]]],
+    unpack: list[str],
+    overlap: int,
+    geometries: str,
+    decode_geometry: bool
+) -> tuple[dict[str, np.ndarray], tuple[np.ndarray, np.ndarray] | None]:
+    """
+    This is a helper function run in the worker processes to turn the raw window responses
+    of a batch of groups into columns.
+
+    Args:
+        batch (list): For each group, its (start, stop, raw response) windows.
+        unpack (list): A list of matching attributes to extract.
+        overlap (int): The number of points shared by consecutive windows.
+        geometries (str): The geometry format of the responses.
+        decode_geometry (bool): Decode the geometry column into flat arrays.
+
+    Returns:
+        tuple: The columns of the batch, and the (coords, offsets) of the decoded geometry
+            or None. The geometry column is left out of the columns if it was decoded.
+    """
+    responses = [
+        osrm_matching._stitch(
+            [(start, stop, loads(raw)) for start, stop, raw in windows], overlap, geometries
+        )
+        for windows in batch
+    ]
+
+    columns = osrm_unpack.unpack_matches(responses, unpack, len(responses))
+
+    geometry = None
+    if decode_geometry and 'geometry' in columns:
+        geometry = osrm_unpack.unpack_geometry(columns.pop('geometry'), geometries)
+
+    return columns, geometry
+
+
+def match_unpack(
+    df: pd.DataFrame,
+    unpack: list[str],
+    renames: dict[str, str] | None = None,
+    group_col: str | None = None,
+    workers: int | Executor | None = None,
+    n_workers: int | None = None,
+    batch_size: int = 64,
+    decode_geometry: bool = False,
+    **kwargs
+) -> pd.DataFrame:
+    """
+    Map match trip locations and unpack the matches using all cores.
+
+    The responses are kept as raw bytes on the network side, so the event loop only keeps
+    the server busy. As soon as every window of a group has arrived, the group is batched
+    and sent to a process pool, which parses, stitches, unpacks, and optionally decodes the
+    geometry, and sends the columns back as arrays.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        df (pd.DataFrame): A dataframe of trip data. Must contain columns:
+            lat, lon, with optional timestamp, waypoint, and radius.
+        unpack (list): A list of matching attributes to extract.
+        renames (dict, optional): A dictionary of column renames for lat, lon, and timestamp.
+        group_col (str, optional): The column name to group the dataframe by.
+        workers (int | Executor, optional): The number of worker processes, or an executor
+            to use. Defaults to a process per core.
+        n_workers (int, optional): The number of workers of an executor passed as workers,
+            which bounds the batches in flight. Defaults to the number of cores.
+        batch_size (int, optional): The number of groups sent to a worker at a time.
+            Default is 64.
+        decode_geometry (bool, optional): Replace the geometry strings with (N, 2) arrays of
+            (lat, lon). Default is False.
+        **kwargs: Other keyword arguments for match_df, except checkpoint.
+
+    Returns:
+        pd.DataFrame: A dataframe of the unpacked attributes indexed by group.
+    """
+    # The responses are only parsed on the workers, so there is nothing to checkpoint
+    assert kwargs.get('checkpoint') is None, \
+        'checkpoint cannot be combined with workers, match without workers to checkpoint'
+
+    # Only ask the server for what is unpacked
+    for key, value in osrm_unpack.request_options(unpack).items():
+        kwargs.setdefault(key, value)
+
+    concurrency, windows, urls, overlap, _, _ = osrm_matching._prepare_match(
+        df, renames, group_col, kwargs
+    )
+    geometries = kwargs.get('geometries', 'polyline')
+
+    if isinstance(workers, Executor):
+        executor = workers
+        n_workers = n_workers or os.cpu_count() or 1
+    else:
+        n_workers = workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(n_workers)
+    max_pending = 2 * n_workers
+
+    futures: list[tuple[list, Future]] = []
+    results: list[tuple[list, tuple]] = []
+    batch: list = []
+    batch_keys: list = []
+
+    def submit_batch():
+        futures.append((
+            list(batch_keys),
+            executor.submit(_unpack_batch, list(batch), unpack, overlap, geometries,
+                            decode_geometry)
+        ))
+        batch.clear()
+        batch_keys.clear()
+
+        # Bound the work in flight by waiting for the oldest batch
+        while len(futures) > max_pending:
+            done_keys, future = futures.pop(0)
+            results.append((done_keys, future.result()))
+
+    try:
+        # Leave parsing to the workers
+        stream = concurrency.stream(urls, parse=False)
+        for key, group in osrm_matching._complete_groups(stream, windows):
+            batch.append(group)
+            batch_keys.append(key)
+            if len(batch) >= batch_size:
+                submit_batch()
+        if len(batch) > 0:
+            submit_batch()
+
+        results += [(done_keys, future.result()) for done_keys, future in futures]
+    finally:
+        if executor is not workers:
+            executor.shutdown()
+
+    if len(concurrency.failures) > 0:
+        warnings.warn(f'{len(concurrency.failures)} match requests failed after retries')
+
+    keys = list(dict.fromkeys(key for key, _, _ in windows))
+    return _assemble(keys, results, unpack, decode_geometry)
+
+
+def _assemble(
+    keys: list,
+    results: list[tuple[list, tuple]],
+    unpack: list[str],
+    decode_geometry: bool
+) -> pd.DataFrame:
+    """
+    This is a helper function to put the batch columns back in group order.
+    """
+    batch_keys = [key for done_keys, _ in results for key in done_keys]
+    position = {key: p for p, key in enumerate(keys)}
+    order = np.argsort([position[key] for key in batch_keys], kind='stable')
+
+    columns = {}
+    for name in unpack:
+        if name == 'geometry' and decode_geometry:
+            parts = []
+            for _, (_, (coords, offsets)) in results:
+                parts += np.split(coords, offsets[1:-1]) if len(offsets) > 1 else []
+            values = np.empty(len(parts), dtype=object)
+            for j, part in enumerate(parts):
+                values[j] = part
+        else:
+            values = np.concatenate([cols[name] for _, (cols, _) in results]) \
+                if len(results) > 0 else np.empty(0)
+        columns[name] = values[order]
+
+    return pd.DataFrame(columns, index=[batch_keys[i] for i in order])
@@ -0,0 +1,128 @@
+"""
+This module contains functions for encoding and decoding OSRM polyline geometries.
+"""
+from typing import Sequence
+import numpy as np
+
+
+def decode(polyline: str, precision: int = 5) -> np.ndarray:
+    """
+    Decode an encoded polyline string into coordinates.
+
+    Args:
+        polyline (str): The encoded polyline.
+        precision (int, optional): 5 for polyline, 6 for polyline6. Default is 5.
+
+    Returns:
+        np.ndarray: A (N, 2) array of (lat, lon) coordinates.
+    """
+    values = []
+    value = shift = 0
+    for char in polyline:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+        else:
+            shift += 5
+
+    deltas = np.array(values, dtype=np.int64).reshape(-1, 2)
+    return np.cumsum(deltas, axis=0) / 10**precision
+
+
+def encode(coords: np.ndarray, precision: int = 5) -> str:
+    """
+    Encode coordinates as a polyline string.
+
+    Args:
+        coords (np.ndarray): A (N, 2) array of (lat, lon) coordinates.
+        precision (int, optional): 5 for polyline, 6 for polyline6. Default is 5.
+
+    Returns:
+        str: The encoded polyline.
+    """
+    ints = np.round(np.asarray(coords, dtype=float) * 10**precision).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+
+    chars = []
+    for value in deltas.ravel().tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+
+    return ''.join(chars)
+
+
+def decode_many(
+    polylines: Sequence[str | None],
+    precision: int = 5
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decode a whole column of polyline strings at once into flat coordinate arrays.
+
+    All strings are decoded together with array operations, so no Python objects are
+    created per point. The coordinates of polyline i are coords[offsets[i]:offsets[i + 1]].
+    Missing values decode to empty geometries.
+
+    Args:
+        polylines (Sequence): The encoded polylines, e.g. a DataFrame column.
+        precision (int, optional): 5 for polyline, 6 for polyline6. Default is 5.
+
+    Returns:
+        tuple: A (N, 2) float array of (lat, lon) coordinates and an int64 offsets array
+            with one more entry than polylines.
+    """
+    strings = [p if isinstance(p, str) else '' for p in polylines]
+    lengths = np.fromiter((len(p) for p in strings), dtype=np.int64, count=len(strings))
+    buffer = np.frombuffer(''.join(strings).encode('ascii'), dtype=np.uint8)
+    chunks = buffer.astype(np.int64) - 63
+
+    # Each value is a run of 5-bit chunks, ended by a chunk without the 0x20 flag
+    is_end = chunks < 0x20
+    ends = np.flatnonzero(is_end)
+    starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+    value_id = np.cumsum(is_end) - is_end
+    shift = 5 * (np.arange(len(chunks)) - starts[value_id])
+
+    values = np.zeros(len(ends), dtype=np.int64)
+    if len(ends) > 0:
+        values = np.add.reduceat((chunks & 0x1f) << shift, starts)
+    values = (values >> 1) ^ -(values & 1)
+
+    # Count the values in each string to find where each geometry starts
+    char_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    value_offsets = np.searchsorted(ends, char_offsets, side='left')
+    offsets = value_offsets // 2
+
+    # Deltas are cumulative within each geometry, so subtract the running sum at its start
+    deltas = values.reshape(-1, 2)
+    totals = np.cumsum(deltas, axis=0)
+    totals = np.concatenate([np.zeros((1, 2), dtype=np.int64), totals])
+    group = np.repeat(np.arange(len(strings)), np.diff(offsets))
+    coords = totals[1:] - totals[offsets[group]]
+
+    return coords / 10**precision, offsets
+
+
+def flatten_geojson(geometries: Sequence[dict | None]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Flatten a column of GeoJSON LineStrings into the same form as decode_many.
+
+    Args:
+        geometries (Sequence): The GeoJSON geometries, e.g. a DataFrame column.
+
+    Returns:
+        tuple: A (N, 2) float array of (lat, lon) coordinates and an int64 offsets array
+            with one more entry than geometries.
+    """
+    parts = [
+        g['coordinates'] if isinstance(g, dict) else [] for g in geometries
+    ]
+    lengths = np.fromiter((len(p) for p in parts), dtype=np.int64, count=len(parts))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    coords = np.array([c for p in parts for c in p], dtype=float).reshape(-1, 2)
+
+    return coords[:, ::-1], offsets
@@ -2,31 +2,149 @@
 This module provides a Python interface to the Open Source Routing Machine (OSRM) API.
 """
 from functools import wraps
+import time
+import warnings
 import requests
 import pandas as pd
 from pyrouting.osrm import osrm_urls
 from pyrouting.osrm import osrm_matching
 from pyrouting.osrm import osrm_unpack
+from pyrouting.osrm import osrm_table
+from pyrouting.osrm import osrm_stream
+from pyrouting.osrm import osrm_routing
+from pyrouting.osrm import osrm_parallel
+from pyrouting.osrm import osrm_distributed
+from pyrouting.osrm import osrm_geo
+from pyrouting.utils import BackendPool, ConcurrentRequests, Metrics, ResponseCache
+from pyrouting.utils.concurrency import COMPRESSED
+from pyrouting.utils.fastjson import loads
 
 
 class OSRMQueries:
     """
     This class provides methods for constructing URLs for the OSRM API services.
     """
-    def __init__(self, host: str = 'localhost', port: int = 5000):
+    def __init__(
+        self,
+        host: str = 'localhost',
+        port: int = 5000,
+        cache: ResponseCache | None = None,
+        backends: list[str | tuple[str, int]] | BackendPool | None = None,
+        metrics: Metrics | None = None,
+        schedule: str | None = None
+    ):
         """
         Initialize the PyOSRM object.
 
         Args:
             host (str, optional): The host URL. Defaults to 'localhost:5000'.
+            cache (ResponseCache, optional): A response cache shared by all requests.
+                If given, only cache misses are sent to the server.
+            backends (list | BackendPool, optional): Several osrm-routed replicas as
+                'host:port' strings, (host, port) tuples, or a BackendPool. If given, requests
+                are balanced across them and host and port are ignored.
+            metrics (Metrics, optional): A registry that records every request made by this
+                object, including the bulk methods.
+            schedule (str, optional): 'lpt' sends the largest requests of the bulk methods
+                first, see ConcurrentRequests. Defaults to None.
         """
 
         # If does not start with https:// or http://, then add http://
         if not host.startswith('https://') and not host.startswith('http://'):
             host = 'http://' + host
 
+        if isinstance(backends, list):
+            backends = BackendPool(backends)
+
+        # URLs are built for the first replica and rewritten per request by the pool
+        if backends is not None:
+            host, port = backends.endpoints[0].rsplit(':', 1)
+
         self.host = host
         self.port = port
+        self.cache = cache
+        self.backends = backends
+        self.metrics = metrics
+        self.schedule = schedule
+
+    def _concurrency(self) -> ConcurrentRequests:
+        """
+        Create a ConcurrentRequests object sharing this object's cache and backends.
+        """
+        return ConcurrentRequests(
+            cache=self.cache, backends=self.backends, metrics=self.metrics, schedule=self.schedule
+        )
+
+    def _get(self, url: str) -> dict:
+        """
+        Make a single GET request, going through the cache if there is one.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            dict: A JSON dictionary containing the full request response.
+        """
+        if self.cache is not None:
+            hit = self.cache.get(url)
+            if hit is not None:
+                if self.metrics is not None:
+                    self.metrics.record_request(url, 'cache')
+                return hit
+
+        start = time.perf_counter()
+        try:
+            response = self._request(url)
+        except requests.exceptions.RequestException as err:
+            if self.metrics is not None:
+                self.metrics.record_request(url, type(err).__name__, failed=True)
+            raise
+
+        latency = time.perf_counter() - start
+        obj = loads(response.content)
+        parse_time = time.perf_counter() - start - latency
+
+        if self.metrics is not None:
+            self.metrics.record_request(
+                url, response.status_code, latency, len(response.content), parse_time
+            )
+
+        if self.cache is not None and obj.get('code') == 'Ok':
+            self.cache.set(url, response.content)
+
+        return obj
+
+    def _request(self, url: str) -> requests.Response:
+        """
+        Send a GET request, failing over to the other replicas if there are backends.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            requests.Response: The response.
+        """
+        if self.backends is None:
+            return requests.get(url, timeout=5, headers=COMPRESSED)
+
+        self.backends.maybe_check_health()
+
+        error = None
+        for _ in self.backends.endpoints:
+            base = self.backends.acquire()
+            start = time.perf_counter()
+            try:
+                response = requests.get(
+                    self.backends.rewrite(url, base), timeout=5, headers=COMPRESSED
+                )
+            except requests.exceptions.RequestException as err:
+                self.backends.release(base, ok=False)
+                error = err
+                continue
+            self.backends.release(base, time.perf_counter() - start)
+            return response
+
+        raise error
 
     @wraps(osrm_urls.route_url)
     def route(self, *args, **kwargs) -> dict:
@@ -38,7 +156,7 @@ class OSRMQueries:
         """
         kwargs.update({'host': self.host, 'port': self.port})
         url = osrm_urls.route_url(*args, **kwargs)
-        return requests.get(url, timeout=5).json()
+        return self._get(url)
 
     @wraps(osrm_urls.match_url)
     def match(self, *args, **kwargs) -> dict:
@@ -50,7 +168,7 @@ class OSRMQueries:
         """
         kwargs.update({'host': self.host, 'port': self.port})
         url = osrm_urls.match_url(*args, **kwargs)
-        return requests.get(url, timeout=5).json()
+        return self._get(url)
 
     @wraps(osrm_urls.table_url)
     def table(self, *args, **kwargs) -> dict:
@@ -62,7 +180,44 @@ class OSRMQueries:
         """
         kwargs.update({'host': self.host, 'port': self.port})
         url = osrm_urls.table_url(*args, **kwargs)
-        return requests.get(url, timeout=5).json()
+        return self._get(url)
+
+    @wraps(osrm_table.table_matrix)
+    def table_matrix(self, *args, **kwargs) -> dict:
+        """
+        This function wraps the osrm_table.table_matrix function and runs the tiled requests.
+
+        Returns:
+            dict: A dictionary of float32 arrays keyed by 'durations' and/or 'distances'.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs.setdefault('concurrency', self._concurrency())
+        return osrm_table.table_matrix(*args, **kwargs)
+
+    @wraps(osrm_table.table_sparse)
+    def table_sparse(self, *args, **kwargs):
+        """
+        This function wraps the osrm_table.table_sparse function and only requests the
+        tiles that can hold pairs within the cutoff.
+
+        Returns:
+            scipy.sparse.coo_array: The pairs within the cutoff.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs.setdefault('concurrency', self._concurrency())
+        return osrm_table.table_sparse(*args, **kwargs)
+
+    @wraps(osrm_routing.route_df)
+    def route_df(self, *args, **kwargs) -> pd.DataFrame:
+        """
+        This function wraps the osrm_routing.route_df function and routes every row.
+
+        Returns:
+            pd.DataFrame: A dataframe of distance, duration, and optionally geometry.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs.setdefault('concurrency', self._concurrency())
+        return osrm_routing.route_df(*args, **kwargs)
 
     @wraps(osrm_matching.match_df)
     def match_df(self, *args, **kwargs) -> dict | pd.DataFrame:
@@ -70,23 +225,150 @@ class OSRMQueries:
         This function wraps the osrm_matching.match_df function and returns a list of
         request responses.
 
+        Set unpack to a list of matching attributes to get them as columns of the DataFrame
+        instead. With decode_geometry=True, the geometry column holds (N, 2) arrays of
+        (lat, lon) that are views into one flat decoded array. With workers set as well, the
+        responses are parsed and unpacked by a process pool, see osrm_parallel.match_unpack.
+
+        Set output='geodataframe' to get a GeoDataFrame of the matched routes indexed by
+        group, with the unpacked attributes as columns, and tracepoints=True to also get a
+        GeoDataFrame of the snapped points. Pass overview='full' for full route geometry.
+        Set output='tracepoints' to get the snapped location and matching of every input row
+        as columns of the DataFrame instead, see osrm_unpack.unpack_tracepoints.
+
         Returns:
             list: A list of JSON dictionaries containing the full request response.
         """
 
         # If kargs has "unpack", pop this out for unpacking after querying
-        unpack = kwargs.pop('unpack')
+        unpack = kwargs.pop('unpack', None)
+        decode_geometry = kwargs.pop('decode_geometry', False)
+        workers = kwargs.pop('workers', None)
+        output = kwargs.pop('output', None)
+        tracepoints = kwargs.pop('tracepoints', False)
+        crs = kwargs.pop('crs', 'EPSG:4326')
+        assert output in [None, 'geodataframe', 'tracepoints'], \
+            'output must be None, "geodataframe", or "tracepoints"'
+        assert workers is None or output is None, \
+            'workers only applies to unpacked columns, not to output'
 
         # Add the host and port to the kwargs
         kwargs.update({'host': self.host, 'port': self.port})
-        response = osrm_matching.match_df(*args, **kwargs)
+        kwargs.setdefault('concurrency', self._concurrency())
 
-        if isinstance(unpack, list) and len(unpack) > 0:
-            result = [osrm_unpack.unpack_match(r, unpack) for r in response.values()]
-            matches_df = pd.DataFrame(result, columns=unpack, index=list(response.keys()))
+        if output == 'tracepoints':
+            for key, value in osrm_unpack.TRACEPOINT_OPTIONS.items():
+                kwargs.setdefault(key, value)
 
-            # Concatenate the results with the original DataFrame
+            response = osrm_matching.match_df(*args, **kwargs)
             df = args[0] if isinstance(args[0], pd.DataFrame) else kwargs.get('df')
+            renames = args[1] if len(args) > 1 else kwargs.get('renames')
+            group_col = args[2] if len(args) > 2 else kwargs.get('group_col')
+
+            tracepoints_df = osrm_unpack.unpack_tracepoints(
+                df, response, renames, group_col,
+                dt_format=kwargs.get('dt_format', osrm_matching.MATCH_DEFAULTS['dt_format'])
+            )
+            return pd.concat([df, tracepoints_df], axis=1)
+
+        if output == 'geodataframe':
+            unpack = [key for key in unpack or ['confidence', 'distance', 'duration']
+                      if key != 'geometry']
+            kwargs.setdefault('steps', False)
+            if 'legs' not in unpack:
+                kwargs.setdefault('annotations', 'false')
+
+            response = osrm_matching.match_df(*args, **kwargs)
+            group_col = args[2] if len(args) > 2 else kwargs.get('group_col')
+            responses = response if group_col is not None else {None: response}
+
+            geometries = kwargs.get('geometries', 'polyline')
+            routes = osrm_geo.routes_gdf(responses, unpack, geometries, crs)
+            if tracepoints:
+                return routes, osrm_geo.tracepoints_gdf(responses, crs)
+            return routes
+
+        # Only ask the server for what is unpacked
+        if isinstance(unpack, list) and len(unpack) > 0:
+            for key, value in osrm_unpack.request_options(unpack).items():
+                kwargs.setdefault(key, value)
+
+        if workers is not None and isinstance(unpack, list) and len(unpack) > 0:
+            df = args[0] if isinstance(args[0], pd.DataFrame) else kwargs.pop('df')
+            matches_df = osrm_parallel.match_unpack(
+                df, unpack, *args[1:], workers=workers, decode_geometry=decode_geometry, **kwargs
+            )
             return pd.concat([df, matches_df], axis=1)
 
+        response = osrm_matching.match_df(*args, **kwargs)
+
+        if isinstance(unpack, list) and len(unpack) > 0:
+            df = args[0] if isinstance(args[0], pd.DataFrame) else kwargs.get('df')
+            return osrm_unpack.unpack_match_df(
+                df, response, unpack, kwargs.get('geometries', 'polyline'), decode_geometry
+            )
+
         return response
+
+    def _concurrency_options(self, kwargs: dict) -> dict:
+        """
+        Picklable ConcurrentRequests options for the workers of the distributed methods.
+
+        The workers reopen the cache from its path. Metrics cannot be shared with them, so
+        their requests are not recorded.
+        """
+        options = kwargs.pop('concurrency_options', None) or {}
+        if self.backends is not None:
+            options.setdefault('backends', list(self.backends.endpoints))
+        if self.cache is not None:
+            options.setdefault('cache', {
+                'path': self.cache.path,
+                'max_size': self.cache.max_size,
+                'ttl': self.cache.ttl,
+                'dataset_version': self.cache.dataset_version or None
+            })
+        if self.metrics is not None:
+            warnings.warn('metrics are not recorded for requests made on the workers')
+        if self.schedule is not None:
+            options.setdefault('schedule', self.schedule)
+        return options
+
+    @wraps(osrm_distributed.match_df_distributed)
+    def match_df_distributed(self, *args, **kwargs) -> dict | pd.DataFrame:
+        """
+        This function wraps the osrm_distributed.match_df_distributed function, which
+        matches partitions of the groups on worker processes or nodes.
+
+        Returns:
+            dict | pd.DataFrame: The match responses keyed by group, or a dataframe of the
+                unpacked attributes indexed by group if unpack is given.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs['concurrency_options'] = self._concurrency_options(kwargs)
+        return osrm_distributed.match_df_distributed(*args, **kwargs)
+
+    @wraps(osrm_distributed.table_matrix_distributed)
+    def table_matrix_distributed(self, *args, **kwargs) -> dict:
+        """
+        This function wraps the osrm_distributed.table_matrix_distributed function, which
+        fills blocks of table rows on worker processes or nodes.
+
+        Returns:
+            dict: A dictionary of (N, M) float32 arrays keyed by annotation.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs['concurrency_options'] = self._concurrency_options(kwargs)
+        return osrm_distributed.table_matrix_distributed(*args, **kwargs)
+
+    @wraps(osrm_stream.match_file)
+    def match_file(self, *args, **kwargs) -> int:
+        """
+        This function wraps the osrm_stream.match_file function and streams the matches
+        to a Parquet dataset.
+
+        Returns:
+            int: The number of groups written.
+        """
+        kwargs.update({'host': self.host, 'port': self.port})
+        kwargs.setdefault('concurrency', self._concurrency())
+        return osrm_stream.match_file(*args, **kwargs)
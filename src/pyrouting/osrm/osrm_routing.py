@@ -0,0 +1,136 @@
+"""
+This module contains the bulk dataframe-based routing function for the OSRM API.
+"""
+from typing import Iterator
+import warnings
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import osrm_urls
+from pyrouting.utils import ConcurrentRequests, dedupe_rows, quantize
+
+
+def build_route_urls(
+    df: pd.DataFrame,
+    origin_cols: list[str],
+    dest_cols: list[str],
+    **kwargs
+) -> Iterator:
+    """
+    This function constructs a route URL for each origin-destination row of the dataframe.
+
+    Args:
+        df (pd.DataFrame): A dataframe of origin-destination pairs.
+        origin_cols (list): The origin latitude and longitude column names.
+        dest_cols (list): The destination latitude and longitude column names.
+
+    Yields:
+        str: A route URL for each row.
+    """
+    origins = df[list(origin_cols)].to_numpy(dtype=float)
+    destinations = df[list(dest_cols)].to_numpy(dtype=float)
+
+    yield from _route_urls(origins, destinations, **kwargs)
+
+
+def _route_urls(origins: np.ndarray, destinations: np.ndarray, **kwargs) -> Iterator:
+    """
+    This is a helper function to construct a route URL for each origin-destination pair.
+    """
+    for origin, destination in zip(origins, destinations):
+        yield osrm_urls.route_url([origin, destination], **kwargs)
+
+
+def route_df(
+    df: pd.DataFrame,
+    origin_cols: list[str] | tuple[str, str] = ('o_lat', 'o_lon'),
+    dest_cols: list[str] | tuple[str, str] = ('d_lat', 'd_lon'),
+    geometry: bool = False,
+    precision: int | None = None,
+    dedupe: bool = False,
+    **kwargs
+) -> pd.DataFrame:
+    """
+    Route many origin-destination pairs from a dataframe.
+
+    It makes parallel route requests to the OSRM server and returns the distance and
+    duration of the fastest route for each row. Rows that could not be routed are NaN.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        df (pd.DataFrame): A dataframe of origin-destination pairs.
+        origin_cols (list, optional): The origin latitude and longitude column names.
+            Default is ('o_lat', 'o_lon').
+        dest_cols (list, optional): The destination latitude and longitude column names.
+            Default is ('d_lat', 'd_lon').
+        geometry (bool, optional): Also return the route geometry. Default is False, which
+            asks the server for no geometry at all.
+        precision (int, optional): Round the coordinates to this many decimal places before
+            routing. Default is None, which sends them as they are.
+        dedupe (bool, optional): Route each distinct origin-destination pair only once and
+            copy the result to every row with that pair. Default is False.
+        mode (str, optional): The mode of transportation. One of driving, walking, cycling.
+        geometries (str, optional): Returned route geometry format as polyline,
+            polyline6, geojson. Default is polyline.
+        concurrency (ConcurrentRequests, optional): The ConcurrentRequests object used to
+            send the requests. Defaults to a new one with default settings.
+
+    Returns:
+        pd.DataFrame: A dataframe with distance, duration, and optionally geometry columns
+            and the same index as df.
+    """
+
+    # Set default kwargs, skipping anything the server does not need to compute
+    defaults = {
+        'mode': 'driving',
+        'geometries': 'polyline',
+        'annotations': False,
+        'overview': None if geometry else 'false'
+    }
+    for key, value in defaults.items():
+        kwargs.setdefault(key, value)
+
+    # Assert host and port exist
+    assert 'host' in kwargs, 'Missing host in kwargs specified in route_df'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in route_df'
+    assert isinstance(df, pd.DataFrame), 'df must be a pandas DataFrame'
+
+    concurrency = kwargs.pop('concurrency', None) or ConcurrentRequests()
+
+    origins = quantize(df[list(origin_cols)].to_numpy(dtype=float), precision)
+    destinations = quantize(df[list(dest_cols)].to_numpy(dtype=float), precision)
+
+    # Only send each distinct pair, and remember which one every row maps to
+    inverse = None
+    if dedupe:
+        pairs, inverse = dedupe_rows(np.hstack([origins, destinations]))
+        origins, destinations = pairs[:, :2], pairs[:, 2:]
+
+    urls = _route_urls(origins, destinations, **kwargs)
+
+    # Preallocate the output columns and fill them as responses arrive
+    distance = np.full(len(origins), np.nan)
+    duration = np.full(len(origins), np.nan)
+    geometries = np.empty(len(origins), dtype=object)
+
+    for i, response in concurrency.stream(urls):
+        routes = response.get('routes')
+        if response.get('code') != 'Ok' or not routes:
+            continue
+        distance[i] = routes[0]['distance']
+        duration[i] = routes[0]['duration']
+        if geometry:
+            geometries[i] = routes[0].get('geometry')
+
+    if len(concurrency.failures) > 0:
+        warnings.warn(f'{len(concurrency.failures)} route requests failed after retries')
+
+    columns = {'distance': distance, 'duration': duration}
+    if geometry:
+        columns['geometry'] = geometries
+
+    # Scatter the results of the distinct pairs back to all rows
+    if inverse is not None:
+        columns = {key: values[inverse] for key, values in columns.items()}
+
+    return pd.DataFrame(columns, index=df.index)
@@ -0,0 +1,278 @@
+"""
+This module contains vectorized functions for thinning and simplifying GPS traces before
+map matching, and for interpolating results back onto the dropped points.
+
+All functions work on flat arrays of the points of many groups, sorted by group, with
+starts giving the first position of each group.
+"""
+import numpy as np
+from pyrouting.utils.coordinates import EARTH_RADIUS
+
+
+def _lengths(starts: np.ndarray, n: int) -> np.ndarray:
+    """
+    This is a helper function to get the number of points of each group.
+    """
+    return np.diff(np.append(starts, n))
+
+
+def local_xy(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Project coordinates to local planar metres with an equirectangular projection,
+    which is accurate enough over the extent of a single trace.
+
+    Args:
+        lat (np.ndarray): The latitudes in degrees.
+        lon (np.ndarray): The longitudes in degrees.
+
+    Returns:
+        np.ndarray: A (N, 2) array of (x, y) in metres.
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack([lon * np.cos(lat) * EARTH_RADIUS, lat * EARTH_RADIUS])
+
+
+def cumulative_distance(xy: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Get the distance travelled along each group up to each point.
+
+    Args:
+        xy (np.ndarray): A (N, 2) array of planar coordinates in metres.
+        starts (np.ndarray): The first position of each group.
+
+    Returns:
+        np.ndarray: The distance in metres from the group's first point, per point.
+    """
+    step = np.zeros(len(xy))
+    step[1:] = np.hypot(*(xy[1:] - xy[:-1]).T)
+    step[starts] = 0.0
+
+    total = np.cumsum(step)
+    return total - np.repeat(total[starts], _lengths(starts, len(xy)))
+
+
+def _thin_along(along: np.ndarray, starts: np.ndarray, step: float) -> np.ndarray:
+    """
+    This is a helper function to keep points at least step apart along a monotonic
+    position, e.g. time or distance travelled, keeping the first and last of every group.
+
+    The greedy rule keeps the first point and then each first point at least step after
+    the last kept one. Every point's successor under that rule is found at once with a
+    binary search, and the chains from the group starts are followed by pointer doubling,
+    so it takes a logarithmic number of rounds rather than a scan.
+    """
+    n = len(along)
+    lengths = _lengths(starts, n)
+    stops = np.repeat(starts + lengths, lengths)
+
+    # Offset the groups so the positions increase across groups, with gaps wider than step
+    relative = along - np.repeat(along[starts], lengths)
+    spans = relative[starts + lengths - 1] if n > 0 else relative[:0]
+    base = np.cumsum(spans + 2 * step) - (spans + 2 * step)
+    position = relative + np.repeat(base, lengths)
+
+    # The successor of each point, or n past the end of its group
+    successor = np.searchsorted(position, position + step)
+    jump = np.append(np.where(successor < stops, successor, n), n)
+
+    reached = np.zeros(n + 1, dtype=bool)
+    reached[starts] = True
+    while True:
+        more = reached.copy()
+        more[jump[reached]] = True
+        if (more == reached).all():
+            break
+        reached = more
+        jump = jump[jump]
+
+    keep = reached[:n]
+    keep[starts + lengths - 1] = True
+    return keep
+
+
+def thin(
+    xy: np.ndarray,
+    timestamps: np.ndarray | None,
+    starts: np.ndarray,
+    min_distance: float | None = None,
+    min_interval: float | None = None
+) -> np.ndarray:
+    """
+    Drop points that follow a kept point too closely in time or distance.
+
+    Points are kept at least min_interval seconds and min_distance metres travelled after
+    the previous kept point. The interval is applied first, then the distance along the
+    remaining points. The first and last point of every group are always kept.
+
+    Args:
+        xy (np.ndarray): A (N, 2) array of planar coordinates in metres.
+        timestamps (np.ndarray, optional): The integer timestamps in seconds.
+        starts (np.ndarray): The first position of each group.
+        min_distance (float, optional): The minimum distance between points in metres.
+        min_interval (float, optional): The minimum interval between points in seconds.
+
+    Returns:
+        np.ndarray: A boolean mask of the kept points.
+    """
+    n = len(xy)
+    keep = np.ones(n, dtype=bool)
+    if n == 0:
+        return keep
+
+    if min_interval:
+        assert timestamps is not None, 'min_interval needs a timestamp column'
+        keep &= _thin_along(np.asarray(timestamps, dtype=float), starts, min_interval)
+
+    if min_distance:
+        # Measure the distance along the points kept so far
+        positions = np.flatnonzero(keep)
+        sub_starts = np.searchsorted(positions, starts)
+        travelled = cumulative_distance(xy[positions], sub_starts)
+        keep[positions] = _thin_along(travelled, sub_starts, min_distance)
+
+    return keep
+
+
+def douglas_peucker(
+    xy: np.ndarray,
+    starts: np.ndarray,
+    tolerance: float,
+    keep: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Simplify every group with the Douglas-Peucker algorithm.
+
+    The recursion is run breadth-first on all groups at once. Each round finds the point
+    furthest from its segment for every open segment, and splits the segments whose
+    furthest point is more than tolerance away, so the number of rounds is the depth of
+    the recursion rather than the number of points.
+
+    Args:
+        xy (np.ndarray): A (N, 2) array of planar coordinates in metres.
+        starts (np.ndarray): The first position of each group.
+        tolerance (float): The largest distance in metres a dropped point may be from the
+            simplified line.
+        keep (np.ndarray, optional): A boolean mask of the points to simplify, e.g. from
+            thin. Defaults to all points.
+
+    Returns:
+        np.ndarray: A boolean mask of the kept points.
+    """
+    n = len(xy)
+    positions = np.arange(n) if keep is None else np.flatnonzero(keep)
+    sub_starts = np.searchsorted(positions, starts)
+    points = xy[positions]
+
+    out = np.zeros(len(points), dtype=bool)
+    ends = np.append(sub_starts[1:], len(points)) - 1
+    nonempty = ends >= sub_starts
+    out[sub_starts[nonempty]] = True
+    out[ends[nonempty]] = True
+
+    a, b = sub_starts[nonempty], ends[nonempty]
+    while True:
+        inner = b - a - 1
+        a, b, inner = a[inner > 0], b[inner > 0], inner[inner > 0]
+        if len(a) == 0:
+            break
+
+        # The interior points of every open segment, flattened
+        segment = np.repeat(np.arange(len(a)), inner)
+        first = np.cumsum(inner) - inner
+        index = np.arange(inner.sum()) - np.repeat(first, inner) + np.repeat(a + 1, inner)
+
+        # Distance of each interior point to its segment
+        p, q = points[a][segment], points[b][segment]
+        d = q - p
+        norm = np.einsum('ij,ij->i', d, d)
+        along = np.einsum('ij,ij->i', points[index] - p, d)
+        frac = np.clip(np.divide(along, norm, out=np.zeros_like(along), where=norm > 0), 0, 1)
+        dist = np.hypot(*(points[index] - p - frac[:, None] * d).T)
+
+        # The furthest interior point of each segment
+        order = np.lexsort((dist, segment))
+        last = order[np.cumsum(inner) - 1]
+        split = dist[last] > tolerance
+        mid = index[last][split]
+        out[mid] = True
+
+        a = np.concatenate([a[split], mid])
+        b = np.concatenate([mid, b[split]])
+
+    mask = np.zeros(n, dtype=bool)
+    mask[positions[out]] = True
+    return mask
+
+
+def simplify_mask(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    timestamps: np.ndarray | None,
+    starts: np.ndarray,
+    min_distance: float | None = None,
+    min_interval: float | None = None,
+    tolerance: float | None = None
+) -> np.ndarray:
+    """
+    Thin and then simplify many traces at once.
+
+    Args:
+        lat (np.ndarray): The latitudes, sorted by group.
+        lon (np.ndarray): The longitudes, sorted by group.
+        timestamps (np.ndarray, optional): The integer timestamps in seconds.
+        starts (np.ndarray): The first position of each group.
+        min_distance (float, optional): The minimum distance between points in metres.
+        min_interval (float, optional): The minimum interval between points in seconds.
+        tolerance (float, optional): The Douglas-Peucker tolerance in metres.
+
+    Returns:
+        np.ndarray: A boolean mask of the kept points.
+    """
+    xy = local_xy(lat, lon)
+    keep = thin(xy, timestamps, starts, min_distance, min_interval)
+    if tolerance:
+        keep = douglas_peucker(xy, starts, tolerance, keep)
+    return keep
+
+
+def interpolate_dropped(
+    values: np.ndarray,
+    keep: np.ndarray,
+    weights: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Fill in values for the dropped points by interpolating between the kept points on
+    either side, e.g. the snapped locations of the tracepoints.
+
+    The first and last point of every group are kept, so the kept points on either side of
+    a dropped point always belong to its group.
+
+    Args:
+        values (np.ndarray): A (K,) or (K, D) array of values at the kept points.
+        keep (np.ndarray): The boolean mask of the kept points, of length N.
+        weights (np.ndarray, optional): A position along the trace for every point, e.g.
+            the cumulative distance or timestamp. Defaults to the point number.
+
+    Returns:
+        np.ndarray: A (N,) or (N, D) array of values at every point.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(keep)
+    if n == 0:
+        return values.reshape((0, *values.shape[1:]))
+
+    weights = np.arange(n, dtype=float) if weights is None else np.asarray(weights, dtype=float)
+
+    # The rank among the kept points of the kept point before and after each point
+    rank = np.cumsum(keep) - 1
+    before = np.maximum(rank, 0)
+    after = np.minimum(rank + ~keep, len(values) - 1)
+
+    kept_weights = weights[keep]
+    span = kept_weights[after] - kept_weights[before]
+    frac = np.divide(weights - kept_weights[before], span, out=np.zeros(n), where=span > 0)
+    if values.ndim > 1:
+        frac = frac[:, None]
+
+    return values[before] + frac * (values[after] - values[before])
@@ -0,0 +1,195 @@
+"""
+This module contains functions for splitting long traces into overlapping windows
+and stitching the windowed match responses back into one response per trace.
+"""
+import numpy as np
+from pyrouting.osrm import osrm_polyline
+
+
+def window_bounds(n: int, size: int, overlap: int) -> list[tuple[int, int]]:
+    """
+    Split n points into windows of at most size points, each overlapping the previous one.
+
+    Args:
+        n (int): The number of points.
+        size (int): The maximum number of points per window.
+        overlap (int): The number of points shared by consecutive windows.
+
+    Returns:
+        list: A list of (start, stop) bounds.
+    """
+    assert size > overlap, 'window size must be larger than the overlap'
+
+    bounds = []
+    start = 0
+    while True:
+        stop = min(start + size, n)
+        bounds.append((start, stop))
+        if stop >= n:
+            return bounds
+        start = stop - overlap
+
+
+def _coords(geometry: str | dict | None, geometries: str) -> np.ndarray | None:
+    """
+    This is a helper function to get a geometry as a (N, 2) array of (lon, lat).
+    """
+    if geometry is None:
+        return None
+    if geometries == 'geojson':
+        return np.asarray(geometry['coordinates'], dtype=float)
+    precision = 6 if geometries == 'polyline6' else 5
+    return osrm_polyline.decode(geometry, precision)[:, ::-1]
+
+
+def _geometry(coords: np.ndarray, geometries: str) -> str | dict:
+    """
+    This is a helper function to turn a (N, 2) array of (lon, lat) back into a geometry.
+    """
+    if geometries == 'geojson':
+        return {'type': 'LineString', 'coordinates': coords.tolist()}
+    precision = 6 if geometries == 'polyline6' else 5
+    return osrm_polyline.encode(coords[:, ::-1], precision)
+
+
+def _nearest(coords: np.ndarray, location: list, start: int = 0) -> int:
+    """
+    This is a helper function to find the geometry vertex nearest to a snapped location.
+    """
+    return start + int(np.argmin(((coords[start:] - location) ** 2).sum(axis=1)))
+
+
+def _pieces(response: dict, start: int, lo: int, hi: int, geometries: str) -> list[dict]:
+    """
+    This is a helper function to cut the part of each matching owned by a window.
+
+    A window owns the input points in [lo, hi). Each piece holds the legs between owned
+    points, plus a tail leg from the last owned point to the next window's first point,
+    which is only kept if the next piece carries on from there.
+    """
+    pieces = []
+    tracepoints = response['tracepoints']
+
+    for m, matching in enumerate(response['matchings']):
+        # Local tracepoint positions of this matching keyed by waypoint index
+        points = {
+            tp['waypoint_index']: j for j, tp in enumerate(tracepoints)
+            if tp is not None and tp['matchings_index'] == m
+        }
+        owned = sorted(w for w, j in points.items() if lo <= start + j < hi)
+        if len(owned) == 0:
+            continue
+
+        legs = matching.get('legs', [])
+        last = owned[-1]
+        has_tail = last + 1 in points and last < len(legs)
+        coords = _coords(matching.get('geometry'), geometries)
+
+        piece = {
+            'first': start + points[owned[0]],
+            'end': start + points[last + 1] if has_tail else None,
+            'confidence': matching.get('confidence', 0.0),
+            'weight_name': matching.get('weight_name'),
+            'tracepoints': [(start + points[w], tracepoints[points[w]]) for w in owned],
+            'legs': [legs[w] for w in owned[:-1] if w < len(legs)],
+            'tail': legs[last] if has_tail else None,
+            'coords': None,
+            'tail_coords': None
+        }
+
+        if coords is not None:
+            i_first = _nearest(coords, tracepoints[points[owned[0]]]['location'])
+            i_last = _nearest(coords, tracepoints[points[last]]['location'], i_first)
+            piece['coords'] = coords[i_first:i_last + 1]
+            if has_tail:
+                i_end = _nearest(coords, tracepoints[points[last + 1]]['location'], i_last)
+                piece['tail_coords'] = coords[i_last:i_end + 1]
+
+        pieces.append(piece)
+
+    return pieces
+
+
+def _merge(pieces: list[dict], geometries: str) -> dict:
+    """
+    This is a helper function to merge a chain of pieces into a single matching.
+    """
+    legs = []
+    coords = []
+    for k, piece in enumerate(pieces):
+        legs += piece['legs']
+        if piece['coords'] is not None:
+            coords.append(piece['coords'] if k == 0 else piece['coords'][1:])
+        if k < len(pieces) - 1:
+            legs.append(piece['tail'])
+            if piece['tail_coords'] is not None:
+                coords.append(piece['tail_coords'][1:])
+
+    # Confidence is averaged over the points each piece contributed
+    sizes = np.array([len(p['tracepoints']) for p in pieces])
+    confidence = np.array([p['confidence'] for p in pieces])
+
+    matching = {
+        'confidence': float((sizes * confidence).sum() / sizes.sum()),
+        'distance': sum(leg.get('distance', 0) for leg in legs),
+        'duration': sum(leg.get('duration', 0) for leg in legs),
+        'weight': sum(leg.get('weight', 0) for leg in legs),
+        'weight_name': pieces[0]['weight_name'],
+        'legs': legs
+    }
+    if len(coords) > 0:
+        matching['geometry'] = _geometry(np.concatenate(coords), geometries)
+
+    return matching
+
+
+def stitch_windows(
+    responses: list[dict],
+    bounds: list[tuple[int, int]],
+    overlap: int,
+    geometries: str = 'polyline'
+) -> dict:
+    """
+    Stitch the match responses of overlapping windows into one response for the whole trace.
+
+    Each input point is owned by exactly one window, with the seam halfway through each
+    overlap. Matchings that run across a seam are joined into one matching, summing the
+    distance, duration, and weight of the kept legs and averaging the confidence over the
+    points each window contributed. Tracepoints are renumbered to the stitched matchings.
+
+    Args:
+        responses (list): The match responses, one per window in order.
+        bounds (list): The (start, stop) bounds of each window as from window_bounds.
+        overlap (int): The number of points shared by consecutive windows.
+        geometries (str, optional): The geometry format of the responses. Default is polyline.
+
+    Returns:
+        dict: A match response covering all points of the trace.
+    """
+    n = bounds[-1][1]
+    owned = [start + (overlap // 2 if k > 0 else 0) for k, (start, _) in enumerate(bounds)]
+    owned.append(n)
+
+    # Chain pieces that carry on from where the previous one's tail ended
+    chains: list[list[dict]] = []
+    for k, (response, (start, _)) in enumerate(zip(responses, bounds)):
+        if response.get('code') != 'Ok':
+            continue
+        for piece in _pieces(response, start, owned[k], owned[k + 1], geometries):
+            if chains and chains[-1][-1]['end'] == piece['first']:
+                chains[-1].append(piece)
+            else:
+                chains.append([piece])
+
+    tracepoints: list[dict | None] = [None] * n
+    matchings = []
+    for m, chain in enumerate(chains):
+        matchings.append(_merge(chain, geometries))
+        waypoints = [tp for piece in chain for tp in piece['tracepoints']]
+        for w, (i, tp) in enumerate(waypoints):
+            tracepoints[i] = {**tp, 'matchings_index': m, 'waypoint_index': w}
+
+    if len(matchings) == 0:
+        return {'code': 'NoMatch', 'matchings': [], 'tracepoints': tracepoints}
+
+    return {'code': 'Ok', 'matchings': matchings, 'tracepoints': tracepoints}
@@ -0,0 +1,165 @@
+"""
+This module contains the out-of-core map matching function, which streams trip
+locations from Parquet or CSV files and writes the matches to a Parquet dataset.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator
+import json
+import os
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import osrm_matching
+from pyrouting.osrm import osrm_parallel
+from pyrouting.osrm import osrm_unpack
+from pyrouting.utils import ConcurrentRequests
+
+
+def read_chunks(path: str, chunksize: int, columns: list[str] | None = None) -> Iterator:
+    """
+    This function reads a Parquet file or dataset, or a CSV file, in chunks of rows.
+
+    Args:
+        path (str): A .csv file, or a Parquet file or directory of Parquet files.
+        chunksize (int): The number of rows per chunk.
+        columns (list, optional): The columns to read. Defaults to all.
+
+    Yields:
+        pd.DataFrame: A chunk of rows.
+    """
+    if path.endswith('.csv') or path.endswith('.csv.gz'):
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+        return
+
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format='parquet')
+    for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+def whole_groups(chunks: Iterator, group_col: str) -> Iterator:
+    """
+    This function regroups chunks of rows so that no group is split across chunks.
+
+    The rows of the last group in each chunk are held back and prepended to the next chunk.
+    The input must have the rows of each group next to each other, as in a dump sorted by
+    group_col.
+
+    Args:
+        chunks (Iterator): Chunks of rows as DataFrames.
+        group_col (str): The column name to group the rows by.
+
+    Yields:
+        pd.DataFrame: Chunks of rows holding only whole groups.
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+
+        # Hold back the last group since it may continue in the next chunk
+        keys = chunk[group_col].to_numpy()
+        tail = len(keys) - np.argmax(keys[::-1] != keys[-1]) if (keys != keys[-1]).any() else 0
+        carry = chunk.iloc[tail:]
+        if tail > 0:
+            yield chunk.iloc[:tail]
+
+    if carry is not None and len(carry) > 0:
+        yield carry
+
+
+def _to_parquet(df: pd.DataFrame, path: str) -> None:
+    """
+    This is a helper function to write a DataFrame of matches as a Parquet file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # GeoJSON geometries and other nested values are stored as JSON strings
+    for col in df.columns:
+        if df[col].dtype == object and df[col].map(lambda v: isinstance(v, dict | list)).any():
+            df[col] = df[col].map(lambda v: v if v is None else json.dumps(v))
+
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def match_file(
+    path: str,
+    output: str,
+    group_col: str,
+    unpack: list[str] | None = None,
+    chunksize: int = 500000,
+    renames: dict[str, str] | None = None,
+    workers: int | Executor | None = None,
+    **kwargs
+) -> int:
+    """
+    Map match trip location points from files too large for memory.
+
+    The input is read in chunks, regrouped so that trips are never split, and each chunk
+    is matched with match_df. The unpacked results of each chunk are written as a new
+    part file of a Parquet dataset as soon as it is done, so peak memory depends on the
+    chunk size and not on the size of the input.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        path (str): A .csv file, or a Parquet file or directory of Parquet files, with the
+            rows of each group next to each other.
+        output (str): The directory of the output Parquet dataset.
+        group_col (str): The column name to group the rows by.
+        unpack (list, optional): The matching attributes to write. Defaults to confidence,
+            distance, duration, and geometry.
+        chunksize (int, optional): The number of rows read at a time. Default is 500000.
+        renames (dict, optional): A dictionary of column renames for lat, lon, and timestamp.
+        workers (int | Executor, optional): Parse and unpack the responses in a process pool
+            with this many workers, or in this executor. Default is None, which unpacks them
+            in this process.
+        **kwargs: Other keyword arguments for match_df.
+
+    Returns:
+        int: The number of groups written.
+    """
+    if unpack is None:
+        unpack = ['confidence', 'distance', 'duration', 'geometry']
+
+    # Assert host and port exist
+    assert 'host' in kwargs, 'Missing host in kwargs specified in match_file'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in match_file'
+
+    # Only ask the server for what is unpacked
+    for key, value in osrm_unpack.request_options(unpack).items():
+        kwargs.setdefault(key, value)
+
+    kwargs.setdefault('concurrency', ConcurrentRequests())
+    os.makedirs(output, exist_ok=True)
+
+    # Renaming happens per chunk, so the group column is looked up by its input name
+    input_group_col = {v: k for k, v in (renames or {}).items()}.get(group_col, group_col)
+
+    # One pool is shared by all chunks
+    executor = workers
+    if workers is not None and not isinstance(workers, Executor):
+        executor = ProcessPoolExecutor(workers)
+
+    written = 0
+    chunks = whole_groups(read_chunks(path, chunksize), input_group_col)
+    try:
+        for part, chunk in enumerate(chunks):
+            if workers is not None:
+                matches = osrm_parallel.match_unpack(
+                    chunk, unpack, renames, group_col, executor, **kwargs
+                )
+                matches = matches.rename_axis(group_col).reset_index()
+            else:
+                response = osrm_matching.match_df(chunk, renames, group_col, **kwargs)
+                columns = osrm_unpack.unpack_matches(response.values(), unpack, len(response))
+                matches = pd.DataFrame({group_col: list(response.keys()), **columns})
+
+            _to_parquet(matches, os.path.join(output, f'part-{part:05d}.parquet'))
+            written += len(matches)
+    finally:
+        if executor is not workers:
+            executor.shutdown()
+
+    return written
@@ -0,0 +1,422 @@
+"""
+This module contains the tiled many-to-many table function for the OSRM API.
+"""
+from typing import Iterator
+import os
+import warnings
+import numpy as np
+from pyrouting.osrm import osrm_urls
+from pyrouting.utils import ConcurrentRequests, PairCache, dedupe_rows, haversine, quantize
+
+
+def _tile_slices(n: int, size: int) -> list[slice]:
+    """
+    This is a helper function to split n items into consecutive slices of a given size.
+
+    Args:
+        n (int): The number of items.
+        size (int): The maximum number of items in each slice.
+
+    Returns:
+        list: A list of slices covering range(n).
+    """
+    return [slice(i, min(i + size, n)) for i in range(0, n, size)]
+
+
+def build_tile_urls(
+    sources: np.ndarray,
+    destinations: np.ndarray,
+    tile: int | tuple[int, int],
+    **kwargs
+) -> tuple[list[tuple[slice, slice]], Iterator]:
+    """
+    This function splits an NxM table into source/destination tiles and constructs
+    a table URL for each tile.
+
+    Each URL holds the tile's source coordinates followed by its destination coordinates,
+    with the sources and destinations arguments pointing to the two halves.
+
+    Args:
+        sources (np.ndarray): An array of source coordinates with shape (N, 2).
+        destinations (np.ndarray): An array of destination coordinates with shape (M, 2).
+        tile (int | tuple): The tile size as a single int or (source rows, destination cols).
+
+    Returns:
+        tuple: A list of (row slice, col slice) tiles and a generator of URLs.
+    """
+
+    if isinstance(tile, int):
+        tile = (tile, tile)
+
+    tiles = [
+        (rows, cols)
+        for rows in _tile_slices(len(sources), tile[0])
+        for cols in _tile_slices(len(destinations), tile[1])
+    ]
+
+    def _url_generator():
+        for rows, cols in tiles:
+            n_src = rows.stop - rows.start
+            n_dst = cols.stop - cols.start
+            url_kwargs = {
+                **kwargs,
+                **{
+                    'coordinates': np.concatenate([sources[rows], destinations[cols]]),
+                    'sources': range(n_src),
+                    'destinations': range(n_src, n_src + n_dst)
+                }
+            }
+            yield osrm_urls.table_url(**url_kwargs)
+
+    return tiles, _url_generator()
+
+
+def _allocate(shape: tuple[int, int], name: str, memmap_dir: str | None) -> np.ndarray:
+    """
+    This is a helper function to allocate a NaN filled float32 array, optionally memory-mapped.
+
+    Args:
+        shape (tuple): The shape of the array.
+        name (str): The name of the array, used as the file name if memory-mapped.
+        memmap_dir (str | None): The directory for the .npy file, or None for an in-memory array.
+
+    Returns:
+        np.ndarray: The allocated array.
+    """
+    if memmap_dir is None:
+        return np.full(shape, np.nan, dtype=np.float32)
+
+    os.makedirs(memmap_dir, exist_ok=True)
+    arr = np.lib.format.open_memmap(
+        os.path.join(memmap_dir, f'{name}.npy'), mode='w+', dtype=np.float32, shape=shape
+    )
+    arr[:] = np.nan
+    return arr
+
+
+def _fill(
+    out: dict[str, np.ndarray],
+    sources: np.ndarray,
+    destinations: np.ndarray,
+    tile: int | tuple[int, int],
+    concurrency: ConcurrentRequests,
+    **kwargs
+) -> list[tuple[slice, slice]]:
+    """
+    This is a helper function to request the tiles and write each one into place as it
+    arrives rather than holding the responses.
+
+    Returns:
+        list: The (row slice, col slice) of the tiles that failed.
+    """
+    tiles, urls = build_tile_urls(sources, destinations, tile, **kwargs)
+    failed = []
+
+    for i, response in concurrency.stream(urls):
+        if response.get('code') != 'Ok':
+            failed.append(tiles[i])
+            continue
+        rows, cols = tiles[i]
+        for key, arr in out.items():
+            arr[rows, cols] = np.array(response[key], dtype=np.float32)
+
+    if len(failed) > 0:
+        warnings.warn(f'{len(failed)} of {len(tiles)} table tiles failed and are left as NaN')
+
+    return failed
+
+
+def _plan_missing(found: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    This is a helper function to cover the missing cells of a table with few blocks.
+
+    Rows with nothing stored, e.g. added or moved sources, are requested against every
+    column they miss. The remaining missing cells, e.g. added or moved destinations, are
+    requested as a block of the rows and columns they are in.
+
+    Returns:
+        list: The (row indices, column indices) of each block to request.
+    """
+    missing = ~found
+    blocks = []
+
+    new_rows = np.flatnonzero(missing.all(axis=1)) if found.shape[1] > 0 else np.arange(0)
+    if len(new_rows) > 0:
+        blocks.append((new_rows, np.flatnonzero(missing[new_rows].any(axis=0))))
+
+    missing[new_rows] = False
+    rows = np.flatnonzero(missing.any(axis=1))
+    if len(rows) > 0:
+        blocks.append((rows, np.flatnonzero(missing[rows].any(axis=0))))
+
+    return blocks
+
+
+def _fill_cached(
+    out: dict[str, np.ndarray],
+    sources: np.ndarray,
+    destinations: np.ndarray,
+    tile: int | tuple[int, int],
+    concurrency: ConcurrentRequests,
+    pair_cache: PairCache,
+    **kwargs
+) -> None:
+    """
+    This is a helper function to fill the table from the pair cache, request the blocks of
+    missing cells, and store them in the cache.
+    """
+    profile = kwargs.get('mode', 'driving')
+
+    found = np.ones(next(iter(out.values())).shape, dtype=bool)
+    for key, arr in out.items():
+        found &= pair_cache.lookup(sources, destinations, profile, key, arr)
+
+    for rows, cols in _plan_missing(found):
+        block = {key: _allocate((len(rows), len(cols)), key, None) for key in out}
+        failed = _fill(block, sources[rows], destinations[cols], tile, concurrency, **kwargs)
+
+        # Failed tiles are left out of the cache so they are requested again
+        ok = np.ones((len(rows), len(cols)), dtype=bool)
+        for tile_rows, tile_cols in failed:
+            ok[tile_rows, tile_cols] = False
+
+        for key, arr in block.items():
+            out[key][np.ix_(rows, cols)] = arr
+            pair_cache.update(sources[rows], destinations[cols], profile, key, arr, ok)
+
+
+def table_matrix(
+    sources: list[tuple] | np.ndarray,
+    destinations: list[tuple] | np.ndarray | None = None,
+    tile: int | tuple[int, int] = 100,
+    memmap_dir: str | None = None,
+    precision: int | None = None,
+    dedupe: bool = False,
+    pair_cache: PairCache | None = None,
+    **kwargs
+) -> dict[str, np.ndarray]:
+    """
+    Assemble a large origin-destination matrix from concurrent tiled table requests.
+
+    The NxM problem is split into tiles small enough for the server's --max-table-size,
+    and each tile response is written straight into a preallocated float32 array.
+    Unreachable pairs and failed tiles are left as NaN.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        sources (list): A list of source coordinates in the same form as table_url coordinates.
+        destinations (list, optional): A list of destination coordinates. Defaults to sources.
+        tile (int | tuple, optional): The tile size as a single int or
+            (source rows, destination cols). Default is 100.
+        memmap_dir (str, optional): If given, the arrays are memory-mapped .npy files
+            named after the annotation in this directory.
+        precision (int, optional): Round the coordinates to this many decimal places.
+            Default is None, which sends them as they are.
+        dedupe (bool, optional): Request each distinct source and destination only once
+            and copy the results to the duplicate rows and columns. Default is False.
+        pair_cache (PairCache, optional): Take the pairs it holds from this store, only
+            request the rows and columns with missing pairs, and store the new pairs. With
+            dedupe, only the distinct coordinates are looked up.
+        mode (str, optional): The mode of transportation. One of driving, walking, cycling.
+        annotations (str, optional): Which table(s) to return. One of duration, distance,
+            or duration,distance. Default is duration.
+        concurrency (ConcurrentRequests, optional): The ConcurrentRequests object used to
+            send the tiles. Defaults to a new one with default settings.
+
+    Returns:
+        dict: A dictionary of (N, M) float32 arrays keyed by 'durations' and/or 'distances'.
+    """
+
+    # Set default kwargs
+    kwargs.setdefault('annotations', 'duration')
+    concurrency = kwargs.pop('concurrency', None) or ConcurrentRequests()
+
+    # Assert host and port exist
+    assert 'host' in kwargs, 'Missing host in kwargs specified in table_matrix'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in table_matrix'
+
+    sources = quantize(sources, precision)
+    destinations = sources if destinations is None else quantize(destinations, precision)
+
+    assert sources.ndim == 2 and sources.shape[1] == 2, 'sources must have shape (N, 2)'
+    assert destinations.ndim == 2 and destinations.shape[1] == 2, \
+        'destinations must have shape (M, 2)'
+
+    # Preallocate the output arrays, one per requested annotation
+    shape = (len(sources), len(destinations))
+    keys = [f'{a}s' for a in kwargs['annotations'].split(',')]
+    out = {key: _allocate(shape, key, memmap_dir) for key in keys}
+
+    def fill(target, rows, cols):
+        if pair_cache is None:
+            _fill(target, rows, cols, tile, concurrency, **kwargs)
+        else:
+            _fill_cached(target, rows, cols, tile, concurrency, pair_cache, **kwargs)
+
+    src, dst = sources, destinations
+    if dedupe:
+        src, src_inv = dedupe_rows(sources)
+        dst, dst_inv = (src, src_inv) if destinations is sources else dedupe_rows(destinations)
+
+    # Without duplicates the tiles are written straight into the output
+    if len(src) == len(sources) and len(dst) == len(destinations):
+        fill(out, sources, destinations)
+        return out
+
+    # Fill the smaller table of distinct coordinates, then copy it out to the duplicates
+    unique = {key: _allocate((len(src), len(dst)), f'{key}-unique', memmap_dir) for key in keys}
+    fill(unique, src, dst)
+
+    step = tile if isinstance(tile, int) else tile[0]
+    for key, arr in out.items():
+        for rows in _tile_slices(len(sources), step):
+            arr[rows] = unique[key][src_inv[rows]][:, dst_inv]
+
+    if memmap_dir is not None:
+        for key in keys:
+            del unique[key]
+            os.remove(os.path.join(memmap_dir, f'{key}-unique.npy'))
+
+    return out
+
+
+def _morton_order(coords: np.ndarray) -> np.ndarray:
+    """
+    This is a helper function to order coordinates along a Z-order curve, so consecutive
+    points, and so the tiles cut from them, are spatially compact.
+    """
+    if len(coords) == 0:
+        return np.arange(0)
+
+    low, high = coords.min(axis=0), coords.max(axis=0)
+    cells = ((coords - low) / np.maximum(high - low, 1e-12) * 65535).astype(np.uint64)
+
+    # Spread the 16 bits of each axis out to every other bit, then interleave them
+    spread = cells.copy()
+    for shift, mask in [(8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)]:
+        spread = (spread | (spread << np.uint64(shift))) & np.uint64(mask)
+    return np.argsort(spread[:, 0] << np.uint64(1) | spread[:, 1], kind='stable')
+
+
+def _tile_bounds(coords: np.ndarray, slices: list[slice]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    This is a helper function to get a centre and radius in metres enclosing each tile.
+    """
+    centres = np.array([coords[s].mean(axis=0) for s in slices]).reshape(-1, 2)
+    radii = np.array([haversine(coords[s], centres[i]).max() for i, s in enumerate(slices)])
+    return centres, radii
+
+
+def table_sparse(
+    sources: list[tuple] | np.ndarray,
+    destinations: list[tuple] | np.ndarray | None = None,
+    cutoff: float = 1800.0,
+    annotation: str = 'duration',
+    max_speed: float = 40.0,
+    tile: int | tuple[int, int] = 100,
+    precision: int | None = None,
+    **kwargs
+):
+    """
+    Find the origin-destination pairs within a travel budget, without the dense matrix.
+
+    No route can be shorter than the straight line, so pairs further apart than cutoff
+    metres, or than cutoff seconds at max_speed, cannot be within the budget. The points
+    are ordered along a Z-order curve and cut into compact tiles. Tile pairs whose
+    enclosing circles are too far apart are skipped without a request, and of the others
+    only the rows and columns with a candidate pair are requested.
+
+    Args:
+        host (str): The host URL.
+        port (int): The port number.
+        sources (list): A list of source coordinates in the same form as table_url coordinates.
+        destinations (list, optional): A list of destination coordinates. Defaults to sources.
+        cutoff (float, optional): Keep pairs with a duration in seconds, or a distance in
+            metres, of at most this. Default is 1800.
+        annotation (str, optional): duration or distance. Default is duration.
+        max_speed (float, optional): An upper bound on the travel speed in metres per second,
+            used to turn a duration cutoff into a straight-line distance. Default is 40.
+        tile (int | tuple, optional): The tile size as a single int or
+            (source rows, destination cols). Default is 100.
+        precision (int, optional): Round the coordinates to this many decimal places.
+            Default is None, which sends them as they are.
+        mode (str, optional): The mode of transportation. One of driving, walking, cycling.
+        concurrency (ConcurrentRequests, optional): The ConcurrentRequests object used to
+            send the tiles. Defaults to a new one with default settings.
+
+    Returns:
+        scipy.sparse.coo_array: An (N, M) float32 array of the pairs within the cutoff.
+    """
+    from scipy import sparse
+
+    assert annotation in ['duration', 'distance'], 'annotation must be duration or distance'
+    assert 'host' in kwargs, 'Missing host in kwargs specified in table_sparse'
+    assert 'port' in kwargs, 'Missing port in kwargs specified in table_sparse'
+
+    concurrency = kwargs.pop('concurrency', None) or ConcurrentRequests()
+    kwargs['annotations'] = annotation
+    key = f'{annotation}s'
+
+    sources = quantize(sources, precision)
+    destinations = sources if destinations is None else quantize(destinations, precision)
+    shape = (len(sources), len(destinations))
+    bound = cutoff * max_speed if annotation == 'duration' else cutoff
+
+    # Cut spatially compact tiles
+    rows, cols = (tile, tile) if isinstance(tile, int) else tile
+    src_order = _morton_order(sources)
+    dst_order = src_order if destinations is sources else _morton_order(destinations)
+    src, dst = sources[src_order], destinations[dst_order]
+    src_tiles = _tile_slices(len(src), rows)
+    dst_tiles = _tile_slices(len(dst), cols)
+
+    # Skip the tile pairs whose enclosing circles are further apart than the bound
+    src_centres, src_radii = _tile_bounds(src, src_tiles)
+    dst_centres, dst_radii = _tile_bounds(dst, dst_tiles)
+    gap = haversine(src_centres[:, None], dst_centres[None, :]) \
+        - src_radii[:, None] - dst_radii[None, :]
+    candidates = np.argwhere(gap <= bound)
+
+    # Of each candidate tile pair, only request the rows and columns with a candidate pair
+    blocks = []
+    for i, j in candidates:
+        a, b = src_tiles[i], dst_tiles[j]
+        near = haversine(src[a][:, None], dst[b][None, :]) <= bound
+        block_rows = np.flatnonzero(near.any(axis=1)) + a.start
+        block_cols = np.flatnonzero(near.any(axis=0)) + b.start
+        if len(block_rows) > 0:
+            blocks.append((block_rows, block_cols))
+
+    def _url_generator():
+        for block_rows, block_cols in blocks:
+            n_src = len(block_rows)
+            yield osrm_urls.table_url(**{
+                **kwargs,
+                'coordinates': np.concatenate([src[block_rows], dst[block_cols]]),
+                'sources': range(n_src),
+                'destinations': range(n_src, n_src + len(block_cols))
+            })
+
+    found_rows, found_cols, values = [], [], []
+    failed = 0
+    for i, response in concurrency.stream(_url_generator()):
+        if response.get('code') != 'Ok':
+            failed += 1
+            continue
+        block = np.array(response[key], dtype=np.float32)
+        r, c = np.nonzero(block <= cutoff)
+        found_rows.append(src_order[blocks[i][0][r]])
+        found_cols.append(dst_order[blocks[i][1][c]])
+        values.append(block[r, c])
+
+    if failed > 0:
+        warnings.warn(f'{failed} of {len(blocks)} table blocks failed and are left out')
+
+    if len(values) == 0:
+        return sparse.coo_array(shape, dtype=np.float32)
+
+    return sparse.coo_array(
+        (np.concatenate(values), (np.concatenate(found_rows), np.concatenate(found_cols))),
+        shape=shape
+    )
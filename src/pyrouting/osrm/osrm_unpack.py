@@ -1,8 +1,50 @@
 """
 This module contains functions for unpacking the JSON response from the OSRM API.
 """
-from typing import Iterator
+from typing import Iterable, Iterator, Sequence
 import numpy as np
+import pandas as pd
+from pyrouting.osrm import osrm_matching
+from pyrouting.osrm import osrm_polyline
+from pyrouting.osrm import osrm_simplify
+from pyrouting.utils import timestamps_to_int
+from pyrouting.utils.fastjson import loads
+
+# Matching attributes that are unpacked into float columns
+NUMERIC_FIELDS = ['confidence', 'distance', 'duration', 'weight']
+
+# Matching attributes the server returns whatever the request options
+SUMMARY_FIELDS = NUMERIC_FIELDS + ['weight_name']
+
+# Match options for when only the tracepoints are needed
+TRACEPOINT_OPTIONS = {'steps': False, 'annotations': 'false', 'overview': 'false'}
+
+
+def request_options(unpack: list[str]) -> dict[str, str | bool]:
+    """
+    This function picks the cheapest match options that still return the unpacked attributes.
+
+    Without geometry the server skips the overview, and without legs it skips the
+    per-node annotations and steps, which are usually most of the response. The options
+    are meant as defaults, so anything the caller sets explicitly should take precedence.
+
+    Args:
+        unpack (list): A list of matching attributes to extract.
+
+    Returns:
+        dict: The annotations, overview, and steps options. Empty if unpack holds
+            attributes this function does not know about.
+    """
+    if any(key not in SUMMARY_FIELDS + ['geometry', 'legs'] for key in unpack):
+        return {}
+
+    options: dict[str, str | bool] = {'steps': False}
+    if 'legs' not in unpack:
+        options['annotations'] = 'false'
+    if 'geometry' not in unpack:
+        options['overview'] = 'false'
+
+    return options
 
 
 def _unpack(matchings, unpack) -> Iterator:
@@ -51,3 +93,248 @@ def unpack_match(response: dict, unpack: list[str]) -> Iterator:
 
     # If no matchings, return generator of None
     return _unpack({}, unpack)
+
+
+def unpack_matches(
+    responses: Iterable[dict | bytes],
+    unpack: list[str],
+    count: int | None = None
+) -> dict[str, np.ndarray]:
+    """
+    This function unpacks many match responses straight into preallocated columns.
+
+    Numeric attributes (confidence, distance, duration, weight) go into float64 arrays with
+    NaN for missing values, everything else into object arrays. As with unpack_match, the
+    highest confidence matching is used when there are several. Raw JSON bytes are parsed
+    with the fastest available parser.
+
+    Args:
+        responses (Iterable): The match responses as dictionaries or raw JSON bytes.
+        unpack (list): A list of matching attributes to extract.
+        count (int, optional): The number of responses, if responses is an iterator.
+
+    Returns:
+        dict: A dictionary of arrays keyed by attribute, one entry per response.
+    """
+    if count is None:
+        responses = list(responses)
+        count = len(responses)
+
+    columns = {
+        key: np.full(count, np.nan) if key in NUMERIC_FIELDS else np.empty(count, dtype=object)
+        for key in unpack
+    }
+
+    for i, response in enumerate(responses):
+        if isinstance(response, (bytes, str)):
+            response = loads(response)
+
+        matchings = response.get('matchings') or []
+        if len(matchings) == 0:
+            continue
+
+        best = matchings[0]
+        if len(matchings) > 1:
+            best = max(matchings, key=lambda m: m.get('confidence', 0))
+
+        for key, column in columns.items():
+            value = best.get(key)
+            if value is not None:
+                column[i] = value
+
+    return columns
+
+
+def unpack_geometry(
+    geometry: Sequence[str | dict | None],
+    geometries: str = 'polyline'
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    This function decodes a whole column of matching or route geometries into flat arrays.
+
+    Args:
+        geometry (Sequence): The geometry column, e.g. from unpack=['geometry'].
+        geometries (str, optional): The geometry format the server was asked for. One of
+            polyline, polyline6, geojson. Default is polyline.
+
+    Returns:
+        tuple: A (N, 2) float array of (lat, lon) coordinates and an offsets array, so that
+            the coordinates of row i are coords[offsets[i]:offsets[i + 1]].
+    """
+    if geometries == 'geojson':
+        return osrm_polyline.flatten_geojson(geometry)
+
+    precision = 6 if geometries == 'polyline6' else 5
+    return osrm_polyline.decode_many(geometry, precision)
+
+
+def unpack_match_df(
+    df: pd.DataFrame,
+    response: dict,
+    unpack: list[str],
+    geometries: str = 'polyline',
+    decode_geometry: bool = False
+) -> pd.DataFrame:
+    """
+    This function unpacks the match_df responses into columns alongside the input DataFrame.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame passed to match_df.
+        response (dict): The match responses keyed by group, as returned by match_df.
+        unpack (list): A list of matching attributes to extract.
+        geometries (str, optional): The geometry format the server was asked for.
+            Default is polyline.
+        decode_geometry (bool, optional): Replace the geometry strings with (N, 2) arrays of
+            (lat, lon) that are views into one flat decoded array. Default is False.
+
+    Returns:
+        pd.DataFrame: The input DataFrame concatenated with the unpacked columns.
+    """
+    columns = unpack_matches(response.values(), unpack, len(response))
+    matches_df = pd.DataFrame(columns, index=list(response.keys()))
+
+    if decode_geometry and 'geometry' in unpack:
+        coords, offsets = unpack_geometry(matches_df['geometry'], geometries)
+        matches_df['geometry'] = np.split(coords, offsets[1:-1])
+
+    # Concatenate the results with the original DataFrame
+    return pd.concat([df, matches_df], axis=1)
+
+
+def tracepoint_fields(tracepoints: list[dict | None]) -> dict[str, pd.Series]:
+    """
+    Pull every field out of a flat list of tracepoints at once.
+
+    Args:
+        tracepoints (list): The tracepoints of one or more responses. Unmatched points are
+            None.
+
+    Returns:
+        dict: Series of matched_lat, matched_lon, matchings_index, waypoint_index,
+            alternatives_count, snap_distance, and name, with NaN for unmatched points.
+    """
+    flat = pd.Series(tracepoints, dtype=object)
+    location = flat.str.get('location')
+    return {
+        'matched_lat': location.str.get(1),
+        'matched_lon': location.str.get(0),
+        'matchings_index': flat.str.get('matchings_index'),
+        'waypoint_index': flat.str.get('waypoint_index'),
+        'alternatives_count': flat.str.get('alternatives_count'),
+        'snap_distance': flat.str.get('distance'),
+        'name': flat.str.get('name')
+    }
+
+
+def unpack_tracepoints(
+    df: pd.DataFrame,
+    response: dict,
+    renames: dict[str, str] | None = None,
+    group_col: str | None = None,
+    interpolate: bool = True,
+    dt_format: str | None = osrm_matching.MATCH_DEFAULTS['dt_format']
+) -> pd.DataFrame:
+    """
+    This function unpacks the tracepoints of the match_df responses into one row per input
+    row, in the order and with the index of the input DataFrame.
+
+    Every matching is kept, so points of split traces keep their matchings_index rather than
+    only the best matching's points. Rows without a tracepoint, e.g. points the server
+    dropped as outliers, get NaN coordinates and -1 indices. The tracepoints are put back
+    with the same sort by group and timestamp that match_df sends the points in.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame passed to match_df.
+        response (dict): The match responses keyed by group, as returned by match_df, or a
+            single response if group_col is None.
+        renames (dict, optional): The column renames passed to match_df.
+        group_col (str, optional): The group column passed to match_df.
+        interpolate (bool, optional): Interpolate the snapped locations of rows dropped by
+            trace simplification from the kept rows on either side, along the distance
+            travelled. Default is True.
+        dt_format (str, optional): The dt_format passed to match_df.
+
+    Returns:
+        pd.DataFrame: The columns matched_lat, matched_lon, matchings_index, waypoint_index,
+            alternatives_count, snap_distance, and name, plus interpolated if any rows
+            were dropped by trace simplification.
+    """
+    responses = response if group_col is not None else {None: response}
+
+    # Sort the rows the way match_df does, remembering where each row came from
+    renamed = df.rename(columns=renames) if renames is not None else df
+    group = group_col if group_col is not None else '__group__'
+    data = {
+        group: renamed[group_col].to_numpy() if group_col is not None else 0,
+        'lat': renamed['lat'].to_numpy(),
+        'lon': renamed['lon'].to_numpy(),
+        '__row__': np.arange(len(renamed))
+    }
+    if 'timestamp' in renamed.columns:
+        data['timestamp'] = timestamps_to_int(renamed['timestamp'], dt_format)
+    points = osrm_matching.sort_groups(pd.DataFrame(data), group)
+    rows = points['__row__'].to_numpy()
+    keys, starts = np.unique(points[group].to_numpy(), return_index=True)
+    lengths = np.diff(np.append(starts, len(points)))
+
+    # Where each response's tracepoints go among the sorted rows
+    tracepoints = [r.get('tracepoints') or [] for r in responses.values()]
+    counts = np.array([len(t) for t in tracepoints], dtype=np.int64)
+    found = pd.Index(keys).get_indexer(
+        list(responses.keys()) if group_col is not None else [0]
+    )
+    local = np.concatenate([
+        np.asarray(r.get('tracepoint_rows', np.arange(c)), dtype=np.int64)
+        for r, c in zip(responses.values(), counts)
+    ]) if len(counts) > 0 else np.empty(0, dtype=np.int64)
+    sorted_at = np.repeat(starts[found] if len(found) > 0 else found, counts) + local
+    valid = np.repeat(found >= 0, counts)
+
+    fields = tracepoint_fields([tp for t in tracepoints for tp in t])
+
+    n = len(points)
+    columns = {}
+    for name, values in fields.items():
+        if name == 'name':
+            column = np.full(n, None, dtype=object)
+            column[sorted_at[valid]] = values.to_numpy(dtype=object)[valid]
+        else:
+            column = np.full(n, np.nan)
+            column[sorted_at[valid]] = values.to_numpy(dtype=float, na_value=np.nan)[valid]
+        columns[name] = column
+
+    # Fill in the rows that simplification dropped between kept rows of the same matching
+    simplified = any('tracepoint_rows' in r for r in responses.values())
+    if simplified:
+        sent = np.zeros(n, dtype=bool)
+        sent[sorted_at[valid]] = True
+        columns['interpolated'] = np.zeros(n, dtype=bool)
+        if interpolate and sent.any():
+            xy = osrm_simplify.local_xy(points['lat'].to_numpy(), points['lon'].to_numpy())
+            travelled = osrm_simplify.cumulative_distance(xy, starts)
+            kept = np.column_stack([columns['matched_lat'], columns['matched_lon']])[sent]
+            filled = osrm_simplify.interpolate_dropped(kept, sent, travelled)
+
+            # Only between kept rows of the same group and matching
+            rank = np.cumsum(sent) - 1
+            before = np.flatnonzero(sent)[np.maximum(rank, 0)]
+            after = np.flatnonzero(sent)[np.minimum(rank + ~sent, sent.sum() - 1)]
+            group_of = np.repeat(np.arange(len(starts)), lengths)
+            matching = columns['matchings_index']
+            same = ~sent & ~np.isnan(filled).any(axis=1) \
+                & (group_of[before] == group_of) & (group_of[after] == group_of) \
+                & (matching[before] == matching[after])
+
+            columns['matched_lat'][same] = filled[same, 0]
+            columns['matched_lon'][same] = filled[same, 1]
+            columns['matchings_index'][same] = matching[before][same]
+            columns['interpolated'] = same
+
+    # Integer indices with -1 for rows without a tracepoint
+    for name in ['matchings_index', 'waypoint_index', 'alternatives_count']:
+        columns[name] = np.nan_to_num(columns[name], nan=-1).astype(np.int64)
+
+    out = pd.DataFrame(columns)
+    out = out.iloc[np.argsort(rows, kind='stable')]
+    out.index = df.index
+    return out
@@ -2,7 +2,25 @@
 These functions construct URLs for the OSRM API.
 """
 
-from ..utils import parse_datetime_to_int
+import numpy as np
+from ..utils import timestamps_to_int
+
+
+def encode_coordinates(coordinates: list[tuple] | np.ndarray) -> str:
+    """
+    Encode (lat, lon) coordinates as the lon,lat;lon,lat string of a URL path.
+
+    The coordinates are converted to Python floats in one pass, which is much faster than
+    formatting NumPy scalars one at a time.
+
+    Args:
+        coordinates (list | np.ndarray): A list or (N, 2) array of (lat, lon) coordinates.
+
+    Returns:
+        str: The encoded coordinates.
+    """
+    flat = np.asarray(coordinates)[:, ::-1].ravel().tolist()
+    return ';'.join(map('{},{}'.format, flat[::2], flat[1::2]))
 
 
 def url_constructor(
@@ -30,7 +48,7 @@ def url_constructor(
 
     # Construct the URL
     url = f'{host}:{port}/{service}/v1/{mode}/'
-    url += ';'.join([f'{c[1]},{c[0]}' for c in coordinates])
+    url += encode_coordinates(coordinates)
 
     # Create empty options list
     options: list[str] = []
@@ -40,7 +58,10 @@ def url_constructor(
         if v is None:
             continue
 
-        if hasattr(v, '__iter__') and not isinstance(v, str):
+        if isinstance(v, np.ndarray):
+            _str = ';'.join(map(str, v.tolist()))
+
+        elif hasattr(v, '__iter__') and not isinstance(v, str):
             _str = ';'.join([str(i) for i in v])
 
         elif isinstance(v, str | int | float | bool):
@@ -72,9 +93,8 @@ def table_url(
         port (int): The port number.
         coordinates (list): A list of coordinates in the form [(lon1, lat1), (lon2, lat2), ...].
         mode (str, optional): The mode of transportation. One of driving, walking, cycling.
-        annotations (str, optional): Returns additional metadata for each coordinate along the
-            route geometry. One of true, false, nodes, distance, duration, datasources, weight,
-            speed.
+        annotations (str, optional): Which table(s) to return. One of duration, distance,
+            or duration,distance. Default is duration.
         sources (list, optional): Use location with given index as source.
         destinations (list, optional): Use location with given index as destination.
 
@@ -100,8 +120,8 @@ def table_url(
         'mode must be one of "driving", "walking", or "cycling"'
 
     # Annotations must be either duration, distance, or duration and distance
-    assert kwargs['annotations'] in ['duration', 'distance'], \
-        'annotations must be one of "duration", "distance"'
+    assert kwargs['annotations'] in ['duration', 'distance', 'duration,distance'], \
+        'annotations must be one of "duration", "distance", or "duration,distance"'
 
     # List args
     list_args = {'sources': kwargs['sources'], 'destinations': kwargs['destinations']}
@@ -128,8 +148,8 @@ def match_url(
         port (int): The port number.
         coordinates (list): A list of coordinates in the form [(lon1, lat1), (lon2, lat2), ...].
         mode (str, optional): The mode of transportation. One of driving, walking, cycling.
-        timestamps (list, optional): A list of timestamps in seconds since UNIX epoch for
-            each coordinate in the form [t1, t2, ...].
+        timestamps (list, optional): A list or array of timestamps for each coordinate in
+            the form [t1, t2, ...], as seconds since UNIX epoch, strings, or datetimes.
         geometries (str, optional): Returned route geometry format as polyline,
             polyline6, geojson. Default is polyline.
         annotations (str, optional): Returns additional metadata for each coordinate along the
@@ -139,6 +159,8 @@ def match_url(
         gaps (bool, optional): Allows the input track modification to obtain a better match
             for noisy traces.
         steps (bool, optional): Return route steps for each route leg.
+        overview (str, optional): Add overview geometry either full, simplified, or false.
+            Default is the server's, simplified.
         waypoints (list, optional): Selected input coordinates as waypoints.
         dt_format (str, optional): The format of the timestamps if not integer seconds.
             Default is '%Y-%m-%d %H:%M:%S%z'.
@@ -149,6 +171,7 @@ def match_url(
 
     # Set default kwargs
     defaults = {
+        'timestamps': None,
         'geometries': 'polyline',
         'annotations': 'true',
         'radiuses': None,
@@ -156,6 +179,7 @@ def match_url(
         'gaps': None,
         'tidy': None,
         'steps': None,
+        'overview': None,
         'dt_format': '%Y-%m-%d %H:%M:%S%z'
     }
 
@@ -170,12 +194,9 @@ def match_url(
     assert mode in ['driving', 'walking', 'cycling'], \
         'mode must be one of "driving", "walking", or "cycling"'
 
-    # Process timestamps if they are strings
-    if isinstance(kwargs['timestamps'], list):
-        # If timestamp is a string, convert to a list of integers
-        kwargs['timestamps'] = [
-            parse_datetime_to_int(t, kwargs['dt_format']) for t in kwargs['timestamps']
-            ]
+    # Convert strings and datetimes to integer seconds, all at once
+    if kwargs['timestamps'] is not None:
+        kwargs['timestamps'] = timestamps_to_int(kwargs['timestamps'], kwargs['dt_format'])
 
     # List args
     list_args = {
@@ -190,7 +211,8 @@ def match_url(
         'annotations': kwargs['annotations'],
         'gaps': kwargs['gaps'],
         'tidy': kwargs['tidy'],
-        'steps': kwargs['steps']
+        'steps': kwargs['steps'],
+        'overview': kwargs['overview']
     }
 
     # Construct base URL
@@ -221,6 +243,8 @@ def route_url(
             speed.
         continue_straight (bool, optional): Forces the route to keep going straight at waypoints
             restricting u-turns. Default is false.
+        overview (str, optional): Add overview geometry either full, simplified, or false.
+            Default is the server's, simplified.
         waypoints (list, optional): Selected input coordinates as waypoints.
 
     Returns:
@@ -234,6 +258,7 @@ def route_url(
         'alternatives': None,
         'continue_straight': False,
         'annotations': True,
+        'overview': None,
         'waypoints': None
     }
     for key, value in defaults.items():
@@ -253,7 +278,8 @@ def route_url(
         'steps': kwargs['steps'],
         'alternatives': kwargs['alternatives'],
         'continue_straight': kwargs['continue_straight'],
-        'annotations': kwargs['annotations']
+        'annotations': kwargs['annotations'],
+        'overview': kwargs['overview']
     }
 
     return url_constructor(
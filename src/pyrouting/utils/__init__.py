@@ -1,12 +1,27 @@
 """
 This is a header module for importing util classes and functions.
 """
+from .backends import BackendPool
+from .cache import ResponseCache
+from .checkpoint import Checkpoint
 from .concurrency import ConcurrentRequests
 from .connections import testhost
-from .datetime_to_int import parse_datetime_to_int
+from .coordinates import dedupe_rows, haversine, quantize
+from .datetime_to_int import parse_datetime_to_int, timestamps_to_int
+from .metrics import Metrics
+from .pair_cache import PairCache
 
 __all__ = [
+    'BackendPool',
+    'ResponseCache',
+    'Checkpoint',
     'ConcurrentRequests',
+    'Metrics',
+    'PairCache',
     'testhost',
-    'parse_datetime_to_int'
+    'quantize',
+    'dedupe_rows',
+    'haversine',
+    'parse_datetime_to_int',
+    'timestamps_to_int'
 ]
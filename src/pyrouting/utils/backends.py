@@ -0,0 +1,142 @@
+"""
+This module contains the BackendPool class,
+which spreads requests across several OSRM server replicas.
+"""
+from urllib.parse import urlsplit
+import time
+from .connections import testhost
+
+
+def _normalize(endpoint: str | tuple[str, int]) -> str:
+    """
+    This is a helper function to turn an endpoint into a 'http://host:port' base URL.
+
+    Args:
+        endpoint (str | tuple): Either 'host:port', 'http://host:port', or (host, port).
+
+    Returns:
+        str: The base URL.
+    """
+    if isinstance(endpoint, tuple):
+        endpoint = f'{endpoint[0]}:{endpoint[1]}'
+
+    if not endpoint.startswith('https://') and not endpoint.startswith('http://'):
+        endpoint = 'http://' + endpoint
+
+    return endpoint.rstrip('/')
+
+
+class BackendPool:
+    """
+    This class balances requests across several osrm-routed replicas.
+
+    Each request goes to the healthy replica with the fewest outstanding requests, or the
+    lowest expected latency. Replicas that fail a connection are ejected until the next
+    periodic health check finds them reachable again.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[str | tuple[str, int]],
+        strategy: str = 'least_outstanding',
+        health_interval: float = 30,
+        smoothing: float = 0.2
+    ) -> None:
+        """
+        Initialize the BackendPool object.
+
+        Args:
+            endpoints (list): The replicas as 'host:port', 'http://host:port', or (host, port).
+            strategy (str): Either 'least_outstanding' or 'latency'.
+                Defaults to 'least_outstanding'.
+            health_interval (float): Seconds between health checks. Defaults to 30.
+            smoothing (float): The weight of each new sample in the smoothed latency.
+                Defaults to 0.2.
+        """
+        assert len(endpoints) > 0, 'endpoints must not be empty'
+        assert strategy in ['least_outstanding', 'latency'], \
+            'strategy must be "least_outstanding" or "latency"'
+
+        self.endpoints = [_normalize(e) for e in endpoints]
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.smoothing = smoothing
+
+        self.outstanding = {base: 0 for base in self.endpoints}
+        self.latency: dict[str, float] = {}
+        self.healthy = set(self.endpoints)
+        self.last_check = 0.0
+
+    def check_health(self) -> None:
+        """
+        Test every replica with testhost and update the healthy set.
+        """
+        healthy = set()
+        for base in self.endpoints:
+            host, port = base.rsplit(':', 1)
+            if testhost(host, port):
+                healthy.add(base)
+
+        self.healthy = healthy
+        self.last_check = time.monotonic()
+
+    def maybe_check_health(self) -> None:
+        """
+        Run check_health if the last check is older than health_interval.
+        """
+        if time.monotonic() - self.last_check > self.health_interval:
+            self.check_health()
+
+    def _cost(self, base: str) -> float:
+        if self.strategy == 'latency':
+            # Expected wait if requests queue behind the outstanding ones
+            return self.latency.get(base, 0.0) * (self.outstanding[base] + 1)
+        return self.outstanding[base]
+
+    def acquire(self) -> str:
+        """
+        Pick a replica for the next request and count it as outstanding.
+
+        Returns:
+            str: The base URL of the chosen replica.
+        """
+        # If every replica has been ejected, keep trying all of them
+        candidates = [b for b in self.endpoints if b in self.healthy] or self.endpoints
+        base = min(candidates, key=self._cost)
+        self.outstanding[base] += 1
+        return base
+
+    def release(self, base: str, latency: float | None = None, ok: bool = True) -> None:
+        """
+        Mark a request to a replica as finished.
+
+        Args:
+            base (str): The base URL returned by acquire.
+            latency (float, optional): The request latency in seconds.
+            ok (bool): False if the replica could not be reached, which ejects it.
+        """
+        self.outstanding[base] -= 1
+
+        if not ok:
+            self.healthy = self.healthy - {base}
+            return
+
+        if latency is not None:
+            prev = self.latency.get(base, latency)
+            self.latency[base] = prev + self.smoothing * (latency - prev)
+
+    @staticmethod
+    def rewrite(url: str, base: str) -> str:
+        """
+        Point a URL built for one host at another replica.
+
+        Args:
+            url (str): The request URL.
+            base (str): The base URL of the replica.
+
+        Returns:
+            str: The URL with its scheme, host, and port replaced by base.
+        """
+        parts = urlsplit(url if '://' in url else f'http://{url}')
+        query = f'?{parts.query}' if parts.query else ''
+        return f'{base}{parts.path}{query}'
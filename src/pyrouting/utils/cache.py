@@ -0,0 +1,168 @@
+"""
+This module contains the ResponseCache class,
+a persistent on-disk cache of OSRM responses keyed on the request URL.
+"""
+from urllib.parse import urlsplit
+import hashlib
+import sqlite3
+import time
+from .fastjson import loads
+
+
+class ResponseCache:
+    """
+    This class is a SQLite backed cache of OSRM responses with LRU eviction and a TTL.
+
+    Entries are keyed on the URL path and query, so the same request sent to a different
+    host or port is still a hit.
+    """
+
+    def __init__(
+        self,
+        path: str = 'osrm_cache.sqlite',
+        max_size: int = 2**30,
+        ttl: float | None = None,
+        dataset_version: str | None = None
+    ) -> None:
+        """
+        Initialize the ResponseCache object.
+
+        Args:
+            path (str): The path to the SQLite database file. Defaults to 'osrm_cache.sqlite'.
+            max_size (int): The maximum total size of the stored responses in bytes.
+                Least recently used entries are evicted beyond this. Defaults to 1 GiB.
+            ttl (float, optional): The time-to-live of an entry in seconds. Defaults to None,
+                meaning entries never expire.
+            dataset_version (str, optional): A label for the OSRM dataset. Entries stored under
+                a different version are treated as misses.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.dataset_version = dataset_version or ''
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key BLOB PRIMARY KEY, version TEXT, body BLOB, size INTEGER, '
+            'created REAL, accessed REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS accessed_idx ON responses (accessed)')
+        self.size = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(url: str) -> bytes:
+        """
+        Build the cache key from the service path and query of a URL, ignoring host and port.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            bytes: The SHA-1 digest of the canonical URL.
+        """
+        parts = urlsplit(url if '://' in url else f'http://{url}')
+        return hashlib.sha1(f'{parts.path}?{parts.query}'.encode()).digest()
+
+    def get(self, url: str, raw: bool = False) -> dict | bytes | None:
+        """
+        Look up a cached response.
+
+        Args:
+            url (str): The request URL.
+            raw (bool, optional): Return the raw JSON bytes instead of parsing them.
+                Defaults to False.
+
+        Returns:
+            dict | bytes | None: The parsed JSON response, or None on a miss.
+        """
+        key = self.make_key(url)
+        row = self.conn.execute(
+            'SELECT version, body, created FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+
+        now = time.time()
+        expired = row is not None and self.ttl is not None and now - row[2] > self.ttl
+        if row is None or expired or row[0] != self.dataset_version:
+            self.misses += 1
+            return None
+
+        self.conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        self.hits += 1
+        return row[1] if raw else loads(row[1])
+
+    def set(self, url: str, body: bytes | str) -> None:
+        """
+        Store a raw JSON response body. Callers should only store successful responses
+        so errors are retried next time.
+
+        Args:
+            url (str): The request URL.
+            body (bytes | str): The raw JSON response body.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        key = self.make_key(url)
+        now = time.time()
+        old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+            (key, self.dataset_version, body, len(body), now, now)
+        )
+        self.size += len(body) - (old[0] if old else 0)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until the cache is within 90% of max_size.
+        """
+        target = self.size - int(self.max_size * 0.9)
+        freed = 0
+        keys = []
+        rows = self.conn.execute('SELECT key, size FROM responses ORDER BY accessed')
+        for key, size in rows:
+            if freed >= target:
+                break
+            keys.append((key,))
+            freed += size
+
+        self.conn.executemany('DELETE FROM responses WHERE key = ?', keys)
+        self.size -= freed
+
+    def invalidate(self, dataset_version: str | None = None) -> None:
+        """
+        Delete all entries that were not stored under the given dataset version.
+
+        Args:
+            dataset_version (str, optional): The current dataset version. If given, it also
+                becomes this cache's dataset_version. Defaults to the current one.
+        """
+        if dataset_version is not None:
+            self.dataset_version = dataset_version
+
+        self.conn.execute('DELETE FROM responses WHERE version != ?', (self.dataset_version,))
+        self.size = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()[0]
+
+    def clear(self) -> None:
+        """
+        Delete all entries.
+        """
+        self.conn.execute('DELETE FROM responses')
+        self.size = 0
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+        self.conn.close()
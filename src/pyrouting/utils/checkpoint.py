@@ -0,0 +1,114 @@
+"""
+This module contains the Checkpoint class,
+a durable store of finished groups so long matching jobs can resume.
+"""
+from typing import Hashable, Iterable
+import json
+import sqlite3
+import time
+import numpy as np
+from .fastjson import loads
+
+
+class Checkpoint:
+    """
+    This class is a SQLite backed manifest of finished groups and their match responses.
+
+    Each group is stored with a hash of its input rows and request options. A group counts
+    as done only while its hash is unchanged, so after the input grows or changes only the
+    new or changed groups are matched again.
+    """
+
+    def __init__(self, path: str = 'osrm_checkpoint.sqlite') -> None:
+        """
+        Initialize the Checkpoint object.
+
+        Args:
+            path (str): The path to the SQLite database file.
+                Defaults to 'osrm_checkpoint.sqlite'.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS groups ('
+            'key TEXT PRIMARY KEY, hash TEXT, body BLOB, updated REAL)'
+        )
+
+    @staticmethod
+    def make_key(key: Hashable) -> str:
+        """
+        Serialize a group key, e.g. an int, string, or NumPy scalar, as JSON text.
+
+        Args:
+            key (Hashable): The group key.
+
+        Returns:
+            str: The stored key.
+        """
+        if isinstance(key, np.generic):
+            key = key.item()
+        return json.dumps(key, default=str)
+
+    def done(self, hashes: dict[Hashable, str]) -> set:
+        """
+        Find the groups that are finished with the same hash.
+
+        Args:
+            hashes (dict): The current hash of each group.
+
+        Returns:
+            set: The keys of the finished groups.
+        """
+        stored = dict(self.conn.execute('SELECT key, hash FROM groups'))
+        return {key for key, digest in hashes.items() if stored.get(self.make_key(key)) == digest}
+
+    def save(self, key: Hashable, digest: str, response: dict | bytes) -> None:
+        """
+        Store the response of a finished group, replacing any earlier one.
+
+        Args:
+            key (Hashable): The group key.
+            digest (str): The hash of the group's input.
+            response (dict | bytes): The match response or its raw JSON.
+        """
+        body = response if isinstance(response, bytes) else json.dumps(response).encode()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO groups (key, hash, body, updated) VALUES (?, ?, ?, ?)',
+            (self.make_key(key), digest, body, time.time())
+        )
+
+    def load(self, keys: Iterable[Hashable]) -> dict:
+        """
+        Load the stored responses of groups.
+
+        Args:
+            keys (Iterable): The group keys.
+
+        Returns:
+            dict: The responses keyed by group, leaving out groups that are not stored.
+        """
+        out = {}
+        for key in keys:
+            row = self.conn.execute(
+                'SELECT body FROM groups WHERE key = ?', (self.make_key(key),)
+            ).fetchone()
+            if row is not None:
+                out[key] = loads(row[0])
+        return out
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM groups').fetchone()[0]
+
+    def clear(self) -> None:
+        """
+        Remove all groups.
+        """
+        self.conn.execute('DELETE FROM groups')
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+        self.conn.close()
@@ -2,11 +2,30 @@
 This module contains the ConcurrentRequests class,
 which is used to make concurrent requests to the OSRM server.
 """
-from typing import Iterator
+from typing import AsyncIterator, Callable, Iterator
+import heapq
+import itertools
 import json
+import random
+import time
 import asyncio
 import aiohttp
-from tqdm.asyncio import tqdm_asyncio
+from tqdm import tqdm
+from .backends import BackendPool
+from .cache import ResponseCache
+from .fastjson import loads
+from .limiter import AIMDLimiter
+from .metrics import Metrics
+from .scheduling import url_cost
+
+# HTTP status codes worth retrying
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+# osrm-routed compresses responses when asked, which cuts the bytes sent several times over
+COMPRESSED = {'Accept-Encoding': 'gzip, deflate'}
+
+# A schedule or priority orders the URLs within a buffer this many windows deep
+LOOKAHEAD = 4
 
 
 class ConcurrentRequests:
@@ -21,24 +40,86 @@ class ConcurrentRequests:
         limit: int = 0,
         limit_per_host: int = 500,
         ttl_dns_cache: int = 300,
+        cache: ResponseCache | None = None,
+        backends: BackendPool | None = None,
+        adaptive: bool = False,
+        timeout: float = 60,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        parse: bool = True,
+        session: aiohttp.ClientSession | None = None,
+        progress: bool = True,
+        metrics: Metrics | None = None,
+        compress: bool = True,
+        schedule: str | None = None,
+        priority: Callable[[str], int] | None = None,
         **kwargs
     ) -> None:
         """
         Initialize the ConcurrentRequests object.
 
         Args:
-            parallel_requests (int): The number of parallel requests.
+            parallel_requests (int): The number of parallel requests. With adaptive on, this is
+                the upper bound of the adaptive limit.
             limit (int): The total limit of parallel connections.
             limit_per_host (int): The limit of parallel connections per host.
             ttl_dns_cache (int): The time-to-live of the DNS cache.
+            cache (ResponseCache, optional): A response cache. If given, only cache misses
+                are sent to the server.
+            backends (BackendPool, optional): A pool of server replicas. If given, each
+                request is sent to the replica picked by the pool instead of the URL's host.
+            adaptive (bool): Adapt the number of parallel requests to the observed latency
+                and error rate with an AIMDLimiter. Defaults to False.
+            timeout (float): The per-request timeout in seconds. Defaults to 60.
+            retries (int): The number of retries for timeouts, connection errors, 429, and
+                5xx responses. Defaults to 3.
+            backoff (float): The base delay in seconds of the exponential retry backoff.
+                Defaults to 0.5.
+            max_backoff (float): The maximum retry delay in seconds. Defaults to 30.
+            parse (bool): Parse responses into dictionaries. If False, raw JSON bytes are
+                returned so they can be parsed or unpacked elsewhere. Defaults to True.
+            session (aiohttp.ClientSession, optional): A long-lived session to share, e.g. from
+                AsyncOSRMQueries. It is left open. Defaults to a new session per batch.
+            progress (bool): Show a tqdm progress bar. Defaults to True.
+            metrics (Metrics, optional): A registry that records the latency, size, parse
+                time, and outcome of every request attempt.
+            compress (bool): Ask the server for gzip or deflate compressed responses.
+                Defaults to True.
+            schedule (str, optional): 'lpt' sends the most expensive requests first, by
+                point count or table size, among the URLs pulled into a buffer of a few
+                windows ahead. Defaults to None, which keeps the input order.
+            priority (Callable, optional): A function giving the priority class of a URL,
+                e.g. lambda url: 0 if '/route/' in url else 1. Lower classes are sent first.
             **kwargs: Additional keyword arguments for aiohttp.TCPConnector.
         """
         self.parallel_requests = parallel_requests
         self.limit = limit
         self.limit_per_host = limit_per_host
         self.ttl_dns_cache = ttl_dns_cache
+        self.cache = cache
+        self.backends = backends
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.parse = parse
+        self.session = session
+        self.progress = progress
+        self.metrics = metrics
+        self.headers = COMPRESSED if compress else {'Accept-Encoding': 'identity'}
+        assert schedule in [None, 'lpt'], 'schedule must be None or "lpt"'
+        self.schedule = schedule
+        self.priority = priority
         self.kwargs = kwargs
 
+        self.limiter = AIMDLimiter(
+            initial=min(16, parallel_requests), max_limit=parallel_requests
+        ) if adaptive else None
+
+        # Error messages of requests that failed after all retries, by url index
+        self.failures: dict[int, str] = {}
+
     def open_connector(self) -> None:
         """
         Connect to the OSRM server and initialize the aiohttp TCPConnector object.
@@ -57,43 +138,287 @@ class ConcurrentRequests:
         """
         self.connector.close()
 
-    async def async_gather(self, urls: list[str] | Iterator) -> list:
+    @property
+    def window(self) -> int:
+        """
+        The number of requests allowed in flight.
+        """
+        if self.limiter is not None:
+            return self.limiter.window
+        return self.parallel_requests
+
+    def _dispatch_order(self, urls: list[str] | Iterator) -> Iterator[tuple[int, str]]:
+        """
+        This is a helper function to pair the URLs with their index, in the order they are
+        sent.
+        """
+        if self.schedule is None and self.priority is None:
+            return enumerate(urls)
+        return self._lookahead(urls)
+
+    def _lookahead(self, urls: list[str] | Iterator) -> Iterator[tuple[int, str]]:
+        """
+        This is a helper function to send the URLs longest first within priority classes,
+        among those in a buffer of LOOKAHEAD windows, so the URLs are still pulled lazily.
+        Ties keep their input order, as in lpt_order.
+        """
+        heap = []
+        for i, url in enumerate(urls):
+            priority = self.priority(url) if self.priority else 0
+            cost = url_cost(url) if self.schedule == 'lpt' else 0.0
+            heapq.heappush(heap, (priority, -cost, i, url))
+            if len(heap) >= LOOKAHEAD * self.window:
+                yield heapq.heappop(heap)[2:]
+
+        while heap:
+            yield heapq.heappop(heap)[2:]
+
+    def _on_failure(self, base: str | None = None) -> None:
+        if self.limiter is not None:
+            self.limiter.on_failure()
+
+        # Replicas that cannot be reached are ejected until the next health check
+        if base is not None:
+            self.backends.release(base, ok=False)
+
+    async def async_stream(
+        self,
+        urls: list[str] | Iterator,
+        parse: bool | None = None
+    ) -> AsyncIterator[tuple[int, dict]]:
+        """
+        Make concurrent GET requests to the OSRM server, yielding responses as they finish.
+
+        URLs are pulled lazily from the iterator and at most parallel_requests (or the
+        adaptive limit) are in flight at once. A new URL is only pulled once a response is
+        taken, so memory stays bounded by the window size no matter how many URLs are submitted.
+        With a schedule or priority set, the URLs are sent in that order within a buffer of
+        a few windows.
+
+        Transient failures are retried with exponential backoff. Requests that still fail
+        are yielded as {'code': 'RequestError', 'message': ...} and recorded in self.failures
+        rather than raising.
+
+        Args:
+            urls (list[str]): A list or iterator of URLs.
+            parse (bool, optional): Parse the responses of this call. Defaults to self.parse.
+
+        Yields:
+            tuple: (index, response) pairs in completion order, where index is the position
+                of the URL in urls. Responses are raw bytes if parse is False.
+        """
+        if parse is None:
+            parse = self.parse
+
+        # Use the shared session if there is one, else open a connection for this batch
+        session = self.session
+        if session is None:
+            if not hasattr(self, 'connector') or self.connector.closed:
+                self.open_connector()
+            trace_configs = [self.metrics.trace_config()] if self.metrics is not None else None
+            session = aiohttp.ClientSession(connector=self.connector, trace_configs=trace_configs)
+
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        total = len(urls) if hasattr(urls, '__len__') else None
+        queue = self._dispatch_order(urls)
+        pending: set[asyncio.Task] = set()
+        self.failures = {}
+
+        async def get(i, url):
+            if self.cache is not None:
+                hit = self.cache.get(url, raw=not parse)
+                if hit is not None:
+                    if self.metrics is not None:
+                        self.metrics.record_request(url, 'cache')
+                    return i, hit
+
+            error = ''
+            for attempt in range(self.retries + 1):
+                if attempt > 0:
+                    delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+                    await asyncio.sleep(delay * random.uniform(0.5, 1))
+
+                # Each attempt may go to a different replica
+                target, base = url, None
+                if self.backends is not None:
+                    base = self.backends.acquire()
+                    target = self.backends.rewrite(url, base)
+
+                last = attempt == self.retries
+                start = time.perf_counter()
+                try:
+                    async with session.get(
+                        target, ssl=False, timeout=timeout, headers=self.headers
+                    ) as response:
+                        status = response.status
+                        raw = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    error = f'{type(err).__name__}: {err}'
+                    self._on_failure(base)
+                    if self.metrics is not None:
+                        self.metrics.record_request(
+                            url, type(err).__name__, retry=not last, failed=last
+                        )
+                    continue
+
+                latency = time.perf_counter() - start
+                if base is not None:
+                    self.backends.release(base, latency)
+
+                if status in TRANSIENT_STATUS:
+                    error = f'HTTP {status}'
+                    self._on_failure()
+                    if self.metrics is not None:
+                        self.metrics.record_request(
+                            url, status, latency, len(raw), retry=not last, failed=last
+                        )
+                    continue
+
+                if self.limiter is not None:
+                    self.limiter.on_success(latency)
+
+                # Leave parsing to the caller, only 'Ok' responses have a 200 status
+                if not parse:
+                    if self.metrics is not None:
+                        self.metrics.record_request(url, status, latency, len(raw))
+                    if self.cache is not None and status == 200:
+                        self.cache.set(url, raw)
+                    return i, raw
+
+                # OSRM reports bad requests (e.g. NoMatch) as JSON with a 400 status
+                parse_start = time.perf_counter()
+                try:
+                    obj = loads(raw)
+                except ValueError:
+                    error = f'HTTP {status}: response is not JSON'
+                    if self.metrics is not None:
+                        self.metrics.record_request(url, status, latency, len(raw), failed=True)
+                    break
+
+                if self.metrics is not None:
+                    self.metrics.record_request(
+                        url, status, latency, len(raw), time.perf_counter() - parse_start
+                    )
+
+                if self.cache is not None and obj.get('code') == 'Ok':
+                    self.cache.set(url, raw)
+                return i, obj
+
+            self.failures[i] = error
+            obj = {'code': 'RequestError', 'message': error}
+            return i, obj if parse else json.dumps(obj).encode()
+
+        async def check_health():
+            while True:
+                await asyncio.to_thread(self.backends.maybe_check_health)
+                await asyncio.sleep(self.backends.health_interval)
+
+        if self.backends is not None:
+            health_task = asyncio.ensure_future(check_health())
+
+        def submit():
+            n = self.window - len(pending)
+            for i, url in itertools.islice(queue, max(n, 0)):
+                pending.add(asyncio.ensure_future(get(i, url)))
+
+        try:
+            with tqdm(total=total, disable=not self.progress) as pbar:
+                # Fill the window, then top it up as requests finish
+                submit()
+                while pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        pending.discard(task)
+                        submit()
+                        pbar.update()
+                        yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if self.backends is not None:
+                health_task.cancel()
+            if session is not self.session:
+                await session.close()
+
+    async def async_gather(
+        self,
+        urls: list[str] | Iterator,
+        callback: Callable[[int, dict], None] | None = None
+    ) -> list:
         """
         This is a helper function to make concurrent GET requests to the OSRM server.
 
         Args:
             urls (list[str]): A list of URLs.
+            callback (Callable, optional): A function called as callback(index, response)
+                for each response as it arrives. If given, responses are not kept.
 
         Returns:
-            list: A list of JSON responses.
+            list: A list of JSON responses in the same order as the urls.
+        """
+        results = {}
+
+        async for i, obj in self.async_stream(urls):
+            if callback is not None:
+                callback(i, obj)
+            else:
+                results[i] = obj
+
+        # Put the results back in input order
+        return [results[i] for i in range(len(results))]
+
+    @staticmethod
+    def _new_loop() -> asyncio.AbstractEventLoop:
+        """
+        Create an event loop for the blocking methods, refusing to nest in a running one.
         """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.new_event_loop()
 
-        # Check if connection is open
-        if not hasattr(self, 'connector') or self.connector.closed:
-            self.open_connector()
+        raise RuntimeError(
+            'ConcurrentRequests.get and stream block, so they cannot run inside a running '
+            'event loop. Use async_gather or async_stream, or AsyncOSRMQueries, instead.'
+        )
 
-        semaphore = asyncio.Semaphore(self.parallel_requests)
-        session = aiohttp.ClientSession(connector=self.connector)
-        results = []
+    def stream(
+        self,
+        urls: list[str] | Iterator,
+        parse: bool | None = None
+    ) -> Iterator[tuple[int, dict]]:
+        """
+        Make concurrent GET requests to the OSRM server, yielding responses as they finish.
 
-        # heres the logic for the generator
-        async def get(url):
-            async with semaphore:
-                async with session.get(url, ssl=False) as response:
-                    obj = json.loads(await response.read())
-                    results.append(obj)
+        This is the synchronous counterpart of async_stream. Requests only progress while
+        the generator is being consumed, which applies backpressure to the URL source.
 
-        # async gather with tqdm progress bar
-        await tqdm_asyncio.gather(*(get(url) for url in urls))
+        Args:
+            urls (list[str]): A list or iterator of URLs.
+            parse (bool, optional): Parse the responses of this call. Defaults to self.parse.
 
-        await session.close()
+        Yields:
+            tuple: (index, response) pairs in completion order.
+        """
 
-        return results
+        loop = self._new_loop()
+        agen = self.async_stream(urls, parse)
+
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.close()
 
     def get(
         self,
         urls: list[str] | Iterator,
-        keep_open: bool = False
+        keep_open: bool = False,
+        callback: Callable[[int, dict], None] | None = None
     ):
         """
         Make concurrent GET requests to the OSRM server.
@@ -101,13 +426,18 @@ class ConcurrentRequests:
         Args:
             urls (list[str]): A list of URLs.
             keep_open (bool): Keep the connection open. Defaults to False.
+            callback (Callable, optional): A function called as callback(index, response)
+                for each response as it arrives. If given, responses are not kept.
 
         Returns:
-            list: A list of JSON responses.
+            list: A list of JSON responses in the same order as the urls.
         """
 
-        loop = asyncio.get_event_loop()
-        results = loop.run_until_complete(self.async_gather(urls))
+        loop = self._new_loop()
+        try:
+            results = loop.run_until_complete(self.async_gather(urls, callback))
+        finally:
+            loop.close()
 
         if keep_open:
             self.close_connector()
@@ -18,5 +18,5 @@ def testhost(host: str, port: str | int) -> bool:
     try:
         requests.head(url, timeout=5)
         return True
-    except requests.exceptions.ConnectionError:
+    except requests.exceptions.RequestException:
         return False
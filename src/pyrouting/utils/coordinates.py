@@ -0,0 +1,70 @@
+"""
+Helper functions for quantizing and deduplicating coordinates before building requests.
+"""
+import numpy as np
+
+# Mean earth radius in metres
+EARTH_RADIUS = 6371008.8
+
+
+def quantize(coords: np.ndarray, precision: int | None) -> np.ndarray:
+    """
+    Round coordinates to a number of decimal places.
+
+    Five decimals is about a metre, four about ten metres. Rounding also makes the
+    coordinate strings in the URLs shorter.
+
+    Args:
+        coords (np.ndarray): An array of coordinates.
+        precision (int | None): The number of decimal places. None leaves them unchanged.
+
+    Returns:
+        np.ndarray: The rounded coordinates as floats.
+    """
+    coords = np.asarray(coords, dtype=float)
+    if precision is None:
+        return coords
+    return np.round(coords, precision)
+
+
+def dedupe_rows(arr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the unique rows of an array, keeping their first-seen order.
+
+    Args:
+        arr (np.ndarray): A 2D array.
+
+    Returns:
+        tuple: The unique rows, and for each input row the index of its unique row, so that
+            unique[inverse] gives back arr.
+    """
+    _, first, inverse = np.unique(arr, axis=0, return_index=True, return_inverse=True)
+
+    # np.unique sorts the rows, put them back in order of first appearance
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    return arr[first[order]], rank[inverse.ravel()]
+
+
+def haversine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distance between (lat, lon) coordinates, broadcast like NumPy arithmetic.
+
+    The network distance between two points is never shorter, which makes this a cheap
+    lower bound for pruning table requests.
+
+    Args:
+        a (np.ndarray): An array of (lat, lon) coordinates in degrees with shape (..., 2).
+        b (np.ndarray): An array of (lat, lon) coordinates in degrees with shape (..., 2).
+
+    Returns:
+        np.ndarray: The distances in metres.
+    """
+    a = np.radians(np.asarray(a, dtype=float))
+    b = np.radians(np.asarray(b, dtype=float))
+    dlat = b[..., 0] - a[..., 0]
+    dlon = b[..., 1] - a[..., 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[..., 0]) * np.cos(b[..., 0]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
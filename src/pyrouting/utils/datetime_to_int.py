@@ -2,6 +2,9 @@
 General utility functions.
 """
 from datetime import datetime
+from typing import Sequence
+import numpy as np
+import pandas as pd
 
 
 def parse_datetime_to_int(timestamp: str | int | datetime, dt_format: str) -> int:
@@ -26,3 +29,39 @@ def parse_datetime_to_int(timestamp: str | int | datetime, dt_format: str) -> in
         return int(timestamp.timestamp())
 
     raise ValueError('timestamp must be a string or datetime object')
+
+
+def timestamps_to_int(
+    timestamps: Sequence | np.ndarray | pd.Series,
+    dt_format: str | None
+) -> np.ndarray:
+    """
+    Parse a whole column of timestamps to integers at once.
+
+    Integers are taken as seconds since UNIX epoch already. Strings are parsed with dt_format,
+    and datetimes without a time zone are taken as UTC.
+
+    Args:
+        timestamps (Sequence | np.ndarray | pd.Series): Integers, strings, datetimes,
+            datetime64 values, or a tz-aware datetime column.
+        dt_format (str | None): The format of string timestamps. None infers it.
+
+    Returns:
+        np.ndarray: The int64 seconds since UNIX epoch of each timestamp.
+    """
+    # Integer arrays are already in the right form, so skip building a Series
+    if isinstance(timestamps, np.ndarray) and timestamps.dtype.kind in 'iu':
+        return timestamps.astype(np.int64, copy=False)
+
+    series = timestamps if isinstance(timestamps, pd.Series) else pd.Series(timestamps)
+
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy().astype(np.int64)
+
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series, format=dt_format, utc=True)
+    elif series.dt.tz is None:
+        series = series.dt.tz_localize('UTC')
+
+    # Count whole seconds from the epoch, whatever the resolution of the column
+    return ((series - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(np.int64)
@@ -0,0 +1,27 @@
+"""
+This module picks the fastest available JSON parser for OSRM responses.
+
+orjson is used if it is installed (pip install pyrouting[fast]), otherwise the standard
+library json module.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(raw: bytes | str) -> dict:
+    """
+    Parse a raw JSON response body.
+
+    Args:
+        raw (bytes | str): The raw response body.
+
+    Returns:
+        dict: The parsed JSON object.
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
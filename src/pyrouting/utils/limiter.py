@@ -0,0 +1,92 @@
+"""
+This module contains the AIMDLimiter class,
+which adapts the number of in-flight requests to how the server is coping.
+"""
+
+
+class AIMDLimiter:
+    """
+    This class is an additive-increase/multiplicative-decrease concurrency limiter.
+
+    The limit grows by roughly `increase` per window of successful requests and is cut by
+    `decrease` on a failure or when latency climbs well above the best latency seen,
+    at most once per window so a burst of failures does not collapse it.
+    """
+
+    def __init__(
+        self,
+        initial: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 250,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.1
+    ) -> None:
+        """
+        Initialize the AIMDLimiter object.
+
+        Args:
+            initial (int): The starting limit. Defaults to 16.
+            min_limit (int): The lowest the limit can go. Defaults to 1.
+            max_limit (int): The highest the limit can go. Defaults to 250.
+            increase (float): How much the limit grows per window of successes. Defaults to 1.
+            decrease (float): The factor the limit is multiplied by on congestion.
+                Defaults to 0.5.
+            latency_tolerance (float): Smoothed latency above this multiple of the best
+                latency seen counts as congestion. Defaults to 2.
+            smoothing (float): The weight of each new sample in the smoothed latency.
+                Defaults to 0.1.
+        """
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self.best_latency: float | None = None
+        self.latency: float | None = None
+        self._since_decrease = self.window
+
+    @property
+    def window(self) -> int:
+        """
+        The number of requests currently allowed in flight.
+        """
+        return max(int(self.limit), self.min_limit)
+
+    def _backoff(self) -> None:
+        # Only back off once per window of completions
+        if self._since_decrease < self.window:
+            return
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self._since_decrease = 0
+
+    def on_success(self, latency: float) -> None:
+        """
+        Record a successful request.
+
+        Args:
+            latency (float): The request latency in seconds.
+        """
+        self._since_decrease += 1
+
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+        if self.latency is None:
+            self.latency = latency
+        self.latency += self.smoothing * (latency - self.latency)
+
+        if self.latency > self.latency_tolerance * self.best_latency:
+            self._backoff()
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def on_failure(self) -> None:
+        """
+        Record a failed request, e.g. a timeout, connection error, 429, or 5xx.
+        """
+        self._since_decrease += 1
+        self._backoff()
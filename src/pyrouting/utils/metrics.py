@@ -0,0 +1,295 @@
+"""
+This module contains the Metrics class,
+which records request counters and histograms per OSRM service.
+"""
+from typing import Callable
+import bisect
+import re
+import threading
+import time
+import aiohttp
+
+# Upper bounds in seconds of the duration histogram buckets
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Descriptions of the metrics recorded by record_request and the trace config
+DESCRIPTIONS = {
+    'osrm_requests_total': 'HTTP responses and cache hits by service and status.',
+    'osrm_retries_total': 'Requests retried after a transient failure.',
+    'osrm_failures_total': 'Requests that failed after all retries.',
+    'osrm_response_bytes_total': 'Bytes of response bodies received.',
+    'osrm_request_duration_seconds': 'Time from sending a request to reading its body.',
+    'osrm_parse_duration_seconds': 'Time spent parsing response JSON.',
+    'osrm_queue_wait_seconds': 'Time requests waited for a free pooled connection.'
+}
+
+_SERVICE = re.compile(r'/(route|match|table|nearest|trip|tile)/v1/')
+
+
+def service_of(url: str) -> str:
+    """
+    Get the OSRM service of a request URL.
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        str: One of route, match, table, nearest, trip, tile, or other.
+    """
+    found = _SERVICE.search(url)
+    return found.group(1) if found else 'other'
+
+
+class Metrics:
+    """
+    This class is a registry of counters and histograms for the HTTP layer.
+
+    Pass one to ConcurrentRequests, OSRMQueries, or AsyncOSRMQueries to record every request.
+    Callbacks receive each request event as a dictionary, e.g. to forward them to a logger
+    or tracing system, and the totals can be exported as Prometheus text or as an
+    OpenTelemetry (OTLP JSON) style dictionary.
+    """
+
+    def __init__(
+        self,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        callbacks: list[Callable[[dict], None]] | None = None
+    ) -> None:
+        """
+        Initialize the Metrics object.
+
+        Args:
+            buckets (tuple): The upper bounds in seconds of the histogram buckets.
+                Defaults to 1 ms to 10 s.
+            callbacks (list, optional): Functions called as callback(event) for every
+                recorded request.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.callbacks = list(callbacks or [])
+        self.start_time = time.time()
+
+        # Values keyed by (name, sorted label items)
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """
+        Add to a counter.
+
+        Args:
+            name (str): The counter name.
+            value (float, optional): The amount to add. Defaults to 1.
+            **labels: The labels of the series, e.g. service='match'.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Record a value in a histogram.
+
+        Args:
+            name (str): The histogram name.
+            value (float): The observed value.
+            **labels: The labels of the series, e.g. service='match'.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+                self.histograms[key] = hist
+            hist['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def counter(self, name: str, **labels) -> float:
+        """
+        Get the value of a counter, or 0 if it was never incremented.
+        """
+        return self.counters.get(self._key(name, labels), 0.0)
+
+    def histogram(self, name: str, **labels) -> dict | None:
+        """
+        Get the bucket counts, sum, and count of a histogram, or None if it is empty.
+        """
+        return self.histograms.get(self._key(name, labels))
+
+    def reset(self) -> None:
+        """
+        Clear all recorded values.
+        """
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.start_time = time.time()
+
+    def record_request(
+        self,
+        url: str,
+        status: int | str,
+        latency: float | None = None,
+        size: int | None = None,
+        parse_time: float | None = None,
+        retry: bool = False,
+        failed: bool = False
+    ) -> None:
+        """
+        Record one request attempt and pass it on to the callbacks.
+
+        Args:
+            url (str): The request URL.
+            status (int | str): The HTTP status, 'cache' for a cache hit, or the name of the
+                exception for connection errors and timeouts.
+            latency (float, optional): Seconds from sending the request to reading its body.
+            size (int, optional): The response body size in bytes.
+            parse_time (float, optional): Seconds spent parsing the JSON.
+            retry (bool, optional): The attempt failed and will be retried.
+            failed (bool, optional): The request failed for good.
+        """
+        service = service_of(url)
+        self.inc('osrm_requests_total', service=service, status=status)
+        if latency is not None:
+            self.observe('osrm_request_duration_seconds', latency, service=service)
+        if size is not None:
+            self.inc('osrm_response_bytes_total', size, service=service)
+        if parse_time is not None:
+            self.observe('osrm_parse_duration_seconds', parse_time, service=service)
+        if retry:
+            self.inc('osrm_retries_total', service=service)
+        if failed:
+            self.inc('osrm_failures_total', service=service)
+
+        event = {
+            'url': url, 'service': service, 'status': status, 'latency': latency,
+            'size': size, 'parse_time': parse_time, 'retry': retry, 'failed': failed
+        }
+        for callback in self.callbacks:
+            callback(event)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Create an aiohttp TraceConfig that records how long requests wait for a pooled
+        connection, for sessions created with trace_configs=[metrics.trace_config()].
+
+        Returns:
+            aiohttp.TraceConfig: The trace config.
+        """
+        config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.service = service_of(str(params.url))
+
+        async def on_queued_start(session, context, params):
+            context.queued = time.perf_counter()
+
+        async def on_queued_end(session, context, params):
+            wait = time.perf_counter() - context.queued
+            self.observe('osrm_queue_wait_seconds', wait, service=context.service)
+
+        config.on_request_start.append(on_request_start)
+        config.on_connection_queued_start.append(on_queued_start)
+        config.on_connection_queued_end.append(on_queued_end)
+
+        return config
+
+    def to_prometheus(self) -> str:
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text, e.g. to serve from a /metrics endpoint.
+        """
+        def _labels(items, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*items, *extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        seen = set()
+        for (name, items), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {DESCRIPTIONS.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_labels(items)} {value:g}')
+
+        for (name, items), hist in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {DESCRIPTIONS.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), hist['counts']):
+                cumulative += count
+                le = bound if isinstance(bound, str) else f'{bound:g}'
+                lines.append(f'{name}_bucket{_labels(items, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(items)} {hist["sum"]:g}')
+            lines.append(f'{name}_count{_labels(items)} {hist["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def to_otlp(self) -> dict:
+        """
+        Export the metrics as an OpenTelemetry (OTLP JSON) style dictionary of cumulative sums
+        and explicit-bucket histograms.
+
+        Returns:
+            dict: The metrics, e.g. to post to an OpenTelemetry collector's /v1/metrics.
+        """
+        start = int(self.start_time * 1e9)
+        now = int(time.time() * 1e9)
+
+        def _attributes(items):
+            return [{'key': k, 'value': {'stringValue': v}} for k, v in items]
+
+        metrics: dict[str, dict] = {}
+        with self._lock:
+            for (name, items), value in sorted(self.counters.items()):
+                metric = metrics.setdefault(name, {
+                    'name': name,
+                    'description': DESCRIPTIONS.get(name, ''),
+                    'sum': {
+                        'dataPoints': [], 'aggregationTemporality': 2, 'isMonotonic': True
+                    }
+                })
+                metric['sum']['dataPoints'].append({
+                    'attributes': _attributes(items), 'startTimeUnixNano': start,
+                    'timeUnixNano': now, 'asDouble': value
+                })
+
+            for (name, items), hist in sorted(self.histograms.items()):
+                metric = metrics.setdefault(name, {
+                    'name': name,
+                    'description': DESCRIPTIONS.get(name, ''),
+                    'unit': 's',
+                    'histogram': {'dataPoints': [], 'aggregationTemporality': 2}
+                })
+                metric['histogram']['dataPoints'].append({
+                    'attributes': _attributes(items), 'startTimeUnixNano': start,
+                    'timeUnixNano': now, 'count': hist['count'], 'sum': hist['sum'],
+                    'bucketCounts': list(hist['counts']), 'explicitBounds': list(self.buckets)
+                })
+
+        return {
+            'resourceMetrics': [{
+                'resource': {
+                    'attributes': [{'key': 'service.name', 'value': {'stringValue': 'pyrouting'}}]
+                },
+                'scopeMetrics': [{
+                    'scope': {'name': 'pyrouting'},
+                    'metrics': list(metrics.values())
+                }]
+            }]
+        }
@@ -0,0 +1,222 @@
+"""
+This module contains the PairCache class,
+a persistent on-disk store of table durations and distances for single
+origin-destination pairs.
+"""
+import os
+import re
+import numpy as np
+
+
+class PairCache:
+    """
+    This class stores table results per origin-destination pair rather than per request, so
+    a table with a few added or moved points only needs the rows and columns of those
+    points from the server.
+
+    Points are keyed on their coordinates rounded to a number of decimal places, and each
+    profile, dataset version, and annotation is stored as a sorted array of 64-bit pair keys
+    with a float32 array of values in .npy files. Lookups are binary searches on
+    memory-mapped arrays. The store is meant for one writer at a time.
+    """
+
+    def __init__(
+        self,
+        path: str = 'osrm_pairs',
+        precision: int = 5,
+        dataset_version: str | None = None
+    ) -> None:
+        """
+        Initialize the PairCache object.
+
+        Args:
+            path (str): The directory of the .npy files. Defaults to 'osrm_pairs'.
+            precision (int): The number of decimal places points are matched on, at most 6.
+                Defaults to 5, about a metre.
+            dataset_version (str, optional): A label for the OSRM dataset. Pairs stored under
+                a different version are not used.
+        """
+        assert 0 <= precision <= 6, 'precision must be between 0 and 6'
+
+        self.path = path
+        self.precision = precision
+        self.dataset_version = dataset_version or ''
+        os.makedirs(path, exist_ok=True)
+
+        points_file = os.path.join(path, 'points.npy')
+        self.points = np.load(points_file) if os.path.exists(points_file) \
+            else np.empty(0, dtype=np.int64)
+        self._index()
+
+    def _index(self) -> None:
+        """
+        This is a helper function to sort the point keys for lookups.
+        """
+        self._order = np.argsort(self.points, kind='stable')
+        self._sorted = self.points[self._order]
+
+    def _point_keys(self, coords: np.ndarray) -> np.ndarray:
+        """
+        This is a helper function to pack rounded (lat, lon) coordinates into int64 keys.
+        """
+        scale = 10 ** self.precision
+        q = np.round(np.asarray(coords, dtype=float) * scale).astype(np.int64)
+        return (q[:, 0] + 90 * scale) * (360 * scale + 1) + (q[:, 1] + 180 * scale)
+
+    def point_ids(self, coords: np.ndarray, add: bool = False) -> np.ndarray:
+        """
+        Get the ids of points, optionally registering the new ones.
+
+        Args:
+            coords (np.ndarray): An array of (lat, lon) coordinates with shape (N, 2).
+            add (bool, optional): Give new points an id. Defaults to False.
+
+        Returns:
+            np.ndarray: The int64 id of each point, or -1 for unknown points.
+        """
+        keys = self._point_keys(coords)
+        ids = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._sorted) > 0:
+            pos = np.minimum(np.searchsorted(self._sorted, keys), len(self._sorted) - 1)
+            hit = self._sorted[pos] == keys
+            ids[hit] = self._order[pos[hit]]
+
+        missing = ids < 0
+        if add and missing.any():
+            new, inverse = np.unique(keys[missing], return_inverse=True)
+            ids[missing] = len(self.points) + inverse.ravel()
+            self.points = np.concatenate([self.points, new])
+            self._save('points.npy', self.points)
+            self._index()
+
+        return ids
+
+    def _name(self, profile: str, key: str) -> str:
+        """
+        This is a helper function to get the file name stem of a profile and annotation.
+        """
+        return re.sub(r'[^\w.-]', '_', f'{profile}-{self.dataset_version}-{key}')
+
+    def _save(self, name: str, arr: np.ndarray) -> None:
+        """
+        This is a helper function to replace a .npy file atomically.
+        """
+        tmp = os.path.join(self.path, f'.{name}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def _load(self, profile: str, key: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        This is a helper function to memory-map the pair keys and values of an annotation.
+        """
+        name = self._name(profile, key)
+        pairs_file = os.path.join(self.path, f'{name}-pairs.npy')
+        if not os.path.exists(pairs_file):
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.float32)
+        return (
+            np.load(pairs_file, mmap_mode='r'),
+            np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        )
+
+    @staticmethod
+    def _pair_keys(src_ids: np.ndarray, dst_ids: np.ndarray) -> np.ndarray:
+        """
+        This is a helper function to pack every source and destination id pair into a
+        uint64 key, the source id in the high 32 bits.
+        """
+        return (src_ids.astype(np.uint64)[:, None] << np.uint64(32)) \
+            | dst_ids.astype(np.uint64)[None, :]
+
+    def lookup(
+        self,
+        sources: np.ndarray,
+        destinations: np.ndarray,
+        profile: str,
+        key: str,
+        out: np.ndarray,
+        block_rows: int = 1024
+    ) -> np.ndarray:
+        """
+        Copy the stored values of a table into an array.
+
+        Args:
+            sources (np.ndarray): An array of source coordinates with shape (N, 2).
+            destinations (np.ndarray): An array of destination coordinates with shape (M, 2).
+            profile (str): The routing profile, e.g. driving.
+            key (str): The annotation, durations or distances.
+            out (np.ndarray): The (N, M) array the stored values are written into.
+            block_rows (int, optional): The number of rows looked up at a time, to bound
+                memory. Defaults to 1024.
+
+        Returns:
+            np.ndarray: An (N, M) boolean array of the pairs that were found.
+        """
+        pairs, values = self._load(profile, key)
+        found = np.zeros((len(sources), len(destinations)), dtype=bool)
+        if len(pairs) == 0:
+            return found
+
+        src_ids = self.point_ids(sources)
+        dst_ids = self.point_ids(destinations)
+        known_cols = dst_ids >= 0
+
+        for start in range(0, len(sources), block_rows):
+            rows = slice(start, start + block_rows)
+            keys = self._pair_keys(src_ids[rows], dst_ids)
+            pos = np.minimum(np.searchsorted(pairs, keys), len(pairs) - 1)
+            hit = (pairs[pos] == keys) & (src_ids[rows, None] >= 0) & known_cols[None, :]
+            found[rows] = hit
+            block = out[rows]
+            block[hit] = values[pos[hit]]
+            out[rows] = block
+
+        return found
+
+    def update(
+        self,
+        sources: np.ndarray,
+        destinations: np.ndarray,
+        profile: str,
+        key: str,
+        values: np.ndarray,
+        mask: np.ndarray | None = None
+    ) -> None:
+        """
+        Store the values of a table, replacing stored values of the same pairs.
+
+        Args:
+            sources (np.ndarray): An array of source coordinates with shape (N, 2).
+            destinations (np.ndarray): An array of destination coordinates with shape (M, 2).
+            profile (str): The routing profile, e.g. driving.
+            key (str): The annotation, durations or distances.
+            values (np.ndarray): The (N, M) table. NaN, e.g. an unreachable pair, is stored.
+            mask (np.ndarray, optional): An (N, M) boolean array of the pairs to store, e.g.
+                to leave out failed tiles. Defaults to all pairs.
+        """
+        src_ids = self.point_ids(sources, add=True)
+        keys = self._pair_keys(src_ids, self.point_ids(destinations, add=True))
+        values = np.asarray(values, dtype=np.float32)
+        if mask is not None:
+            keys, values = keys[mask], values[mask]
+
+        old_pairs, old_values = self._load(profile, key)
+
+        # New values come first, so they win over stored values of the same pair
+        merged, first = np.unique(np.concatenate([keys.ravel(), old_pairs]), return_index=True)
+        merged_values = np.concatenate([values.ravel(), old_values])[first]
+
+        name = self._name(profile, key)
+        del old_pairs, old_values
+        self._save(f'{name}.npy', merged_values)
+        self._save(f'{name}-pairs.npy', merged)
+
+    def clear(self) -> None:
+        """
+        Delete all stored points and pairs.
+        """
+        for name in os.listdir(self.path):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(self.path, name))
+        self.points = np.empty(0, dtype=np.int64)
+        self._index()
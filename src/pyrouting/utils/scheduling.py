@@ -0,0 +1,57 @@
+"""
+Helper functions for ordering bulk requests so the largest go out first.
+"""
+from typing import Sequence
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+
+
+def url_cost(url: str) -> float:
+    """
+    Estimate the server work of a request from its URL.
+
+    Match, route, and other services are taken to cost their number of coordinates, and
+    tables their number of sources times destinations.
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        float: The estimated cost.
+    """
+    parts = urlsplit(url if '://' in url else f'http://{url}')
+    n = parts.path.rsplit('/', 1)[-1].count(';') + 1
+
+    if '/table/' not in parts.path:
+        return float(n)
+
+    query = parse_qs(parts.query)
+
+    def _count(name):
+        value = query.get(name, ['all'])[0]
+        return n if value == 'all' else value.count(';') + 1
+
+    return float(_count('sources') * _count('destinations'))
+
+
+def lpt_order(
+    costs: Sequence[float] | np.ndarray,
+    priorities: Sequence[int] | np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Order jobs longest processing time first (LPT) within priority classes.
+
+    Starting the largest jobs first leaves the small ones to fill the gaps at the end,
+    so a batch is not left waiting on a few large stragglers.
+
+    Args:
+        costs (Sequence): The estimated cost of each job.
+        priorities (Sequence, optional): The priority class of each job. Lower classes go
+            first. Defaults to a single class.
+
+    Returns:
+        np.ndarray: The job indices in dispatch order. Ties keep their input order.
+    """
+    costs = np.asarray(costs, dtype=float)
+    priorities = np.zeros(len(costs)) if priorities is None else np.asarray(priorities)
+    return np.lexsort((np.arange(len(costs)), -costs, priorities))
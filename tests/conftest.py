@@ -0,0 +1,14 @@
+"""
+Shared fixtures, including the stand-in OSRM server from benchmarks.mock_server.
+"""
+import pytest
+from benchmarks.mock_server import make_app, serve
+
+
+@pytest.fixture(scope='session')
+def osrm_server():
+    """
+    Run the stand-in OSRM server on a background thread and yield its (host, port).
+    """
+    with serve(make_app()) as address:
+        yield address
@@ -0,0 +1,64 @@
+"""
+This is a test module for the AsyncOSRMQueries class.
+"""
+
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+from pyrouting.osrm import AsyncOSRMQueries
+from pyrouting.utils import ConcurrentRequests
+
+coords = [(47.66117, -122.31197), (47.66135, -122.31247), (47.662, -122.3132)]
+
+
+def test_async_services(osrm_server):
+    """
+    The services can be awaited concurrently over one shared session.
+    """
+    host, port = osrm_server
+    df = pd.DataFrame({
+        'trip_id': np.repeat([1, 2], 3),
+        'lat': [c[0] for c in coords] * 2,
+        'lon': [c[1] for c in coords] * 2,
+        'timestamp': np.arange(6) * 10
+    })
+
+    async def _run():
+        async with AsyncOSRMQueries(host=host, port=port) as router:
+            session = router.session
+            results = await asyncio.gather(
+                router.route(coords), router.table(coords), router.match(coords),
+                router.match_df(df, group_col='trip_id', unpack=['distance'])
+            )
+            assert router.session is session
+            return results
+
+    route, table, match, matches = asyncio.run(_run())
+
+    assert route['code'] == table['code'] == match['code'] == 'Ok'
+    assert matches.distance.notnull().sum() == 2
+
+
+def test_blocking_get_in_running_loop(osrm_server):
+    """
+    The blocking get refuses to run inside an event loop instead of failing obscurely.
+    """
+    async def _run():
+        ConcurrentRequests().get([])
+
+    with pytest.raises(RuntimeError, match='async_gather'):
+        asyncio.run(_run())
+
+
+def test_no_blocking_methods():
+    """
+    The blocking bulk methods are not inherited, so they cannot be called from the loop,
+    and the options of the bulk requests are passed on.
+    """
+    router = AsyncOSRMQueries(host='localhost', port=5000, schedule='lpt')
+
+    assert router.host == 'http://localhost'
+    assert router._concurrency().schedule == 'lpt'
+    for name in ['table_matrix', 'table_sparse', 'route_df', 'match_file', '_get']:
+        assert not hasattr(router, name)
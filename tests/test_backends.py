@@ -0,0 +1,59 @@
+"""
+This is a test module for the BackendPool class.
+"""
+
+import socket
+from pyrouting.osrm import OSRMQueries
+from pyrouting.utils import BackendPool, ConcurrentRequests
+
+coords = [(47.66117, -122.31197), (47.662, -122.3132)]
+
+
+def _dead_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_least_outstanding():
+    """
+    Requests go to the replica with the fewest outstanding requests.
+    """
+    pool = BackendPool(['a:1', ('b', 2), 'https://c:3'])
+    picks = [pool.acquire() for _ in range(6)]
+
+    assert sorted(set(picks)) == ['http://a:1', 'http://b:2', 'https://c:3']
+    assert pool.outstanding == {'http://a:1': 2, 'http://b:2': 2, 'https://c:3': 2}
+
+    pool.release('http://b:2', ok=False)
+    assert pool.acquire() != 'http://b:2'
+
+
+def test_rewrite():
+    """
+    Only the scheme, host, and port are replaced.
+    """
+    url = 'http://a:1/route/v1/driving/1,2;3,4?steps=false'
+    assert BackendPool.rewrite(url, 'http://b:2') == 'http://b:2/route/v1/driving/1,2;3,4?steps=false'
+
+
+def test_failover(osrm_server):
+    """
+    A dead replica is ejected and its requests are retried on the live one.
+    """
+    host, port = osrm_server
+    live = f'{host}:{port}'
+    dead = f'{host}:{_dead_port()}'
+    pool = BackendPool([dead, live])
+
+    router = OSRMQueries(backends=pool)
+    assert router.route(coords)['code'] == 'Ok'
+    assert pool.healthy == {live}
+
+    pool.healthy = {dead, live}
+    urls = [f'{dead}/route/v1/driving/-122.3,47.{i};-122.31,47.6' for i in range(20)]
+    concurrency = ConcurrentRequests(backends=pool, backoff=0.01)
+    results = concurrency.get(urls)
+
+    assert all(r['code'] == 'Ok' for r in results)
+    assert pool.healthy == {live}
@@ -0,0 +1,26 @@
+"""
+This is a test module for the benchmark runner, run at a tiny size.
+"""
+
+from benchmarks.run import compare, run
+
+
+def test_benchmarks_run():
+    """
+    Every case reports its metrics, and a run never regresses against itself.
+    """
+    results = run(latency=0.001, padding=100, repeat=2, groups=[2], lengths=[20])
+
+    names = [r['name'] for r in results['results']]
+    assert names == [
+        'route', 'table', 'match', 'match_df', 'build_urls', 'unpack_matches', 'decode_many'
+    ]
+    for result in results['results']:
+        assert result['throughput'] > 0
+        assert result['p99_ms'] >= result['p50_ms']
+    assert compare(results, results) == []
+
+    slower = {
+        'results': [{**r, 'p50_ms': r['p50_ms'] * 2} for r in results['results']]
+    }
+    assert len(compare(results, slower)) == len(names)
@@ -0,0 +1,80 @@
+"""
+This is a test module for the ResponseCache class.
+"""
+
+import json
+import pytest
+from pyrouting.osrm import OSRMQueries
+from pyrouting.utils import ConcurrentRequests, ResponseCache
+
+coords = [(47.66117, -122.31197), (47.662, -122.3132)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    A fresh cache in a temporary directory.
+    """
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), dataset_version='v1')
+    yield cache
+    cache.close()
+
+
+def test_key_ignores_host(cache):
+    """
+    The same request to a different replica is a hit.
+    """
+    cache.set('http://a:5000/route/v1/driving/1,2;3,4', json.dumps({'code': 'Ok'}))
+
+    assert cache.get('http://b:5001/route/v1/driving/1,2;3,4') == {'code': 'Ok'}
+    assert cache.get('http://a:5000/route/v1/driving/1,2;3,5') is None
+
+
+def test_ttl_and_version(cache):
+    """
+    Expired entries and entries from another dataset version are misses.
+    """
+    cache.set('h:1/route/v1/driving/1,2', '{"code": "Ok"}')
+    cache.dataset_version = 'v2'
+    assert cache.get('h:1/route/v1/driving/1,2') is None
+
+    cache.invalidate()
+    assert cache.size == 0
+
+    cache.set('h:1/route/v1/driving/1,2', '{"code": "Ok"}')
+    cache.ttl = -1
+    assert cache.get('h:1/route/v1/driving/1,2') is None
+
+
+def test_lru_eviction(cache):
+    """
+    The least recently used entries are evicted once max_size is exceeded.
+    """
+    body = json.dumps({'code': 'Ok', 'pad': 'x' * 80})
+    cache.max_size = 5 * len(body)
+    for i in range(5):
+        cache.set(f'h:1/route/v1/driving/{i}', body)
+    cache.get('h:1/route/v1/driving/0')
+    cache.set('h:1/route/v1/driving/5', body)
+
+    assert cache.size <= cache.max_size
+    assert cache.get('h:1/route/v1/driving/0') is not None
+    assert cache.get('h:1/route/v1/driving/1') is None
+
+
+def test_cached_requests(osrm_server, cache):
+    """
+    Repeated requests are served from the cache.
+    """
+    host, port = osrm_server
+    urls = [f'{host}:{port}/route/v1/driving/-122.3,47.{i};-122.31,47.6' for i in range(10)]
+
+    first = ConcurrentRequests(cache=cache).get(urls)
+    second = ConcurrentRequests(cache=cache).get(urls)
+    assert first == second
+    assert cache.hits == 10
+
+    router = OSRMQueries(host=host, port=port, cache=cache)
+    router.route(coords)
+    assert router.route(coords)['code'] == 'Ok'
+    assert cache.hits == 11
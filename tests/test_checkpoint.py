@@ -0,0 +1,99 @@
+"""
+This is a test module for checkpointing and resuming match_df.
+"""
+
+import asyncio
+import pytest
+from pyrouting.osrm import osrm_matching
+from pyrouting.utils import Checkpoint, ConcurrentRequests, Metrics
+from .test_matching import _trips
+
+
+def _match(osrm_server, df, checkpoint, stop_after=None):
+    host, port = osrm_server
+    urls = []
+    concurrency = ConcurrentRequests(
+        parallel_requests=1, progress=False, metrics=Metrics(callbacks=[urls.append])
+    )
+
+    # Simulate a crash after some responses
+    if stop_after is not None:
+        stream = concurrency.stream
+
+        def _crashing(urls_):
+            for n, item in enumerate(stream(urls_)):
+                if n == stop_after:
+                    raise KeyboardInterrupt
+                yield item
+
+        concurrency.stream = _crashing
+
+    result = osrm_matching.match_df(
+        df, group_col='trip_id', host=host, port=port, concurrency=concurrency,
+        checkpoint=checkpoint
+    )
+    return result, len(urls)
+
+
+def test_checkpoint_resume(osrm_server, tmp_path):
+    """
+    A crashed run resumes where it stopped, and a finished run sends nothing.
+    """
+    df = _trips([5, 150, 8, 12])
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.sqlite'))
+    expected = osrm_matching.match_df(
+        df, group_col='trip_id', host=osrm_server[0], port=osrm_server[1]
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        _match(osrm_server, df, checkpoint, stop_after=2)
+    assert len(checkpoint) == 1
+
+    result, sent = _match(osrm_server, df, checkpoint)
+    assert sent == 4
+    assert list(result) == [0, 1, 2, 3]
+    for key in expected:
+        assert result[key]['matchings'][0]['distance'] == pytest.approx(
+            expected[key]['matchings'][0]['distance']
+        )
+
+    result, sent = _match(osrm_server, df, Checkpoint(str(tmp_path / 'checkpoint.sqlite')))
+    assert sent == 0 and len(result) == 4
+
+
+def test_checkpoint_changed_groups(osrm_server, tmp_path):
+    """
+    Only new and changed groups are matched again.
+    """
+    df = _trips([5, 8, 12])
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.sqlite'))
+    _match(osrm_server, df, checkpoint)
+
+    grown = _trips([5, 8, 12, 6])
+    grown.loc[grown.trip_id == 1, 'lat'] += 0.001
+    result, sent = _match(osrm_server, grown, checkpoint)
+
+    assert sent == 2
+    assert len(checkpoint) == 4
+    assert list(result) == [0, 1, 2, 3]
+
+
+def test_async_checkpoint(osrm_server, tmp_path):
+    """
+    async_match_df stores and reuses groups like match_df.
+    """
+    host, port = osrm_server
+    df = _trips([5, 150, 8])
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.sqlite'))
+    _match(osrm_server, df.loc[df.trip_id == 0], checkpoint)
+
+    urls = []
+    concurrency = ConcurrentRequests(progress=False, metrics=Metrics(callbacks=[urls.append]))
+    result = asyncio.run(osrm_matching.async_match_df(
+        df, group_col='trip_id', host=host, port=port, concurrency=concurrency,
+        checkpoint=checkpoint
+    ))
+
+    assert len(urls) == 3
+    assert list(result) == [0, 1, 2] and len(checkpoint) == 3
+    assert len(result[1]['tracepoints']) == 150
@@ -0,0 +1,150 @@
+"""
+This is a test module for the ConcurrentRequests class.
+"""
+
+from pyrouting.utils import ConcurrentRequests, Metrics
+from pyrouting.utils.scheduling import lpt_order, url_cost
+from pyrouting.utils.limiter import AIMDLimiter
+
+
+def _urls(host, port, n):
+    for i in range(n):
+        yield f'{host}:{port}/route/v1/driving/-122.3,47.{i:04d};-122.31,47.6'
+
+
+def test_get_preserves_order(osrm_server):
+    """
+    Responses from get must line up with the input urls.
+    """
+    host, port = osrm_server
+    results = ConcurrentRequests(parallel_requests=8).get(list(_urls(host, port, 50)))
+
+    lats = [r['waypoints'][0]['location'][1] for r in results]
+    assert lats == [float(f'47.{i:04d}') for i in range(50)]
+
+
+def test_stream_pulls_urls_lazily(osrm_server):
+    """
+    The stream only pulls new urls as results are taken, keeping a fixed window in flight.
+    """
+    host, port = osrm_server
+    pulled = []
+
+    def _tracked():
+        for url in _urls(host, port, 100):
+            pulled.append(url)
+            yield url
+
+    concurrency = ConcurrentRequests(parallel_requests=5)
+    stream = concurrency.stream(_tracked())
+
+    first, _ = next(stream)
+    assert len(pulled) == 6
+
+    indexes = [first] + [i for i, _ in stream]
+    assert sorted(indexes) == list(range(100))
+    assert len(pulled) == 100
+
+
+def test_retries_and_failures(osrm_server):
+    """
+    Transient errors are retried and requests that keep failing are reported by index.
+    """
+    host, port = osrm_server
+    urls = [
+        f'{host}:{port}/flaky/a?fails=2',
+        f'{host}:{port}/flaky/b?fails=9',
+        f'{host}:{port}/flaky/c?fails=0'
+    ]
+    concurrency = ConcurrentRequests(adaptive=True, retries=3, backoff=0.01)
+    results = concurrency.get(urls)
+
+    assert results[0] == {'code': 'Ok', 'key': 'a'}
+    assert results[1]['code'] == 'RequestError'
+    assert results[2]['code'] == 'Ok'
+    assert concurrency.failures == {1: 'HTTP 503'}
+
+
+def test_aimd_limiter():
+    """
+    The limit grows with fast successes and halves on failure or latency build-up.
+    """
+    limiter = AIMDLimiter(initial=10, max_limit=20)
+    for _ in range(100):
+        limiter.on_success(0.01)
+    assert limiter.window > 10
+
+    grown = limiter.limit
+    limiter.on_failure()
+    assert limiter.limit == grown / 2
+
+    # A second failure within the same window does not cut the limit again
+    limiter.on_failure()
+    assert limiter.limit == grown / 2
+
+    for _ in range(100):
+        limiter.on_success(1.0)
+    assert limiter.window == 1
+
+
+def test_raw_responses(osrm_server):
+    """
+    With parse off, responses are returned as raw JSON bytes.
+    """
+    host, port = osrm_server
+    results = ConcurrentRequests(parse=False).get(list(_urls(host, port, 3)))
+
+    assert all(isinstance(r, bytes) and b'"Ok"' in r for r in results)
+
+    # A single stream can skip parsing without changing the object
+    concurrency = ConcurrentRequests(progress=False)
+    raw = [r for _, r in concurrency.stream(list(_urls(host, port, 3)), parse=False)]
+    assert all(isinstance(r, bytes) for r in raw)
+    assert concurrency.parse
+
+
+def test_compressed_responses(osrm_server):
+    """
+    Compressed responses are asked for by default and decoded transparently.
+    """
+    host, port = osrm_server
+    url = f'{host}:{port}/headers'
+
+    compressed = ConcurrentRequests(progress=False).get([url])[0]
+    plain = ConcurrentRequests(progress=False, compress=False).get([url])[0]
+
+    assert 'gzip' in compressed['headers']['Accept-Encoding']
+    assert plain['headers']['Accept-Encoding'] == 'identity'
+
+
+def test_lpt_schedule(osrm_server):
+    """
+    With an LPT schedule the largest requests go first within each priority class, and
+    results still come back in input order.
+    """
+    host, port = osrm_server
+    base = f'{host}:{port}/route/v1/driving/'
+    urls = [base + ';'.join(['-122.3,47.6'] * n) for n in [2, 5, 3, 7, 4]]
+
+    assert url_cost(urls[1]) == 5
+    assert url_cost(f'{host}:{port}/table/v1/driving/1,2;3,4;5,6?sources=0&destinations=1;2') == 2
+    assert lpt_order([2, 5, 3, 5], priorities=[0, 1, 0, 0]).tolist() == [3, 2, 0, 1]
+
+    sent = []
+    concurrency = ConcurrentRequests(
+        parallel_requests=1, schedule='lpt', metrics=Metrics(callbacks=[sent.append])
+    )
+    results = concurrency.get(urls)
+    assert [len(e['url'].split(';')) for e in sent] == [7, 5, 4, 3, 2]
+    assert [len(r['waypoints']) for r in results] == [2, 5, 3, 7, 4]
+
+    sent.clear()
+    concurrency.priority = lambda url: 0 if url.count(';') < 3 else 1
+    concurrency.get(urls)
+    assert [len(e['url'].split(';')) for e in sent] == [3, 2, 7, 5, 4]
+
+    # Only a few windows of URLs are pulled ahead of the ones sent
+    pulled = []
+    stream = (pulled.append(n) or base + ';'.join(['-122.3,47.6'] * n) for n in range(2, 1000))
+    order = ConcurrentRequests(parallel_requests=2, schedule='lpt')._dispatch_order(stream)
+    assert next(order)[0] == 7 and len(pulled) == 8
@@ -0,0 +1,117 @@
+"""
+This is a test module for distributed match_df and table_matrix.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+from pyrouting.osrm import OSRMQueries, osrm_distributed
+from pyrouting.utils import Checkpoint, ConcurrentRequests, Metrics, PairCache, ResponseCache
+from .test_matching import _trips
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(2) as pool:
+        yield pool
+
+
+def test_partition_groups():
+    """
+    Partitions hold whole groups and every row once.
+    """
+    df = _trips([5, 40, 7, 3, 20, 9]).sample(frac=1, random_state=0)
+    parts = osrm_distributed.partition_groups(df, 'trip_id', 3)
+
+    assert 1 < len(parts) <= 3
+    assert sum(len(p) for p in parts) == len(df)
+    seen = [set(p.trip_id) for p in parts]
+    assert all(a.isdisjoint(b) for i, a in enumerate(seen) for b in seen[i + 1:])
+
+
+def test_match_df_distributed(osrm_server, executor):
+    """
+    Matching across workers gives the same result as one process.
+    """
+    host, port = osrm_server
+    df = _trips([5, 150, 8, 12, 30])
+    router = OSRMQueries(host=host, port=port)
+
+    expected = router.match_df(df, group_col='trip_id')
+    result = router.match_df_distributed(
+        df, group_col='trip_id', executor=executor, partitions=3
+    )
+    assert list(result) == list(expected)
+    for key in expected:
+        assert result[key]['matchings'][0]['distance'] == pytest.approx(
+            expected[key]['matchings'][0]['distance']
+        )
+
+    unpacked = router.match_df_distributed(
+        df, group_col='trip_id', executor=executor, unpack=['distance']
+    )
+    assert isinstance(unpacked, pd.DataFrame)
+    np.testing.assert_allclose(
+        unpacked.distance, [expected[k]['matchings'][0]['distance'] for k in expected]
+    )
+
+
+def test_table_matrix_distributed(osrm_server, executor):
+    """
+    Row blocks from the workers land in the right place.
+    """
+    host, port = osrm_server
+    rng = np.random.default_rng(3)
+    sources = np.column_stack([rng.uniform(47.6, 47.7, 23), rng.uniform(-122.4, -122.3, 23)])
+    router = OSRMQueries(host=host, port=port)
+
+    expected = router.table_matrix(sources, tile=4)
+    result = router.table_matrix_distributed(sources, tile=4, executor=executor, partitions=3)
+    np.testing.assert_array_equal(result['durations'], expected['durations'])
+
+    # Without an executor a pool of n_workers is started, with four blocks per worker
+    result = router.table_matrix_distributed(sources, tile=2, n_workers=2)
+    np.testing.assert_array_equal(result['durations'], expected['durations'])
+
+
+def test_distributed_cache_and_metrics(osrm_server, executor, tmp_path):
+    """
+    The workers reopen the router's cache, and metrics that cannot follow them are warned of.
+    """
+    host, port = osrm_server
+    path = str(tmp_path / 'cache.sqlite')
+    df = _trips([5, 8, 12])
+    router = OSRMQueries(host=host, port=port, cache=ResponseCache(path), metrics=Metrics())
+
+    assert osrm_distributed._workers(executor, 2) == 2
+    assert osrm_distributed._workers(executor, None) >= 1
+    with pytest.warns(UserWarning, match='metrics'):
+        router.match_df_distributed(df, group_col='trip_id', executor=executor)
+
+    cache = ResponseCache(path)
+    cached = router.match_df(df, group_col='trip_id', concurrency=ConcurrentRequests(
+        cache=cache, progress=False
+    ))
+    assert len(cached) == 3 and cache.hits == 3 and cache.misses == 0
+
+
+def test_distributed_checkpoint(osrm_server, executor, tmp_path):
+    """
+    The workers reopen the checkpoint from its path, and a pair cache is refused.
+    """
+    host, port = osrm_server
+    path = str(tmp_path / 'checkpoint.sqlite')
+    df = _trips([5, 8, 12])
+    router = OSRMQueries(host=host, port=port)
+
+    result = router.match_df_distributed(
+        df, group_col='trip_id', executor=executor, checkpoint=Checkpoint(path)
+    )
+    assert list(result) == [0, 1, 2] and len(Checkpoint(path)) == 3
+
+    with pytest.raises(AssertionError, match='pair_cache'):
+        router.table_matrix_distributed(
+            df[['lat', 'lon']].to_numpy(), executor=executor,
+            pair_cache=PairCache(str(tmp_path / 'pairs'))
+        )
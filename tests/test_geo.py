@@ -0,0 +1,71 @@
+"""
+This is a test module for the GeoDataFrame output of match_df.
+"""
+
+import numpy as np
+import pytest
+import shapely
+from pyrouting.osrm import OSRMQueries, osrm_geo
+from .test_matching import _trips
+
+
+def test_linestrings():
+    """
+    Rows become LineStrings in (lon, lat) order, and rows under two points are None.
+    """
+    coords = np.arange(20, dtype=float).reshape(10, 2)
+    lines = osrm_geo.linestrings(coords, np.array([0, 3, 3, 4, 10]))
+
+    assert lines[1] is None and lines[2] is None
+    assert shapely.get_coordinates(lines[0]).tolist() == [[1, 0], [3, 2], [5, 4]]
+    assert shapely.get_num_points(lines[3]) == 6
+
+
+def test_match_geodataframe(osrm_server):
+    """
+    match_df returns routes and tracepoints as GeoDataFrames with the CRS set.
+    """
+    host, port = osrm_server
+    router = OSRMQueries(host=host, port=port)
+    df = _trips([6, 9])
+
+    routes, points = router.match_df(
+        df, group_col='trip_id', output='geodataframe', tracepoints=True, overview='full'
+    )
+
+    assert routes.crs == 'EPSG:4326'
+    assert routes.index.tolist() == [0, 1]
+    assert routes.columns.tolist() == ['confidence', 'distance', 'duration', 'geometry']
+    assert routes.geom_type.tolist() == ['LineString', 'LineString']
+    first = shapely.get_coordinates(routes.geometry.iloc[0])
+    assert np.allclose(first, df.loc[df.trip_id == 0, ['lon', 'lat']].to_numpy(), atol=1e-5)
+
+    assert points.crs == 'EPSG:4326'
+    assert len(points) == len(df)
+    assert points.point.tolist() == [*range(6), *range(9)]
+    assert np.allclose(points.geometry.x, df.lon) and np.allclose(points.geometry.y, df.lat)
+
+    # Unpacking only scalar attributes still asks for the route geometry
+    routes = router.match_df(df, group_col='trip_id', output='geodataframe', unpack=['confidence'])
+    assert routes.columns.tolist() == ['confidence', 'geometry']
+    assert routes.geom_type.tolist() == ['LineString', 'LineString']
+
+    # The process pool only unpacks columns, so it cannot be combined with an output
+    with pytest.raises(AssertionError, match='workers'):
+        router.match_df(df, group_col='trip_id', output='geodataframe', workers=2)
+
+
+def test_unmatched_tracepoints():
+    """
+    Tracepoints the server could not match have no geometry and -1 indices.
+    """
+    tracepoint = {'location': [-122.3, 47.6], 'matchings_index': 0, 'waypoint_index': 1,
+                  'distance': 2.5}
+    points = osrm_geo.tracepoints_gdf({'a': {'tracepoints': [None, tracepoint]}, 'b': {}})
+
+    assert points.group.tolist() == ['a', 'a']
+    assert points.geometry.iloc[0] is None
+    assert points.matchings_index.tolist() == [-1, 0]
+    assert points.waypoint_index.tolist() == [-1, 1]
+    assert np.isnan(points['distance'].iloc[0]) and points['distance'].iloc[1] == 2.5
+    assert (points.geometry.iloc[1].x, points.geometry.iloc[1].y) == (-122.3, 47.6)
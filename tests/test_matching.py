@@ -0,0 +1,264 @@
+"""
+This is a test module for the bulk match_df function.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from pyrouting.osrm import (
+    OSRMQueries, osrm_matching, osrm_simplify, osrm_stitch, osrm_unpack
+)
+from pyrouting.utils import Metrics
+
+
+def _trips(sizes):
+    rng = np.random.default_rng(1)
+    frames = []
+    for trip_id, n in enumerate(sizes):
+        frames.append(pd.DataFrame({
+            'trip_id': trip_id,
+            'lat': 47.6 + np.cumsum(rng.uniform(0, 1e-3, n)),
+            'lon': -122.3 + np.cumsum(rng.uniform(0, 1e-3, n)),
+            'timestamp': 1682472715 + np.arange(n) * 5
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_window_bounds():
+    """
+    Windows cover every point and overlap by the requested amount.
+    """
+    bounds = osrm_stitch.window_bounds(250, 100, 10)
+    assert bounds == [(0, 100), (90, 190), (180, 250)]
+    assert osrm_stitch.window_bounds(50, 100, 10) == [(0, 50)]
+
+    # Windows that share no point cannot be stitched
+    with pytest.raises(AssertionError, match='overlap'):
+        osrm_matching.match_df(_trips([5]), group_col='trip_id', host='h', port=1, overlap=0)
+
+
+@pytest.mark.parametrize("geometries", ['polyline6', 'geojson'])
+def test_windowed_match(osrm_server, geometries):
+    """
+    Long traces are windowed and stitched back into the same result as one request.
+    """
+    host, port = osrm_server
+    df = _trips([40, 250, 7])
+    kwargs = {'host': host, 'port': port, 'group_col': 'trip_id', 'geometries': geometries}
+
+    whole = osrm_matching.match_df(df, max_points=1000, **kwargs)
+    windowed = osrm_matching.match_df(df, max_points=100, overlap=10, **kwargs)
+
+    assert list(windowed.keys()) == [0, 1, 2]
+    for key in whole:
+        expected, result = whole[key]['matchings'][0], windowed[key]['matchings'][0]
+        assert len(windowed[key]['matchings']) == 1
+        assert len(result['legs']) == len(expected['legs'])
+        assert result['distance'] == pytest.approx(expected['distance'])
+        assert result['confidence'] == pytest.approx(0.9)
+        assert result['geometry'] == expected['geometry']
+
+        waypoints = [tp['waypoint_index'] for tp in windowed[key]['tracepoints']]
+        assert waypoints == list(range(len(waypoints)))
+
+
+def test_url_length_windowing(osrm_server):
+    """
+    Groups whose URL is too long are windowed even under the point limit.
+    """
+    host, port = osrm_server
+    df = _trips([90])
+    windows = []
+    urls = list(osrm_matching.build_window_urls(
+        df, 'trip_id', windows, max_url_length=2000, host=host, port=port
+    ))
+
+    assert len(urls) > 1
+    assert all(len(url) <= 2000 for url in urls)
+    assert windows[0][:2] == (0, 0) and windows[-1][2] == 90
+
+    # A limit that the first estimate overshoots still gives windows larger than the overlap
+    windows = []
+    urls = list(osrm_matching.build_window_urls(
+        df, 'trip_id', windows, max_url_length=700, overlap=10, host=host, port=port
+    ))
+    assert all(len(url) <= 700 for url in urls)
+    assert all(stop - start > 10 for _, start, stop in windows)
+    assert windows[-1][2] == 90
+
+
+def test_decoded_geometry(osrm_server):
+    """
+    Geometry comes out as arrays of the matched coordinates when decode_geometry is set.
+    """
+    host, port = osrm_server
+    df = _trips([5, 8])
+    router = OSRMQueries(host=host, port=port)
+    result = router.match_df(
+        df, group_col='trip_id', geometries='polyline6',
+        unpack=['geometry', 'distance'], decode_geometry=True
+    )
+
+    for trip_id in [0, 1]:
+        expected = df.loc[df.trip_id == trip_id, ['lat', 'lon']].to_numpy()
+        np.testing.assert_allclose(result.loc[trip_id, 'geometry'], expected, atol=1e-6)
+
+
+def test_unpack_matches():
+    """
+    Columns take the best matching of each response, parsing raw bytes as needed.
+    """
+    responses = [
+        {'code': 'Ok', 'matchings': [{'confidence': 0.2, 'distance': 5.0, 'geometry': 'a'}]},
+        json.dumps({'code': 'Ok', 'matchings': [
+            {'confidence': 0.1, 'distance': 1.0, 'geometry': 'b'},
+            {'confidence': 0.7, 'distance': 2.0, 'geometry': 'c'}
+        ]}).encode(),
+        {'code': 'NoMatch'}
+    ]
+    columns = osrm_unpack.unpack_matches(iter(responses), ['distance', 'geometry'], count=3)
+
+    np.testing.assert_array_equal(columns['distance'], [5.0, 2.0, np.nan])
+    assert columns['geometry'].tolist() == ['a', 'c', None]
+
+
+def test_request_options(osrm_server):
+    """
+    Only the unpacked attributes are asked for, and explicit options still win.
+    """
+    assert osrm_unpack.request_options(['confidence', 'distance']) == {
+        'steps': False, 'annotations': 'false', 'overview': 'false'
+    }
+    assert osrm_unpack.request_options(['geometry', 'legs']) == {'steps': False}
+    assert osrm_unpack.request_options(['distance', 'something_else']) == {}
+
+    host, port = osrm_server
+    urls = []
+    router = OSRMQueries(host=host, port=port, metrics=Metrics(callbacks=[urls.append]))
+    df = _trips([5, 8])
+
+    result = router.match_df(df, group_col='trip_id', unpack=['confidence', 'distance'])
+    assert result.loc[[0, 1], 'distance'].notna().all()
+    assert all('annotations=false' in u['url'] and 'overview=false' in u['url'] for u in urls)
+
+    urls.clear()
+    router.match_df(df, group_col='trip_id', unpack=['distance'], annotations='true')
+    assert all('annotations=true' in u['url'] for u in urls)
+
+
+def test_simplify():
+    """
+    Thinning and Douglas-Peucker keep the group ends and the corners of the trace.
+    """
+    # A straight line east, then a corner and a line north, in two groups
+    lat = np.r_[np.zeros(11), np.linspace(1e-4, 1e-3, 11)] + 47.6
+    lon = np.r_[np.linspace(0, 1e-3, 11), np.full(11, 1e-3)] - 122.3
+    starts = np.array([0, 11])
+    xy = osrm_simplify.local_xy(lat, lon)
+
+    keep = osrm_simplify.douglas_peucker(xy, starts, 1.0)
+    assert np.flatnonzero(keep).tolist() == [0, 10, 11, 21]
+
+    # An L shape in one group keeps its corner
+    corner = osrm_simplify.douglas_peucker(xy, np.array([0]), 1.0)
+    assert np.flatnonzero(corner).tolist() == [0, 10, 21]
+
+    # Points are 7.5 m apart, so every other one survives a 10 m minimum
+    keep = osrm_simplify.thin(xy, None, starts, min_distance=10)
+    assert np.flatnonzero(keep[:11]).tolist() == [0, 2, 4, 6, 8, 10]
+
+    timestamps = np.arange(22) * 2
+    keep = osrm_simplify.thin(xy, timestamps, starts, min_interval=5)
+    assert np.flatnonzero(keep[:11]).tolist() == [0, 3, 6, 9, 10]
+
+    keep = np.r_[True, [False] * 9, True]
+    filled = osrm_simplify.interpolate_dropped(np.array([0.0, 10.0]), keep)
+    assert np.allclose(filled, np.arange(11))
+
+
+def test_match_simplified(osrm_server):
+    """
+    Simplified traces send fewer points and record which rows the tracepoints belong to.
+    """
+    host, port = osrm_server
+    router = OSRMQueries(host=host, port=port)
+    df = _trips([30, 40])
+    df.loc[df.trip_id == 0, 'lat'] = 47.6
+    df.loc[df.trip_id == 0, 'lon'] = np.linspace(-122.3, -122.29, 30)
+
+    matches = router.match_df(df, group_col='trip_id', tolerance=1.0, min_interval=10)
+
+    assert matches[0]['tracepoint_rows'] == [0, 29]
+    rows = matches[1]['tracepoint_rows']
+    assert rows[0] == 0 and rows[-1] == 39 and len(rows) < 40
+    assert len(matches[1]['tracepoints']) == len(rows)
+
+    sent = df[df.trip_id == 1].iloc[rows]
+    located = np.array([tp['location'] for tp in matches[1]['tracepoints']])
+    assert np.allclose(located, sent[['lon', 'lat']].to_numpy(), atol=1e-5)
+
+
+def test_unpack_tracepoints():
+    """
+    Tracepoints of every matching land on their input rows, in the input order.
+    """
+    df = pd.DataFrame({
+        'trip': ['b', 'a', 'b', 'a', 'a'],
+        'lat': [2.0, 1.0, 2.1, 1.1, 1.2],
+        'lon': [20.0, 10.0, 20.1, 10.1, 10.2],
+        'timestamp': [5, 3, 6, 1, 2]
+    }, index=[10, 11, 12, 13, 14])
+
+    def tracepoint(lat, lon, matching):
+        return {'location': [lon, lat], 'matchings_index': matching, 'waypoint_index': 0,
+                'alternatives_count': 1, 'distance': 0.5, 'name': 'road'}
+
+    # Trip a is sent by timestamp as rows 13, 14, 11 and split into two matchings
+    response = {
+        'a': {'tracepoints': [tracepoint(1.1, 10.1, 0), None, tracepoint(1.0, 10.0, 1)]},
+        'b': {'tracepoints': [tracepoint(2.0, 20.0, 0), tracepoint(2.1, 20.1, 0)]}
+    }
+    out = osrm_unpack.unpack_tracepoints(df, response, group_col='trip')
+
+    assert out.index.tolist() == df.index.tolist()
+    assert out.matchings_index.tolist() == [0, 1, 0, 0, -1]
+    assert np.allclose(out.matched_lat, [2.0, 1.0, 2.1, 1.1, np.nan], equal_nan=True)
+    assert out.name.tolist() == ['road', 'road', 'road', 'road', None]
+
+
+def test_match_tracepoints(osrm_server):
+    """
+    Every input row gets its snapped point, and rows dropped by simplification are
+    interpolated between the kept rows.
+    """
+    host, port = osrm_server
+    router = OSRMQueries(host=host, port=port)
+    df = _trips([30, 20]).sample(frac=1, random_state=0)
+
+    out = router.match_df(df, group_col='trip_id', output='tracepoints')
+    assert out.index.equals(df.index)
+    assert np.allclose(out.matched_lat, df.lat, atol=1e-5)
+    assert np.allclose(out.matched_lon, df.lon, atol=1e-5)
+    assert (out.matchings_index == 0).all() and 'interpolated' not in out
+
+    out = router.match_df(df, group_col='trip_id', output='tracepoints', min_interval=20)
+    assert out.interpolated.sum() > 0 and out.matched_lat.notna().all()
+    assert not out.interpolated[df.timestamp == df.timestamp.min()].any()
+    assert np.allclose(out.matched_lat, df.lat, atol=1e-3)
+
+
+def test_match_lpt_schedule(osrm_server):
+    """
+    Sending the longest traces first gives the same matches.
+    """
+    host, port = osrm_server
+    df = _trips([5, 150, 20, 60])
+
+    expected = OSRMQueries(host=host, port=port).match_df(df, group_col='trip_id')
+    scheduled = OSRMQueries(host=host, port=port, schedule='lpt').match_df(df, group_col='trip_id')
+
+    assert list(scheduled.keys()) == list(expected.keys())
+    for key in expected:
+        assert scheduled[key]['matchings'][0]['distance'] == \
+            pytest.approx(expected[key]['matchings'][0]['distance'])
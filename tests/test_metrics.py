@@ -0,0 +1,70 @@
+"""
+This is a test module for the request metrics registry.
+"""
+
+import asyncio
+from pyrouting.osrm import AsyncOSRMQueries, OSRMQueries
+from pyrouting.utils import ConcurrentRequests, Metrics
+
+coords = [(47.66117, -122.31197), (47.66135, -122.31247), (47.66128, -122.31293)]
+
+
+def test_metrics_sync_and_bulk(osrm_server):
+    """
+    Single and bulk requests are counted per service.
+    """
+    host, port = osrm_server
+    events = []
+    metrics = Metrics(callbacks=[events.append])
+    router = OSRMQueries(host=host, port=port, metrics=metrics)
+
+    router.route(coords[:2])
+    router.table(coords)
+    router.table_matrix(coords, tile=2)
+
+    assert metrics.counter('osrm_requests_total', service='route', status=200) == 1
+    assert metrics.counter('osrm_requests_total', service='table', status=200) == 5
+    assert metrics.histogram('osrm_request_duration_seconds', service='table')['count'] == 5
+    assert metrics.counter('osrm_response_bytes_total', service='route') > 0
+    assert len(events) == 6 and events[0]['service'] == 'route'
+
+    text = metrics.to_prometheus()
+    assert '# TYPE osrm_requests_total counter' in text
+    assert 'osrm_requests_total{service="table",status="200"} 5' in text
+    assert 'osrm_request_duration_seconds_bucket{service="route",le="+Inf"} 1' in text
+
+    otlp = metrics.to_otlp()['resourceMetrics'][0]['scopeMetrics'][0]['metrics']
+    names = {m['name'] for m in otlp}
+    assert {'osrm_requests_total', 'osrm_parse_duration_seconds'} <= names
+
+
+def test_metrics_retries(osrm_server):
+    """
+    Retried and failed attempts are counted separately.
+    """
+    host, port = osrm_server
+    metrics = Metrics()
+    concurrency = ConcurrentRequests(retries=1, backoff=0.01, progress=False, metrics=metrics)
+    urls = [f'{host}:{port}/flaky/metrics-a?fails=1', f'{host}:{port}/flaky/metrics-b?fails=5']
+    concurrency.get(urls)
+
+    assert metrics.counter('osrm_requests_total', service='other', status=503) == 3
+    assert metrics.counter('osrm_retries_total', service='other') == 2
+    assert metrics.counter('osrm_failures_total', service='other') == 1
+
+
+def test_metrics_queue_wait(osrm_server):
+    """
+    Requests that wait for a pooled connection record the wait.
+    """
+    host, port = osrm_server
+    metrics = Metrics()
+
+    async def _run():
+        async with AsyncOSRMQueries(host, port, limit_per_host=1, metrics=metrics) as router:
+            await asyncio.gather(*[router.route(coords[:2]) for _ in range(4)])
+
+    asyncio.run(_run())
+
+    assert metrics.counter('osrm_requests_total', service='route', status=200) == 4
+    assert metrics.histogram('osrm_queue_wait_seconds', service='route')['count'] >= 1
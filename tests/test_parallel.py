@@ -0,0 +1,58 @@
+"""
+This is a test module for process-pool parsing and unpacking.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+from pyrouting.osrm import OSRMQueries, osrm_parallel
+from pyrouting.utils import Checkpoint, ConcurrentRequests
+from .test_matching import _trips
+
+
+def test_parallel_unpack_matches_serial(osrm_server):
+    """
+    The process pool gives the same columns as unpacking in this process.
+    """
+    host, port = osrm_server
+    df = _trips([40, 250, 7, 120, 3])
+    router = OSRMQueries(host=host, port=port)
+    unpack = ['confidence', 'distance', 'duration', 'geometry']
+    kwargs = {'group_col': 'trip_id', 'unpack': unpack, 'max_points': 100}
+
+    serial = router.match_df(df, **kwargs)
+    with ProcessPoolExecutor(2) as executor:
+        parallel = router.match_df(df, workers=executor, **kwargs)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_parallel_decoded_geometry(osrm_server):
+    """
+    Decoded geometry comes back as arrays in group order, in small batches too.
+    """
+    host, port = osrm_server
+    df = _trips([5, 230, 8])
+    matches = osrm_parallel.match_unpack(
+        df, ['geometry', 'distance'], group_col='trip_id', workers=1, batch_size=1,
+        decode_geometry=True, geometries='polyline6', host=host, port=port,
+        concurrency=ConcurrentRequests(parallel_requests=2, progress=False)
+    )
+
+    assert list(matches.index) == [0, 1, 2]
+    for trip_id in [0, 1, 2]:
+        expected = df.loc[df.trip_id == trip_id, ['lat', 'lon']].to_numpy()
+        np.testing.assert_allclose(matches.loc[trip_id, 'geometry'], expected, atol=1e-6)
+
+
+def test_parallel_rejects_checkpoint(tmp_path):
+    """
+    A checkpoint is refused rather than silently ignored when the workers unpack.
+    """
+    router = OSRMQueries(host='localhost', port=5000)
+    with pytest.raises(AssertionError, match='checkpoint'):
+        router.match_df(
+            _trips([5]), group_col='trip_id', unpack=['distance'], workers=1,
+            checkpoint=Checkpoint(str(tmp_path / 'checkpoint.sqlite'))
+        )
@@ -0,0 +1,34 @@
+"""
+This is a test module for the polyline encoding and decoding functions.
+"""
+
+import numpy as np
+import pytest
+from pyrouting.osrm import osrm_polyline
+
+
+def test_polyline_roundtrip():
+    """
+    Decoding matches the reference example from the polyline algorithm documentation.
+    """
+    coords = osrm_polyline.decode('_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+    np.testing.assert_allclose(coords, [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]])
+    assert osrm_polyline.encode(coords) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_decode_many(precision):
+    """
+    Decoding a column at once gives the same coordinates as decoding each string.
+    """
+    rng = np.random.default_rng(2)
+    lines = [rng.uniform(-90, 90, (n, 2)) for n in [3, 0, 12, 1]]
+    encoded = [osrm_polyline.encode(line, precision) for line in lines] + [None]
+    coords, offsets = osrm_polyline.decode_many(encoded, precision)
+
+    assert offsets.tolist() == [0, 3, 3, 15, 16, 16]
+    for i, line in enumerate(lines):
+        np.testing.assert_allclose(coords[offsets[i]:offsets[i + 1]], line, atol=10**-precision)
+        np.testing.assert_array_equal(
+            coords[offsets[i]:offsets[i + 1]], osrm_polyline.decode(encoded[i], precision)
+        )
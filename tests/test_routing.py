@@ -0,0 +1,75 @@
+"""
+This is a test module for the bulk route_df function.
+"""
+
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import OSRMQueries
+from pyrouting.osrm.osrm_routing import build_route_urls
+from pyrouting.utils import ConcurrentRequests
+
+
+def _pairs(n):
+    rng = np.random.default_rng(4)
+    return pd.DataFrame(
+        {
+            'o_lat': rng.uniform(47.6, 47.7, n), 'o_lon': rng.uniform(-122.4, -122.3, n),
+            'd_lat': rng.uniform(47.6, 47.7, n), 'd_lon': rng.uniform(-122.4, -122.3, n)
+        },
+        index=pd.Index(rng.permutation(n) * 10, name='pair_id')
+    )
+
+
+def test_route_df(osrm_server):
+    """
+    Results line up with the input index.
+    """
+    host, port = osrm_server
+    df = _pairs(60)
+    router = OSRMQueries(host=host, port=port)
+    result = router.route_df(df)
+
+    expected = (
+        np.abs(df.o_lat - df.d_lat) + np.abs(df.o_lon - df.d_lon)
+    ) * 100000
+    assert result.index.equals(df.index)
+    assert list(result.columns) == ['distance', 'duration']
+    np.testing.assert_allclose(result.distance, expected)
+
+
+def test_route_df_geometry(osrm_server):
+    """
+    Geometry is only requested when asked for.
+    """
+    host, port = osrm_server
+    df = _pairs(3)
+    urls = list(build_route_urls(
+        df, ['o_lat', 'o_lon'], ['d_lat', 'd_lon'], host=host, port=port, overview='false'
+    ))
+    assert all('overview=false' in url for url in urls)
+
+    result = OSRMQueries(host=host, port=port).route_df(df, geometry=True)
+    assert result.geometry.map(lambda g: isinstance(g, str)).all()
+
+
+def test_route_df_dedupe(osrm_server):
+    """
+    Repeated pairs are routed once and every row still gets its result.
+    """
+    host, port = osrm_server
+    df = _pairs(5).iloc[[0, 1, 0, 2, 1, 0]]
+    concurrency = ConcurrentRequests(progress=False)
+    sent = []
+    stream = concurrency.stream
+    concurrency.stream = lambda urls: stream(sent.append(u) or u for u in urls)
+    result = OSRMQueries(host=host, port=port).route_df(
+        df, dedupe=True, precision=5, concurrency=concurrency
+    )
+
+    expected = (
+        np.abs(df.o_lat.round(5) - df.d_lat.round(5))
+        + np.abs(df.o_lon.round(5) - df.d_lon.round(5))
+    ) * 100000
+    assert result.index.equals(df.index)
+    np.testing.assert_allclose(result.distance, expected)
+    assert len(sent) == 3
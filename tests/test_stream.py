@@ -0,0 +1,66 @@
+"""
+This is a test module for the out-of-core match_file function.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from pyrouting.osrm import OSRMQueries, osrm_matching, osrm_stream
+
+pytest.importorskip('pyarrow')
+
+
+def _trips(n_trips):
+    rng = np.random.default_rng(3)
+    sizes = rng.integers(3, 30, n_trips)
+    trip_id = np.repeat(np.arange(n_trips), sizes)
+    return pd.DataFrame({
+        'trip_id': trip_id,
+        'lat': 47.6 + rng.uniform(0, 0.1, len(trip_id)),
+        'lon': -122.3 + rng.uniform(0, 0.1, len(trip_id)),
+        'collect_time': 1682472715 + np.arange(len(trip_id))
+    })
+
+
+def test_whole_groups():
+    """
+    Groups are never split across chunks and no rows are lost.
+    """
+    df = _trips(20)
+    chunks = [df.iloc[i:i + 37] for i in range(0, len(df), 37)]
+    regrouped = list(osrm_stream.whole_groups(iter(chunks), 'trip_id'))
+
+    assert sum(len(c) for c in regrouped) == len(df)
+    seen = [set(c.trip_id) for c in regrouped]
+    assert all(a.isdisjoint(b) for i, a in enumerate(seen) for b in seen[i + 1:])
+
+
+@pytest.mark.parametrize("suffix", ['.parquet', '.csv'])
+@pytest.mark.parametrize("workers", [None, 2])
+def test_match_file(osrm_server, tmp_path, suffix, workers):
+    """
+    Streaming a file gives the same matches as matching it in memory.
+    """
+    host, port = osrm_server
+    df = _trips(30)
+    path = str(tmp_path / f'trips{suffix}')
+    if suffix == '.csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+    router = OSRMQueries(host=host, port=port)
+    written = router.match_file(
+        path, str(tmp_path / 'out'), 'trip_id', chunksize=50,
+        renames={'collect_time': 'timestamp'}, workers=workers
+    )
+    result = pd.read_parquet(tmp_path / 'out').sort_values('trip_id')
+
+    expected = osrm_matching.match_df(
+        df, {'collect_time': 'timestamp'}, 'trip_id', host=host, port=port
+    )
+    assert written == 30
+    assert result.trip_id.tolist() == list(range(30))
+    np.testing.assert_allclose(
+        result.distance, [expected[i]['matchings'][0]['distance'] for i in range(30)]
+    )
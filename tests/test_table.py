@@ -0,0 +1,132 @@
+"""
+This is a test module for the tiled table_matrix function.
+"""
+
+import numpy as np
+import pytest
+from pyrouting.osrm import OSRMQueries
+from pyrouting.utils import Metrics, PairCache
+
+rng = np.random.default_rng(0)
+sources = np.column_stack([rng.uniform(47.6, 47.7, 23), rng.uniform(-122.4, -122.3, 23)])
+destinations = np.column_stack([rng.uniform(47.6, 47.7, 17), rng.uniform(-122.4, -122.3, 17)])
+
+
+def _expected(src, dst):
+    return np.abs(src[:, None, :] - dst[None, :, :]).sum(axis=-1) * 100000
+
+
+@pytest.mark.parametrize("tile", [5, (4, 7), 100])
+def test_table_matrix_tiles(osrm_server, tile):
+    """
+    Every tile must land in the right block of the assembled matrix.
+    """
+    host, port = osrm_server
+    router = OSRMQueries(host=host, port=port)
+    out = router.table_matrix(
+        sources, destinations, tile=tile, annotations='duration,distance'
+    )
+
+    assert out['distances'].dtype == np.float32
+    assert out['distances'].shape == (23, 17)
+    np.testing.assert_allclose(out['distances'], _expected(sources, destinations), atol=0.1)
+    np.testing.assert_allclose(out['durations'], out['distances'] / 10, atol=0.1)
+
+
+def test_table_matrix_memmap(osrm_server, tmp_path):
+    """
+    The memory-mapped output is written to disk as a loadable .npy file.
+    """
+    host, port = osrm_server
+    router = OSRMQueries(host=host, port=port)
+    out = router.table_matrix(sources, tile=6, memmap_dir=str(tmp_path))
+
+    assert isinstance(out['durations'], np.memmap)
+    saved = np.load(tmp_path / 'durations.npy')
+    np.testing.assert_allclose(saved, _expected(sources, sources) / 10, atol=0.1)
+
+
+def test_table_matrix_dedupe(osrm_server):
+    """
+    Duplicate sources and destinations are requested once and copied back.
+    """
+    host, port = osrm_server
+    router = OSRMQueries(host=host, port=port)
+    src = sources[[0, 1, 0, 2, 1, 1]]
+    dst = destinations[[3, 3, 4]]
+    out = router.table_matrix(src, dst, tile=2, dedupe=True, precision=4)
+
+    assert out['durations'].shape == (6, 3)
+    expected = _expected(np.round(src, 4), np.round(dst, 4)) / 10
+    np.testing.assert_allclose(out['durations'], expected, atol=0.1)
+
+
+def test_table_sparse(osrm_server):
+    """
+    The sparse table holds exactly the pairs within the cutoff, with far tiles skipped.
+    """
+    host, port = osrm_server
+    urls = []
+    router = OSRMQueries(host=host, port=port, metrics=Metrics(callbacks=[urls.append]))
+    points = np.column_stack([rng.uniform(47.0, 47.5, 300), rng.uniform(-122.5, -122.0, 300)])
+
+    out = router.table_sparse(points, cutoff=300, max_speed=20, tile=20)
+
+    dense = _expected(points, points) / 10
+    expected = np.argwhere(dense <= 300 - 0.1)
+    found = set(zip(out.row.tolist(), out.col.tolist()))
+    assert out.shape == (300, 300)
+    assert set(map(tuple, expected.tolist())) <= found
+    assert np.all(out.data <= 300)
+    np.testing.assert_allclose(out.toarray()[out.row, out.col], dense[out.row, out.col], atol=0.1)
+    assert 0 < len(urls) < 15 * 15
+
+
+def test_table_matrix_pair_cache(osrm_server, tmp_path):
+    """
+    A rerun with an added source and a moved destination only requests the new pairs.
+    """
+    host, port = osrm_server
+    urls = []
+    router = OSRMQueries(host=host, port=port, metrics=Metrics(callbacks=[urls.append]))
+    pairs = PairCache(str(tmp_path))
+
+    router.table_matrix(sources, destinations, tile=5, pair_cache=pairs,
+                        annotations='duration,distance')
+    first = len(urls)
+
+    # Reopen the store, add a source and move a destination
+    pairs = PairCache(str(tmp_path))
+    more = np.vstack([sources, [[47.65, -122.35]]])
+    moved = destinations.copy()
+    moved[3] += 0.01
+
+    urls.clear()
+    out = router.table_matrix(more, moved, tile=5, pair_cache=pairs,
+                              annotations='duration,distance')
+
+    np.testing.assert_allclose(out['distances'], _expected(more, moved), atol=0.1)
+    np.testing.assert_allclose(out['durations'], out['distances'] / 10, atol=0.1)
+    # One tile row for the new source, and one tile column for the moved destination
+    assert len(urls) == 4 + 5 < first
+
+    urls.clear()
+    router.table_matrix(more, moved, tile=5, pair_cache=pairs, annotations='duration,distance')
+    assert len(urls) == 0
+
+
+def test_table_matrix_pair_cache_dedupe(osrm_server, tmp_path):
+    """
+    With dedupe, only the distinct coordinates are looked up and stored.
+    """
+    host, port = osrm_server
+    urls = []
+    router = OSRMQueries(host=host, port=port, metrics=Metrics(callbacks=[urls.append]))
+    doubled = np.vstack([sources, sources])
+
+    out = router.table_matrix(doubled, destinations, tile=5, pair_cache=PairCache(str(tmp_path)),
+                              dedupe=True, annotations='distance')
+
+    np.testing.assert_allclose(out['distances'], _expected(doubled, destinations), atol=0.1)
+    # The tiles of the 23 distinct sources, not of all 46
+    assert len(urls) == 5 * 4
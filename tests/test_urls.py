@@ -0,0 +1,42 @@
+"""
+This is a test module for URL construction and timestamp parsing.
+"""
+
+import numpy as np
+import pandas as pd
+from pyrouting.osrm import osrm_urls
+from pyrouting.utils import timestamps_to_int
+
+SECONDS = np.array([1682472715, 1682472742])
+
+
+def test_timestamps_to_int():
+    """
+    Strings, datetime64, and tz-aware columns all parse to the same seconds.
+    """
+    strings = ['2023-04-26 01:31:55+0000', '2023-04-26 03:32:22+0200']
+    naive = np.array(['2023-04-26T01:31:55', '2023-04-26T01:32:22'], dtype='datetime64[us]')
+    aware = pd.Series(pd.to_datetime(naive).tz_localize('UTC').tz_convert('US/Pacific'))
+
+    np.testing.assert_array_equal(timestamps_to_int(strings, '%Y-%m-%d %H:%M:%S%z'), SECONDS)
+    np.testing.assert_array_equal(timestamps_to_int(naive, None), SECONDS)
+    np.testing.assert_array_equal(timestamps_to_int(aware, None), SECONDS)
+    np.testing.assert_array_equal(timestamps_to_int(SECONDS.astype(np.int32), None), SECONDS)
+
+
+def test_match_url_encoding():
+    """
+    Array inputs encode the same as lists of Python values.
+    """
+    coords = np.array([[47.66117, -122.31197], [47.66135, -122.31247]])
+    from_arrays = osrm_urls.match_url(
+        coords, host='http://h', port=1, timestamps=SECONDS, radiuses=np.array([5, 10])
+    )
+    from_lists = osrm_urls.match_url(
+        [tuple(c) for c in coords.tolist()], host='http://h', port=1,
+        timestamps=['2023-04-26 01:31:55+0000', '2023-04-26 01:32:22+0000'], radiuses=[5, 10]
+    )
+
+    assert from_arrays == from_lists
+    assert '-122.31197,47.66117;-122.31247,47.66135?' in from_arrays
+    assert 'timestamps=1682472715;1682472742' in from_arrays